@@ -0,0 +1,251 @@
+"""
+Benchmarks for segmentation, post-processing, chunked separation and the
+end-to-end pipeline.
+
+    python -m benchmarks.run                                  # 1k, 10k, 100k words
+    python -m benchmarks.run --sizes 1000000 --only segment
+    python -m benchmarks.run --output new.json --compare old.json
+
+Every case reports min and median wall time over --repeat runs; inputs are
+rebuilt outside the timed region. Results are written as JSON so runs can
+be compared. The end-to-end case needs ffmpeg and the installed
+requirements, but loads no models: separation, Whisper and Gemini are the
+stand-ins from benchmarks.stubs.
+"""
+import os
+import gc
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+
+from benchmarks.synth import synth_words
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+DEFAULT_DURATIONS = [60, 600]
+
+def measure(name, size, fn, setup=None, repeat=3, unit="words"):
+    """Times fn(setup()) repeat times; size is the number of input units."""
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        gc.collect()
+        start = time.perf_counter()
+        fn(arg)
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    result = {
+        "name": name, "size": size, "unit": unit, "repeat": repeat,
+        "min_s": best, "median_s": statistics.median(times),
+        "per_unit_us": best / max(1, size) * 1e6,
+    }
+    print(f"{name:<46} {size:>9} {unit:<7} {best * 1000:>11.2f} ms {result['per_unit_us']:>11.3f} us/{unit}", file=sys.stderr)
+    return result
+
+def _copy_events(events):
+    # Passes replace event fields and merged word lists but never touch word dicts.
+    return [dict(ev) for ev in events]
+
+def bench_segmentation(words, repeat):
+    from src import asr
+
+    n = len(words)
+    yield measure("asr.segment_smart_stream", n, lambda _: asr.segment_smart_stream(words, 400, 84, 7.0), repeat=repeat)
+    yield measure("asr.iter_segment_smart_stream", n,
+                  lambda _: sum(1 for _ in asr.iter_segment_smart_stream(iter(words), 400, 84, 7.0)), repeat=repeat)
+    # Split search on the buffer sizes the segmenter actually sees.
+    buffers = [words[i:i + 24] for i in range(0, n - 24, 24)] or [words]
+    yield measure("asr.find_best_split_point_in_buffer", n,
+                  lambda _: [asr.find_best_split_point_in_buffer(b) for b in buffers], repeat=repeat)
+
+def bench_postprocess(words, repeat):
+    from src import asr, postprocess as pp, columnar
+
+    n = len(words)
+    events = asr.segment_smart_stream(words, 400, 84, 7.0)
+    fresh = lambda: _copy_events(events)
+    passes = [
+        ("postprocess.apply_global_start_offset", lambda evs: pp.apply_global_start_offset(evs, offset_ms=50)),
+        ("postprocess.apply_extension_then_merge", lambda evs: pp.apply_extension_then_merge(evs, target_cps=22.0)),
+        ("postprocess.apply_hybrid_linger_with_report", lambda evs: pp.apply_hybrid_linger_with_report(evs, linger_ms=600)),
+        ("postprocess.shape_block_text", lambda evs: [pp.shape_block_text(ev["words"], max_chars=42) for ev in evs]),
+        ("postprocess.enforce_timing_constraints", lambda evs: pp.enforce_timing_constraints(evs, min_dur=1.0, min_gap=0.084)),
+        ("postprocess.run_post_processing", pp.run_post_processing),
+        ("postprocess.iter_post_processing", lambda evs: list(pp.iter_post_processing(iter(evs)))),
+    ]
+    for name, fn in passes:
+        yield measure(name, n, fn, setup=fresh, repeat=repeat)
+
+    yield measure("columnar.EventTable.from_events", n, columnar.EventTable.from_events, setup=fresh, repeat=repeat)
+    yield measure("columnar.run_post_processing", n, columnar.run_post_processing,
+                  setup=lambda: columnar.EventTable.from_events(fresh()), repeat=repeat)
+
+    done = pp.run_post_processing(fresh())
+    with tempfile.TemporaryDirectory() as tmp:
+        out = os.path.join(tmp, "bench.srt")
+        yield measure("postprocess.write_srt", n, lambda _: pp.write_srt(done, out), repeat=repeat)
+
+def write_synthetic_media(path, duration_s, sample_rate=48000, seed=0):
+    """Stereo 16-bit WAV of noise with speech-band tone bursts, written in blocks."""
+    import numpy as np
+    import soundfile as sf
+
+    rng = np.random.default_rng(seed)
+    block = sample_rate * 10
+    with sf.SoundFile(path, "w", samplerate=sample_rate, channels=2, subtype="PCM_16") as f:
+        for start in range(0, int(duration_s * sample_rate), block):
+            n = min(block, int(duration_s * sample_rate) - start)
+            t = (start + np.arange(n)) / sample_rate
+            voice = 0.2 * np.sin(2 * np.pi * 220 * t) * (np.sin(2 * np.pi * 0.3 * t) > 0)
+            mono = voice + 0.02 * rng.standard_normal(n)
+            f.write(np.stack([mono, mono], axis=1).astype(np.float32))
+
+def bench_pipeline(durations, repeat, gemini_latency_s=0.0):
+    import src.gemini
+    from main import run_pipeline
+    from benchmarks.stubs import StubSeparator, StubWhisper, StubGeminiClient
+
+    # Stage code creates its own Gemini client; hand it the stand-in instead.
+    src.gemini._make_client = lambda: StubGeminiClient(latency_s=gemini_latency_s)
+    args = argparse.Namespace(no_gemini=False, no_cache=True, no_memo=True, keep_temp=False)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration in durations:
+            media = os.path.join(tmp, f"synthetic_{duration}s.wav")
+            write_synthetic_media(media, duration)
+            out = os.path.join(tmp, f"synthetic_{duration}s.srt")
+
+            def run(work_dir):
+                run_pipeline(media, out, work_dir, args, separator=StubSeparator(work_dir), model=StubWhisper())
+
+            yield measure("pipeline.run_pipeline (stub models)", duration, run,
+                          setup=lambda: tempfile.mkdtemp(dir=tmp), repeat=repeat, unit="audio_s")
+
+def seam_error_db(reference, stitched, seams, width):
+    """Worst |stitched - reference| within width samples of a seam, in dB relative to the reference RMS."""
+    import numpy as np
+
+    rms = float(np.sqrt(np.mean(reference ** 2))) or 1.0
+    worst = 0.0
+    for start, end in seams:
+        lo, hi = max(0, start - width), min(len(reference), end + width)
+        worst = max(worst, float(np.max(np.abs(stitched[lo:hi] - reference[lo:hi]))))
+    return 20 * np.log10(max(worst, 1e-12) / rms)
+
+def bench_separation(durations, repeat, chunk_s=30.0, overlap_s=2.0):
+    """
+    Chunked separation with a stub model: time and peak traced memory per
+    input length (should stay flat), and how far the stitched stem departs
+    from a whole-track run around the seams, with and without crossfades.
+    """
+    import tracemalloc
+    import soundfile as sf
+    from src.separator import separate_vocals, separate_vocals_chunked, chunk_windows
+    from benchmarks.stubs import StubSeparator
+
+    taps = 64
+    with tempfile.TemporaryDirectory() as tmp:
+        for duration in durations:
+            media = os.path.join(tmp, f"synthetic_{duration}s.wav")
+            write_synthetic_media(media, duration)
+
+            peaks = []
+            def run(work_dir):
+                tracemalloc.start()
+                separate_vocals_chunked(media, work_dir, separator=StubSeparator(work_dir, taps=taps),
+                                        chunk_s=chunk_s, overlap_s=overlap_s)
+                peaks.append(tracemalloc.get_traced_memory()[1] / 1e6)
+                tracemalloc.stop()
+
+            result = measure(f"separator.separate_vocals_chunked ({chunk_s:.0f}s windows)", duration, run,
+                             setup=lambda: tempfile.mkdtemp(dir=tmp), repeat=repeat, unit="audio_s")
+            result["peak_traced_mb"] = max(peaks)
+            print(f"{'':<46} peak traced memory {result['peak_traced_mb']:.1f} MB", file=sys.stderr)
+
+            # Seam check on the shortest input only; a whole-track reference has to fit in RAM.
+            if duration == min(durations):
+                ref_dir = tempfile.mkdtemp(dir=tmp)
+                reference, sr = sf.read(separate_vocals(media, ref_dir, separator=StubSeparator(ref_dir, taps=taps)),
+                                        dtype="float32", always_2d=True)
+                for overlap in (overlap_s, 0.0):
+                    work_dir = tempfile.mkdtemp(dir=tmp)
+                    stitched, _ = sf.read(separate_vocals_chunked(media, work_dir, separator=StubSeparator(work_dir, taps=taps),
+                                                                  chunk_s=chunk_s, overlap_s=overlap),
+                                          dtype="float32", always_2d=True)
+                    windows = chunk_windows(len(reference), int(chunk_s * sr), int(overlap * sr))
+                    seams = [(start, prev_end) for (_, prev_end), (start, _) in zip(windows, windows[1:])]
+                    result[f"seam_error_db_overlap_{overlap:g}s"] = seam_error_db(reference, stitched, seams, 2 * taps)
+                    print(f"{'':<46} seam error, {overlap:g}s crossfade: "
+                          f"{result[f'seam_error_db_overlap_{overlap:g}s']:.1f} dB re RMS", file=sys.stderr)
+            yield result
+
+def _meta():
+    import numpy as np
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(), "numpy": np.__version__,
+        "platform": platform.platform(), "cpus": os.cpu_count(),
+    }
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    print(f"\n{'case':<46} {'size':>9} {'old ms':>10} {'new ms':>10} {'ratio':>7}", file=sys.stderr)
+    for r in results:
+        old = baseline.get((r["name"], r["size"]))
+        if old:
+            print(f"{r['name']:<46} {r['size']:>9} {old['min_s'] * 1000:>10.2f} {r['min_s'] * 1000:>10.2f} "
+                  f"{r['min_s'] / old['min_s']:>6.2f}x", file=sys.stderr)
+
+def main():
+    import logging
+
+    parser = argparse.ArgumentParser(description="LiveSubs benchmarks")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Word counts (default: 1k 10k 100k)")
+    parser.add_argument("--durations", type=int, nargs="+", default=DEFAULT_DURATIONS,
+                        help="Seconds of synthetic audio for the end-to-end case (default: 60 600)")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; min and median are reported (default: 3)")
+    parser.add_argument("--only", nargs="+", choices=["segment", "postprocess", "separate", "pipeline"],
+                        help="Run only these groups")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="Simulated seconds per Gemini request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", "-o", help="Write results as JSON to this path (default: stdout)")
+    parser.add_argument("--compare", help="Baseline JSON from an earlier run to compare against")
+    args = parser.parse_args()
+
+    # Keep pipeline logging out of the timings' output.
+    logging.basicConfig(level=logging.WARNING)
+    groups = args.only or ["segment", "postprocess", "separate", "pipeline"]
+    results = []
+    for size in args.sizes:
+        words = synth_words(size, seed=args.seed)
+        if "segment" in groups:
+            results.extend(bench_segmentation(words, args.repeat))
+        if "postprocess" in groups:
+            results.extend(bench_postprocess(words, args.repeat))
+    if "separate" in groups:
+        results.extend(bench_separation(args.durations, args.repeat))
+    if "pipeline" in groups:
+        results.extend(bench_pipeline(args.durations, args.repeat, args.gemini_latency))
+
+    report = {"meta": _meta(), "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Stand-in backends for end-to-end benchmarks on a CPU-only box.
+
+They have the interfaces the pipeline uses (Separator.separate,
+WhisperModel.transcribe, genai.Client files/models) but do no model work,
+so run_pipeline measures orchestration, ffmpeg and file I/O.
+"""
+import os
+import time
+import shutil
+from types import SimpleNamespace
+
+from benchmarks.synth import words_for_duration
+
+class StubSeparator:
+    """
+    Copies the input as the "vocal" stem. With taps > 0 it runs a moving
+    average instead, starting from silence on every call, so each window
+    gets an edge transient the way a real model's context does.
+    """
+
+    def __init__(self, output_dir, taps=0):
+        self.output_dir = output_dir
+        self.taps = taps
+        self.model_instance = None
+
+    def separate(self, input_path):
+        name = f"{os.path.splitext(os.path.basename(input_path))[0]}_(Vocals)_stub.wav"
+        out = os.path.join(self.output_dir, name)
+        if not self.taps:
+            shutil.copyfile(input_path, out)
+            return [name]
+        import numpy as np
+        import soundfile as sf
+        audio, sr = sf.read(input_path, dtype="float32", always_2d=True)
+        c = np.cumsum(np.concatenate([np.zeros((self.taps, audio.shape[1]), np.float32), audio]), axis=0)
+        sf.write(out, (c[self.taps:] - c[:-self.taps]) / self.taps, sr, subtype="FLOAT")
+        return [name]
+
+class StubWhisper:
+    """Returns synthetic segments covering the audio's duration."""
+
+    def __init__(self, seed=0):
+        self.seed = seed
+
+    def transcribe(self, audio, **options):
+        if isinstance(audio, str):
+            import soundfile as sf
+            duration = sf.info(audio).duration
+        else:
+            duration = len(audio) / 16000
+        words = words_for_duration(duration, seed=self.seed)
+
+        segments = []
+        seg = []
+        for w in words:
+            seg.append(SimpleNamespace(word=f" {w['word']}", start=w["start"], end=w["end"], probability=w["probability"]))
+            if w["word"][-1] in ".?!…,":
+                segments.append(self._segment(seg, w))
+                seg = []
+        if seg:
+            segments.append(self._segment(seg, words[-1]))
+        return iter(segments), SimpleNamespace(duration=duration, language="en")
+
+    @staticmethod
+    def _segment(words, last):
+        return SimpleNamespace(
+            words=words, start=words[0].start, end=words[-1].end,
+            text="".join(w.word for w in words),
+            avg_logprob=last["avg_logprob"], no_speech_prob=last["no_speech_prob"],
+        )
+
+class StubGeminiClient:
+    """Accepts uploads and echoes every 'ID|Text' line back, after latency_s."""
+
+    def __init__(self, latency_s=0.0):
+        self.latency_s = latency_s
+        self.uploaded_bytes = 0
+        self.files = SimpleNamespace(upload=self._upload, get=self._get, delete=lambda name=None: None)
+        self.models = SimpleNamespace(generate_content=self._generate)
+
+    def _upload(self, file=None, config=None):
+        data = file.getvalue() if hasattr(file, "getvalue") else open(file, "rb").read()
+        self.uploaded_bytes += len(data)
+        return SimpleNamespace(name=f"files/stub-{self.uploaded_bytes}", expiration_time=None)
+
+    def _get(self, name=None):
+        return SimpleNamespace(name=name, expiration_time=None)
+
+    def _generate(self, model=None, config=None, contents=None):
+        time.sleep(self.latency_s)
+        lines = [line for line in contents[-1].split("\n") if "|" in line]
+        return SimpleNamespace(text="\n".join(lines))
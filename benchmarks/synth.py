@@ -0,0 +1,60 @@
+"""
+Synthetic Whisper-like word streams for benchmarks.
+
+Words come in sentences of a few phrases: short gaps inside a phrase,
+longer pauses between phrases and sentences, and occasional scene breaks.
+Punctuation, word lengths and confidence scores follow rough dialogue
+statistics so segmentation and line balancing see realistic input.
+"""
+import random
+
+VOCAB = (
+    "I you the a to it that what is and of we this in me my no don't know "
+    "just not be do have was he your so all are can here on for with right "
+    "yeah go there like him get out okay come now she they about but want "
+    "think let's sorry really tell please something nothing everyone brother "
+    "captain princess tomorrow remember understand impossible extraordinary "
+    "Satou Kyouma Okabe Tokyo"
+).split()
+
+def synth_words(n, seed=0, start_s=0.0):
+    """Returns n word dicts ({"word", "start", "end", "probability", ...}) in timeline order."""
+    rng = random.Random(seed)
+    words = []
+    t = start_s
+    phrase_left = rng.randint(2, 8)
+    sentence_left = rng.randint(1, 3)
+    avg_logprob = -0.2
+    no_speech = 0.02
+    for _ in range(n):
+        text = rng.choice(VOCAB)
+        dur = 0.08 + 0.045 * len(text) * rng.uniform(0.7, 1.4)
+        phrase_left -= 1
+        if phrase_left == 0:
+            sentence_left -= 1
+            if sentence_left == 0:
+                text += rng.choice(".......?!…")
+                sentence_left = rng.randint(1, 3)
+            elif rng.random() < 0.6:
+                text += ","
+            phrase_left = rng.randint(2, 8)
+            gap = rng.choice((0.25, 0.4, 0.6, 0.9, 1.5)) * rng.uniform(0.8, 1.2)
+            if rng.random() < 0.03:
+                gap += rng.uniform(3.0, 20.0)           # scene change / music
+            # New Whisper segment after a pause.
+            avg_logprob = rng.gauss(-0.25, 0.2)
+            no_speech = rng.random() * 0.1
+        else:
+            gap = rng.uniform(0.0, 0.15)
+        words.append({
+            "word": text, "start": round(t, 3), "end": round(t + dur, 3),
+            "probability": min(1.0, max(0.05, rng.gauss(0.88, 0.12))),
+            "avg_logprob": avg_logprob, "no_speech_prob": no_speech,
+        })
+        t += dur + gap
+    return words
+
+def words_for_duration(duration_s, seed=0):
+    """Words covering about duration_s seconds (roughly 2.3 words per second)."""
+    words = synth_words(max(1, int(duration_s * 2.5)), seed=seed)
+    return [w for w in words if w["end"] <= duration_s]
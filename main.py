@@ -20,20 +20,266 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 
 def main():
     parser = argparse.ArgumentParser(description="LiveSubs/Srtforge Remake")
-    parser.add_argument("input_file", help="Path to input media file")
-    parser.add_argument("--output", "-o", help="Output SRT path (default: input_file.srt)")
+    parser.add_argument("inputs", nargs="*", metavar="input_file",
+                        help="Input media file(s) or directories (several inputs run in batch mode)")
+    parser.add_argument("--output", "-o", help="Output SRT path (default: input_file.srt); output directory in batch mode")
     parser.add_argument("--no-gemini", action="store_true", help="Skip Gemini correction")
     parser.add_argument("--keep-temp", action="store_true", help="Keep temporary files (in ./temp)")
+    parser.add_argument("--streams", default="best", metavar="SPEC",
+                        help="Audio streams to subtitle: 'best' (default), 'all', or stream indices/languages like '1,3' or 'eng,jpn'; "
+                             "each gets its own SRT (name.<index>.<lang>.srt)")
+    parser.add_argument("--in-memory", action="store_true",
+                        help="Stream audio between stages as in-memory arrays instead of intermediate WAV files")
+
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="Load the models when a stage first needs them instead of in the background during extraction")
+    parser.add_argument("--speech-gate", action="store_true",
+                        help="Only run vocal separation on detected speech regions (timeline is preserved)")
+    parser.add_argument("--gate-margin-db", type=float, default=6.0,
+                        help="Speech gate: dB above the noise floor a frame needs to count as speech (default: 6)")
+
+    parser.add_argument("--fingerprint", action="store_true",
+                        help="Reuse subtitles for openings/endings already seen in other episodes of the series (index in the cache dir)")
+
+    from src.audio import parse_time
+    window = parser.add_argument_group("time range")
+    window.add_argument("--start", type=parse_time, metavar="TIME",
+                        help="Only subtitle from TIME on (seconds or [HH:]MM:SS[.ms]); only that window is decoded")
+    window.add_argument("--end", type=parse_time, metavar="TIME", help="Only subtitle up to TIME (default: the end)")
+    window.add_argument("--splice", action="store_true",
+                        help="Replace only the --start/--end range in the existing output SRT and keep the rest of it")
+
+    separation = parser.add_argument_group("chunked separation")
+    separation.add_argument("--separate-chunk-s", type=float, default=0,
+                            help="Separate in windows of this many seconds, streaming the stem to disk (default: 0 = whole track)")
+    separation.add_argument("--separate-overlap-s", type=float, default=2.0, help="Crossfade between windows in seconds (default: 2)")
+    separation.add_argument("--separate-procs", type=int, default=1,
+                            help="Separate windows in this many processes, each loads its own model (default: 1)")
+
+    gemini = parser.add_argument_group("Gemini correction")
+    gemini.add_argument("--gemini-chunk-lines", type=int, default=0,
+                        help="Correct in windows of this many lines, each with its own audio slice (default: 0 = one request)")
+    gemini.add_argument("--gemini-workers", type=int, default=4, help="Concurrent chunk requests with --gemini-chunk-lines (default: 4)")
+    gemini.add_argument("--gemini-codec", choices=["opus", "flac", "wav"], default="opus",
+                        help="Audio format uploaded to Gemini (default: opus)")
+    gemini.add_argument("--gemini-min-confidence", type=float, metavar="P",
+                        help="Only send lines with a word below this Whisper probability (plus context), e.g. 0.6")
+    gemini.add_argument("--series", help="Series name for the correction memo and glossary (default: from the file name)")
+    gemini.add_argument("--no-memo", action="store_true", help="Do not reuse or record past corrections")
+
+    asr = parser.add_argument_group("ASR")
+    asr.add_argument("--asr-procs", type=int, default=1,
+                     help="Split the 16kHz audio at silences and transcribe chunks in this many processes (default: 1)")
+    asr.add_argument("--asr-threads", type=int, default=0, help="cpu_threads per Whisper model (default: 0 = auto)")
+    asr.add_argument("--asr-chunk-s", type=float, default=120.0, help="Target chunk length in seconds for --asr-procs (default: 120)")
+
+    asr.add_argument("--cascade", action="store_true",
+                     help="Transcribe with a small draft model first and re-decode only doubtful segments with the large model")
+    asr.add_argument("--draft-model", default="small", help="Draft model for --cascade (default: small)")
+    asr.add_argument("--cascade-logprob", type=float, default=-0.6,
+                     help="Re-decode draft segments with avg_logprob below this (default: -0.6)")
+    asr.add_argument("--align", metavar="REF",
+                     help="Align a known script (SRT with rough timing, or plain text) to the vocals instead of transcribing; skips Gemini")
+
+    live = parser.add_argument_group("live mode")
+    live.add_argument("--live", action="store_true",
+                      help="Treat the input as a live source (pipe, '-' for stdin, URL or growing file) and emit subtitles incrementally")
+    live.add_argument("--live-format", choices=["srt", "vtt"], default="srt", help="Live output format (default: srt)")
+    live.add_argument("--target-latency", type=float, default=6.0,
+                      help="Target seconds from audio arriving to its subtitle being written (default: 6)")
+
+    cache = parser.add_argument_group("stage cache")
+    cache.add_argument("--no-cache", action="store_true", help="Disable the stage cache")
+    cache.add_argument("--refresh", action="store_true", help="Recompute every stage and overwrite cached results")
+    cache.add_argument("--cache-dir", help="Cache directory (default: $LIVESUBS_CACHE_DIR or ~/.cache/livesubs)")
+    cache.add_argument("--cache-size-gb", type=float, default=20.0,
+                       help="Evict least recently used entries beyond this size (default: 20); the cache is on by default and stores full WAV stems")
+
+    batch = parser.add_argument_group("batch mode")
+    batch.add_argument("--extract-workers", type=int, default=1, help="Concurrent ffmpeg extractions (default: 1)")
+    batch.add_argument("--separate-workers", type=int, default=1, help="Separator instances, each holds a model (default: 1)")
+    batch.add_argument("--asr-workers", type=int, default=1, help="Whisper instances, each holds a model (default: 1)")
+    batch.add_argument("--finish-workers", type=int, default=1, help="Concurrent post-process/Gemini/write jobs (default: 1)")
+    batch.add_argument("--separate-queue", type=int, default=1, help="Extracted files allowed to wait for separation (default: 1)")
+    batch.add_argument("--asr-queue", type=int, default=1, help="Separated files allowed to wait for ASR (default: 1)")
+    batch.add_argument("--finish-queue", type=int, default=2, help="Transcribed files allowed to wait for finishing (default: 2)")
+
+    shard = parser.add_argument_group("shard mode")
+    shard.add_argument("--shard-s", type=float, default=0,
+                       help="Split one long input into shards of about this many seconds, processed by shard workers (default: 0 = off)")
+    shard.add_argument("--shard-overlap-s", type=float, default=30.0, help="Audio each shard decodes past its boundaries (default: 30)")
+    shard.add_argument("--shard-queue", metavar="DIR",
+                       help="Shared queue directory that workers on other nodes poll (default: a private one in the work dir)")
+    shard.add_argument("--shard-workers", type=int, default=0,
+                       help="Local worker processes to start (default: 1 without --shard-queue, else 0)")
+    shard.add_argument("--shard-worker", metavar="DIR", help="Run as a shard worker on the queue directory DIR")
+
+    tuning = parser.add_argument_group("tuning")
+    tuning.add_argument("--autotune", action="store_true",
+                        help="Time calibration passes on the first minute of the input and save the fastest settings as this host's profile")
+    tuning.add_argument("--no-profile", action="store_true", help="Ignore this host's autotune profile")
+    tuning.add_argument("--asr-compute-type", choices=["int8", "int8_float32", "int8_float16", "float16", "float32"],
+                        help="CTranslate2 compute type for Whisper (default: int8 on CPU, float16 on GPU)")
+    tuning.add_argument("--beam-size", type=int, help="Whisper beam size (default: 5)")
+    tuning.add_argument("--separator-batch-size", type=int, help="BS-Roformer batch size (default: 1)")
+    tuning.add_argument("--separator-segment-size", type=int, help="BS-Roformer segment size (default: the model's own)")
+
+    sweep = parser.add_argument_group("parameter sweep")
+    sweep.add_argument("--save-words", action="store_true",
+                       help="Also save the raw word list next to the SRT (name.words.npz) for --sweep")
+    sweep.add_argument("--sweep", metavar="WORDS",
+                       help="Rank segmentation/post-processing settings on a saved word list instead of processing media")
+    sweep.add_argument("--grid", action="append", metavar="NAME=VALUES",
+                       help="Values to sweep, e.g. pause_ms=300,400,500 or target_cps=17:22:0.5; repeat per parameter "
+                            "(pause_ms, max_chars, max_dur_s, target_cps, linger_ms, min_gap)")
+    sweep.add_argument("--sweep-procs", type=int, default=0, help="Sweep processes (default: 0 = one per CPU)")
+    sweep.add_argument("--sweep-top", type=int, default=20, help="Rows of the ranked table to print (default: 20)")
+    sweep.add_argument("--sweep-csv", metavar="PATH", help="Write every result as CSV")
+    sweep.add_argument("--style-cps", type=float, default=20.0, help="Style guide: max characters per second (default: 20)")
+    sweep.add_argument("--style-line-chars", type=int, default=42, help="Style guide: max characters per line (default: 42)")
+    sweep.add_argument("--style-min-gap", type=float, default=0.084, help="Style guide: min gap between events in seconds (default: 0.084)")
+
+    metrics = parser.add_argument_group("metrics")
+    metrics.add_argument("--metrics-json", metavar="PATH", help="Write per-stage wall/CPU time, peak RSS, I/O and RTF as JSON")
+    metrics.add_argument("--metrics-prom", metavar="PATH", help="Write the same metrics as a Prometheus textfile (node_exporter collector)")
+
+    server = parser.add_argument_group("daemon")
+    server.add_argument("--serve", action="store_true", help="Run as a resident daemon that keeps the models loaded and accepts jobs over HTTP")
+    server.add_argument("--host", default="127.0.0.1", help="Daemon address (default: 127.0.0.1)")
+    server.add_argument("--port", type=int, default=8765, help="Daemon port (default: 8765)")
+    server.add_argument("--server-workers", type=int, default=2, help="Jobs the daemon runs at once (default: 2)")
+    server.add_argument("--memory-budget-gb", type=float, default=8.0,
+                        help="Daemon: start jobs only while their estimated memory fits in this budget (default: 8)")
+    server.add_argument("--server", metavar="URL", default=os.environ.get("LIVESUBS_SERVER"),
+                        help="Submit to a running daemon, e.g. http://127.0.0.1:8765 (default: $LIVESUBS_SERVER)")
+    server.add_argument("--priority", type=int, default=0, help="Job priority on the daemon; higher runs first (default: 0)")
+    server.add_argument("--server-token", default=os.environ.get("LIVESUBS_TOKEN"),
+                        help="Shared secret the daemon requires and the client sends; needed to serve on a "
+                             "non-loopback --host (default: $LIVESUBS_TOKEN)")
 
     args = parser.parse_args()
+    if not args.inputs and not args.serve and not args.shard_worker and not args.sweep:
+        parser.error("at least one input_file is required")
 
-    input_path = os.path.abspath(args.input_file)
-    if not os.path.exists(input_path):
-        logging.error(f"Input file not found: {input_path}")
-        sys.exit(1)
+    if args.sweep:
+        import time
+        from src.sweep import run_sweep, format_table, write_csv
+        started = time.perf_counter()
+        try:
+            results = run_sweep(args.sweep, args.grid, procs=args.sweep_procs, limits={
+                "cps": args.style_cps, "line_chars": args.style_line_chars, "min_gap": args.style_min_gap})
+        except ValueError as e:
+            parser.error(str(e))
+        logging.info(f"Sweep finished in {time.perf_counter() - started:.1f}s.")
+        print(format_table(results, top=args.sweep_top))
+        if args.sweep_csv:
+            write_csv(results, args.sweep_csv)
+        return
+
+    if args.autotune:
+        from src.autotune import run_autotune
+        run_autotune(os.path.abspath(args.inputs[0]))
+        return
+    if not args.no_profile:
+        from src.autotune import load_profile
+        profile = load_profile()
+        if profile:
+            # Profile values become defaults, so options given explicitly still win.
+            parser.set_defaults(**profile)
+            args = parser.parse_args()
+
+    if args.serve:
+        from src.server import serve, is_loopback
+        if not args.server_token and not is_loopback(args.host):
+            parser.error(f"--host {args.host} is not loopback; set --server-token (or $LIVESUBS_TOKEN)")
+        serve(args)
+        return
+
+    if args.shard_worker:
+        from src.shard import run_shard_worker
+        run_shard_worker(args.shard_worker, args)
+        return
+
+    if args.live:
+        from src.live import run_live
+        # Output goes to stdout unless a file is given; logs stay on stderr.
+        try:
+            run_live(args.inputs[0], args.output or "-", args)
+        except KeyboardInterrupt:
+            pass
+        return
 
-    base_name = os.path.splitext(os.path.basename(input_path))[0]
-    output_srt = args.output or os.path.join(os.path.dirname(input_path), f"{base_name}.srt")
+    ranged = args.start is not None or args.end is not None
+    if args.splice and not ranged:
+        parser.error("--splice needs --start and/or --end")
+    if ranged and args.start is not None and args.end is not None and args.end <= args.start:
+        parser.error("--end must be after --start")
+    if ranged and args.shard_s:
+        parser.error("--start/--end already limits the work to one window; drop --shard-s")
+    if args.align:
+        if not os.path.isfile(args.align):
+            parser.error(f"--align: reference not found: {args.align}")
+        args.align = os.path.abspath(args.align)
+        if args.shard_s:
+            parser.error("--align runs one model pass per 30s window already; drop --shard-s")
+        if ranged and not args.align.lower().endswith(".srt"):
+            parser.error("--start/--end with --align needs a timed (SRT) reference")
+
+    is_batch = len(args.inputs) > 1 or os.path.isdir(args.inputs[0])
+    if is_batch and args.shard_s:
+        parser.error("--shard-s splits a single input; batch mode already spreads files over workers")
+    if is_batch and args.align:
+        parser.error("--align takes the script of a single input")
+    if is_batch:
+        from src.batch import collect_inputs
+        try:
+            inputs = collect_inputs(args.inputs)
+        except FileNotFoundError as e:
+            logging.error(str(e))
+            sys.exit(1)
+        if not inputs:
+            logging.error("No media files found in the given inputs.")
+            sys.exit(1)
+        if args.output:
+            os.makedirs(args.output, exist_ok=True)
+    else:
+        input_path = os.path.abspath(args.inputs[0])
+        if not os.path.exists(input_path):
+            logging.error(f"Input file not found: {input_path}")
+            sys.exit(1)
+
+        base_name = os.path.splitext(os.path.basename(input_path))[0]
+        output_srt = args.output or os.path.join(os.path.dirname(input_path), f"{base_name}.srt")
+
+    if args.server:
+        from src.server import run_remote
+        if not is_batch:
+            inputs = [input_path]
+        from src.batch import output_path_for
+        outputs = [output_srt] if not is_batch else [output_path_for(i, args.output) for i in inputs]
+        try:
+            failures = run_remote(args.server, inputs, outputs, args)
+        except KeyboardInterrupt:
+            sys.exit(130)
+        except (OSError, RuntimeError) as e:
+            logging.error(f"Daemon request failed: {e}")
+            sys.exit(1)
+        if failures:
+            logging.error(f"{len(failures)} of {len(inputs)} files failed.")
+            sys.exit(1)
+        return
+
+    def run(work_dir):
+        if is_batch:
+            from src.batch import run_batch
+            failures = run_batch(inputs, work_dir, args, output_dir=args.output)
+            if failures:
+                raise RuntimeError(f"{len(failures)} of {len(inputs)} files failed.")
+        elif args.shard_s:
+            from src.shard import run_sharded
+            run_sharded(input_path, output_srt, work_dir, args)
+        else:
+            run_pipeline(input_path, output_srt, work_dir, args)
 
     # Logic to handle temp directory
     try:
@@ -41,7 +287,7 @@ def main():
             work_dir = os.path.join(os.getcwd(), "temp")
             os.makedirs(work_dir, exist_ok=True)
             try:
-                run_pipeline(input_path, output_srt, work_dir, args)
+                run(work_dir)
             except Exception:
                 # If keeping temp, we don't delete. Just re-raise.
                 raise
@@ -50,7 +296,7 @@ def main():
             # But just to be robust and explicit as per review:
             with tempfile.TemporaryDirectory() as temp_dir:
                 try:
-                    run_pipeline(input_path, output_srt, temp_dir, args)
+                    run(temp_dir)
                 except Exception:
                      # TemporaryDirectory __exit__ will clean up.
                      raise
@@ -62,54 +308,40 @@ def main():
         traceback.print_exc()
         sys.exit(1)
 
-def run_pipeline(input_path, output_srt, work_dir, args):
+def run_pipeline(input_path, output_srt, work_dir, args, separator=None, model=None):
     # Lazy imports to speed up CLI startup
-    from src.audio import probe_file, select_best_audio_stream, extract_audio, preprocess_audio
-    from src.separator import separate_vocals
-    from src.asr import transcribe_audio
-    from src.postprocess import run_post_processing, write_srt
+    from src.pipeline import new_job, run_job
+    from src.cache import open_cache
 
     logging.info(f"Processing: {input_path}")
     logging.info(f"Working directory: {work_dir}")
 
-    # 1. Probe & Select Stream
-    probe_data = probe_file(input_path)
-    stream_idx = select_best_audio_stream(probe_data)
-    logging.info(f"Selected audio stream index: {stream_idx}")
-
-    # 2. Extract Audio (48k Stereo)
-    extracted_wav = os.path.join(work_dir, "extracted_48k.wav")
-    extract_audio(input_path, stream_idx, extracted_wav)
-
-    # 3. Separate Vocals
-    # separate_vocals takes input path and output DIR.
-    # It returns the full path to the vocal file.
-    vocal_wav_path = separate_vocals(extracted_wav, work_dir)
-    if not vocal_wav_path or not os.path.exists(vocal_wav_path):
-        logging.error(f"Vocal separation failed; invalid vocal path returned: {vocal_wav_path}")
-        raise FileNotFoundError(f"Vocal track not found at path: {vocal_wav_path}")
-    logging.info(f"Vocals separated: {vocal_wav_path}")
-
-    # 4. Preprocess (16k Mono)
-    final_wav = os.path.join(work_dir, "preprocessed_16k.wav")
-    preprocess_audio(vocal_wav_path, final_wav)
-
-    # 5. ASR
-    events = transcribe_audio(final_wav)
-    logging.info(f"ASR complete. {len(events)} events.")
-
-    # 6. Post Processing (Timing/Shaping)
-    events = run_post_processing(events)
-    logging.info("Post-processing complete.")
-
-    # 7. Gemini
-    if not args.no_gemini:
-        from src.gemini import correct_text_only_with_gemini
-        events = correct_text_only_with_gemini(final_wav, events)
-
-    # 8. Write SRT
-    write_srt(events, output_srt)
-    logging.info(f"Subtitle saved to: {output_srt}")
+    # Probe/extract -> separate -> preprocess/ASR -> post-process/Gemini/write.
+    # separator/model let library callers reuse already-loaded models.
+    cache = open_cache(args)
+    job = new_job(input_path, output_srt, work_dir, cache=cache)
+    warmup = None
+    if not getattr(args, "no_warmup", False) and (separator is None or model is None):
+        from src.warmup import ModelWarmup
+        # Load the models in the background while ffmpeg runs; stage_extract
+        # starts only those the cache does not make unnecessary.
+        # A separation pool loads its own models.
+        pooled = getattr(args, "separate_chunk_s", 0) and getattr(args, "separate_procs", 1) > 1
+        warmup = ModelWarmup(args, work_dir, separator=separator is None and not pooled, asr=model is None,
+                             start=False)
+    try:
+        return run_job(job, args, separator=separator, model=model, warmup=warmup)
+    finally:
+        if warmup is not None:
+            warmup.close()
+        if cache is not None:
+            cache.report()
+        from src.metrics import write_reports
+        job["metrics"].log_summary()
+        write_reports([job["metrics"]], args)
 
 if __name__ == "__main__":
+    # Parallel ASR uses spawned processes; needed for frozen (PyInstaller) builds.
+    import multiprocessing
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,191 @@
+"""
+Forced alignment of a known script against the vocals (--align).
+
+Instead of decoding, the reference (an SRT whose timing is only roughly
+right, or plain text) is cut into windows of at most WINDOW_S seconds. For
+each window Whisper's encoder runs once and the window's tokens are scored
+in a single decoder pass; faster-whisper's find_alignment (the
+cross-attention DTW behind its word timestamps) turns that into word times.
+There is no beam search or token-by-token decoding, so this runs several
+times faster than transcription.
+
+Plain text carries no timing: its lines are first spread over the detected
+speech in proportion to their length. Each aligned window then re-anchors
+the rest of the reference, so drift does not build up from window to window.
+A line too long for one window is split by words first. Windows of lines
+timed this way (by length, not by cues) start no later than the previous
+window's last word and take the full WINDOW_S of audio.
+"""
+import re
+import logging
+import numpy as np
+
+SAMPLE_RATE = 16000
+WINDOW_S = 30.0         # Whisper's input length
+PAD_S = 2.0             # slack around the reference timing of a window
+MAX_TOKENS = 400        # the decoder takes 448 including the prompt
+MAX_WORD_S = 1.4        # longest plausible word
+
+_MARKUP = re.compile(r"<[^>]*>|\{[^}]*\}")
+
+def _clean(text):
+    # Tags, positioning codes and line breaks are not spoken.
+    return " ".join(_MARKUP.sub("", text).split())
+
+def read_reference(path):
+    """
+    Reference lines as [{"start", "end", "text"}]: SRT cues, or the non-empty
+    lines of a text file with start/end None.
+    """
+    from src.postprocess import read_srt
+
+    if path.lower().endswith(".srt"):
+        lines = [dict(ev, text=_clean(ev["text"])) for ev in read_srt(path)]
+        lines.sort(key=lambda l: l["start"])
+    else:
+        with open(path, "r", encoding="utf-8-sig") as f:
+            lines = [{"start": None, "end": None, "text": _clean(line)} for line in f]
+    return [l for l in lines if l["text"]]
+
+def place_lines(lines, audio):
+    """Gives untimed lines a rough start/end: detected speech, shared out by characters."""
+    from src.vad import speech_regions
+
+    total_s = len(audio) / SAMPLE_RATE
+    regions = speech_regions(audio, SAMPLE_RATE) or [(0.0, total_s)]
+    speech = np.cumsum([0.0] + [e - s for s, e in regions])
+    chars = np.cumsum([0] + [len(l["text"]) + 1 for l in lines])
+    # Position in speech time -> position on the timeline.
+    at = np.interp(chars / chars[-1] * speech[-1], speech, np.arange(len(speech)))
+
+    def timeline(x):
+        k = min(int(x), len(regions) - 1)
+        return regions[k][0] + (x - k) * (regions[k][1] - regions[k][0])
+
+    return [dict(l, start=timeline(at[i]), end=timeline(at[i + 1]), rough=True) for i, l in enumerate(lines)]
+
+def _tokenizer(model):
+    from faster_whisper.tokenizer import Tokenizer
+    from src.asr import TRANSCRIBE_OPTIONS
+    return Tokenizer(model.hf_tokenizer, model.model.is_multilingual, task="transcribe",
+                     language=TRANSCRIBE_OPTIONS["language"])
+
+def _encode(model, audio):
+    """(encoder output, frames of real audio) for at most WINDOW_S of audio."""
+    from faster_whisper.audio import pad_or_trim
+
+    features = model.feature_extractor(audio)
+    num_frames = min(features.shape[-1], model.feature_extractor.nb_max_frames)
+    return model.encode(pad_or_trim(features)), num_frames
+
+def _align_window(model, tokenizer, audio, tokens):
+    """Word dicts for tokens spoken in audio (at most WINDOW_S), times relative to it."""
+    encoder_output, num_frames = _encode(model, audio)
+    return model.find_alignment(tokenizer, [tokens], encoder_output, num_frames)[0]
+
+def _split_long_lines(lines, tokenizer):
+    """
+    Lines longer than one window allows (MAX_TOKENS, or WINDOW_S less the
+    padding) cut into runs of words that fit; a line's time is shared out
+    by characters.
+    """
+    max_s = WINDOW_S - 2 * PAD_S
+    out, split = [], 0
+    for l in lines:
+        words = l["text"].split()
+        if len(words) < 2 or (l["end"] - l["start"] <= max_s
+                              and len(tokenizer.encode(" " + l["text"])) <= MAX_TOKENS):
+            out.append(l)
+            continue
+        per_char = (l["end"] - l["start"]) / (len(l["text"]) + 1)
+        pieces = [[]]
+        for w in words:
+            text = " ".join(pieces[-1] + [w])
+            if pieces[-1] and ((len(text) + 1) * per_char > max_s or len(tokenizer.encode(" " + text)) > MAX_TOKENS):
+                pieces.append([])
+            pieces[-1].append(w)
+        t = l["start"]
+        for piece in pieces:
+            text = " ".join(piece)
+            end = min(l["end"], t + (len(text) + 1) * per_char)
+            out.append(dict(l, start=t, end=end, text=text, rough=True))
+            t = end
+        split += 1
+    if split:
+        logging.info(f"Split {split} reference line(s) too long for one alignment window.")
+    return out
+
+def _clamp_long_words(words):
+    # DTW gives the silence before a word to that word, and the silence after
+    # the window's last word to it; cut both back to a plausible length.
+    for i, w in enumerate(words):
+        if w["end"] - w["start"] <= MAX_WORD_S:
+            continue
+        if i == len(words) - 1 and i > 0:
+            w["end"] = w["start"] + MAX_WORD_S
+        else:
+            w["start"] = w["end"] - MAX_WORD_S
+    return words
+
+def _window_end(lines, n_tokens, shift, i, first):
+    """End (exclusive) of the window of lines starting at line i, whose speech starts at first."""
+    j, total = i + 1, n_tokens[i]
+    while (j < len(lines) and total + n_tokens[j] <= MAX_TOKENS
+           and lines[j]["end"] + shift - first + 2 * PAD_S <= WINDOW_S):
+        total += n_tokens[j]
+        j += 1
+    return j
+
+def align_words(audio_path, model, lines):
+    """
+    Word list (as transcribe_words, without segment scores) for reference
+    lines spoken in 16kHz audio, in timeline order.
+    """
+    from src.asr import load_16k
+
+    audio = load_16k(audio_path)
+    total_s = len(audio) / SAMPLE_RATE
+    if lines and lines[0]["start"] is None:
+        lines = place_lines(lines, audio)
+    tokenizer = _tokenizer(model)
+    lines = _split_long_lines(lines, tokenizer)
+    line_tokens = [tokenizer.encode(" " + l["text"]) for l in lines]
+    # Words per line as find_alignment splits them (the appended end token is dropped).
+    n_words = [len(tokenizer.split_to_word_tokens(t + [tokenizer.eot])[0]) - 1 for t in line_tokens]
+    n_tokens = [len(t) for t in line_tokens]
+
+    words, shift, i, windows = [], 0.0, 0, 0
+    while i < len(lines):
+        first = lines[i]["start"] + shift
+        if lines[i].get("rough") and words:
+            # The next line cannot start before the last aligned word ended.
+            first = min(first, words[-1]["end"])
+        j = _window_end(lines, n_tokens, shift, i, first)
+        a = max(0.0, min(first - PAD_S, total_s - 1.0))
+        b = min(total_s, a + WINDOW_S)
+        if not any(l.get("rough") for l in lines[i:j]):
+            # Times shared out by characters can be seconds off; those windows get
+            # all the audio the encoder takes anyway, cue timing only the padding.
+            b = min(b, max(l["end"] for l in lines[i:j]) + shift + PAD_S)
+        tokens = [t for ts in line_tokens[i:j] for t in ts]
+        aligned = _align_window(model, tokenizer, audio[int(a * SAMPLE_RATE):int(b * SAMPLE_RATE)], tokens)
+        window_words = _clamp_long_words([
+            {"word": w["word"].strip(), "start": a + w["start"], "end": a + w["end"], "probability": w["probability"]}
+            for w in aligned if w["word"].strip()
+        ])
+        for w in window_words:
+            # Windows overlap by their padding; keep the timeline monotonic.
+            if words and w["start"] < words[-1]["end"]:
+                w["start"] = words[-1]["end"]
+                w["end"] = max(w["end"], w["start"])
+            words.append(w)
+        # Re-anchor on the first word of the window's last line.
+        first_of_last = sum(n_words[i:j - 1])
+        if first_of_last < len(window_words):
+            shift = window_words[first_of_last]["start"] - lines[j - 1]["start"]
+        windows += 1
+        i = j
+
+    logging.info(f"Aligned {len(words)} words from {len(lines)} reference lines in {windows} windows "
+                 f"({total_s:.1f}s of audio).")
+    return words
@@ -4,10 +4,10 @@ ASR module for transcription using faster-whisper.
 Provides smart segmentation based on pauses, character limits, and punctuation.
 Uses faster-whisper with word-level timestamps for accurate subtitle generation.
 """
-import torch
+import os
 import logging
+import functools
 from typing import List, Dict, Any
-from faster_whisper import WhisperModel
 
 HARD_PUNCT = (".", "!", "?", "…", ":", ";")
 SOFT_PUNCT = (",",)
@@ -15,10 +15,16 @@ SOFT_PUNCT = (",",)
 def _wtext(w: Dict[str,Any]) -> str:
     return (w.get("word") or "").strip()
 
-def find_best_split_point_in_buffer(words: List[Dict[str,Any]]) -> int:
+def _joined_len(total_chars, n_words):
+    # len(" ".join(words)) from the summed word lengths, without joining.
+    return total_chars + n_words - 1 if n_words else 0
+
+def find_best_split_point_in_buffer(words: List[Dict[str,Any]], lengths: List[int] = None) -> int:
     if len(words) < 2: return 1
-    full_text = " ".join(_wtext(w) for w in words)
-    target_len = len(full_text) / 2
+    texts = [_wtext(w) for w in words]
+    if lengths is None:
+        lengths = [len(t) for t in texts]
+    target_len = _joined_len(sum(lengths), len(words)) / 2
     best_idx = -1
     best_score = -float('inf')
     current_len = 0
@@ -26,60 +32,351 @@ def find_best_split_point_in_buffer(words: List[Dict[str,Any]]) -> int:
         w = words[i]
         nxt = words[i+1]
         score = 0.0
-        current_len += len(_wtext(w)) + 1
+        current_len += lengths[i] + 1
         dist = abs(current_len - target_len)
         score -= dist * 1.5
         gap = (nxt["start"] - w["end"])
         if gap > 0: score += gap * 200.0
-        txt = _wtext(w)
+        txt = texts[i]
         if txt.endswith(HARD_PUNCT): score += 50.0
         elif txt.endswith(SOFT_PUNCT): score += 25.0
         if score > best_score:
             best_score, best_idx = score, i + 1
     return best_idx if best_idx != -1 else len(words) // 2
 
-def segment_smart_stream(words, pause_ms=400, max_chars=84, max_dur_s=7.0):
-    out = []
+def iter_segment_smart_stream(items, pause_ms=400, max_chars=84, max_dur_s=7.0):
+    """
+    Incremental segment_smart_stream.
+    items yields word dicts, optionally interleaved with float watermarks: a
+    watermark t promises that no later word starts before t. Each event is
+    yielded as soon as it can no longer change, and watermarks are passed
+    through so downstream stages can commit too.
+    The buffer's text length is tracked from per-word lengths, so each word
+    costs O(1) instead of re-joining the buffer.
+    """
     buf = []
+    buf_lens = []
+    buf_chars = 0
     buf_start = 0.0
     def create_event(word_list):
         if not word_list: return None
         return {"start": float(word_list[0]["start"]), "end": float(word_list[-1]["end"]), "words": word_list, "text": ""}
-    for i, w in enumerate(words):
+    def step(w, gap):
+        nonlocal buf, buf_lens, buf_chars, buf_start
         if not buf: buf_start = w["start"]
+        n = len(_wtext(w))
         buf.append(w)
-        nxt = words[i+1] if i+1 < len(words) else None
-        gap = (nxt["start"] - w["end"])*1000.0 if nxt else 0.0
+        buf_lens.append(n)
+        buf_chars += n
         if gap >= pause_ms:
-            out.append(create_event(buf))
-            buf = []
-            continue
-        current_text = " ".join(_wtext(x) for x in buf)
+            ev = create_event(buf)
+            buf, buf_lens, buf_chars = [], [], 0
+            return [ev]
         current_dur = w["end"] - buf_start
-        if len(current_text) > max_chars or current_dur > max_dur_s:
-            split_idx = find_best_split_point_in_buffer(buf)
-            out.append(create_event(buf[:split_idx]))
-            buf = buf[split_idx:]
+        if _joined_len(buf_chars, len(buf)) > max_chars or current_dur > max_dur_s:
+            split_idx = find_best_split_point_in_buffer(buf, buf_lens)
+            ev = create_event(buf[:split_idx])
+            buf_chars -= sum(buf_lens[:split_idx])
+            buf, buf_lens = buf[split_idx:], buf_lens[split_idx:]
             if buf: buf_start = buf[0]["start"]
-    if buf: out.append(create_event(buf))
-    return [e for e in out if e]
-
-def transcribe_audio(audio_path, model_id="large-v3-turbo"):
-    logging.info(f"Transcribing {audio_path} with {model_id}...")
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    compute_type = "float16" if torch.cuda.is_available() else "int8"
-
-    model = WhisperModel(model_id, device=device, compute_type=compute_type)
-    segments, info = model.transcribe(
-        audio_path, language="en", word_timestamps=True,
-        condition_on_previous_text=False, vad_filter=False
-    )
+            return [ev] if ev else []
+        return []
 
-    all_words = []
+    # Each word is decided once the next word (or a late enough watermark) is known.
+    pending = None
+    for item in items:
+        if isinstance(item, float):
+            if pending is not None and (item - pending["end"]) * 1000.0 >= pause_ms:
+                yield from step(pending, pause_ms)
+                pending = None
+            yield item
+            continue
+        if pending is not None:
+            yield from step(pending, (item["start"] - pending["end"]) * 1000.0)
+        pending = item
+    if pending is not None:
+        yield from step(pending, 0.0)
+    if buf: yield create_event(buf)
+
+def segment_smart_stream(words, pause_ms=400, max_chars=84, max_dur_s=7.0):
+    return list(iter_segment_smart_stream(words, pause_ms=pause_ms, max_chars=max_chars, max_dur_s=max_dur_s))
+
+DEFAULT_MODEL_ID = "large-v3-turbo"
+
+# Decode settings; part of the cache key for the raw word list.
+TRANSCRIBE_OPTIONS = {"language": "en", "word_timestamps": True,
+                      "condition_on_previous_text": False, "vad_filter": False}
+def decode_options(beam_size=None):
+    """TRANSCRIBE_OPTIONS plus the tunable beam size (faster-whisper's default when None)."""
+    if beam_size is None:
+        return TRANSCRIBE_OPTIONS
+    return dict(TRANSCRIBE_OPTIONS, beam_size=beam_size)
+
+# Keys of each word dict; also part of the cache key so older entries are not reused.
+WORD_FIELDS = ("word", "start", "end", "probability", "avg_logprob", "no_speech_prob")
+
+@functools.lru_cache(maxsize=None)
+def detect_device():
+    """
+    ("cuda", "float16") when CTranslate2 sees a GPU, else ("cpu", "int8").
+    Asks CTranslate2, which faster-whisper loads anyway, instead of importing torch.
+    """
+    import ctranslate2
+    if ctranslate2.get_cuda_device_count() > 0:
+        return "cuda", "float16"
+    return "cpu", "int8"
+
+def load_whisper_model(model_id=DEFAULT_MODEL_ID, cpu_threads=0, compute_type=None):
+    """compute_type overrides detect_device's choice (see src.autotune)."""
+    from faster_whisper import WhisperModel
+
+    device, default_type = detect_device()
+    compute_type = compute_type or default_type
+    logging.info(f"Loading Whisper model {model_id} ({device}/{compute_type})...")
+    return WhisperModel(model_id, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+
+def segment_words(segments, offset_s=0.0):
+    """
+    Flattens Whisper segments into word dicts. Besides text and timing each
+    word keeps its probability and its segment's avg_logprob and
+    no_speech_prob, so later stages can tell which lines Whisper doubted.
+    """
+    words = []
     for s in segments:
         for w in s.words:
             t = w.word.strip()
-            if t: all_words.append({"word": t, "start": w.start, "end": w.end})
+            if t:
+                words.append({
+                    "word": t, "start": w.start + offset_s, "end": w.end + offset_s,
+                    "probability": w.probability, "avg_logprob": s.avg_logprob, "no_speech_prob": s.no_speech_prob,
+                })
+    return words
+
+def transcribe_words(audio_path, model_id=DEFAULT_MODEL_ID, model=None, options=None):
+    """Runs Whisper and returns the raw word list (see segment_words)."""
+    # audio_path may also be a 16kHz mono float32 array (in-memory mode).
+    label = audio_path if isinstance(audio_path, str) else f"{len(audio_path) / 16000:.1f}s of in-memory audio"
+    logging.info(f"Transcribing {label} with {model_id}...")
+    if model is None:
+        model = load_whisper_model(model_id)
+    segments, info = model.transcribe(audio_path, **(options or TRANSCRIBE_OPTIONS))
+    return segment_words(segments)
+
+# Saved word lists (src.sweep): numeric WORD_FIELDS as float32 columns, the
+# word strings interned into one NUL-separated UTF-8 blob plus an id column.
+WORDS_EXT = ".words.npz"
+
+def words_path_for(output_srt):
+    return f"{os.path.splitext(output_srt)[0]}{WORDS_EXT}"
+
+def save_words(words, path):
+    import numpy as np
+
+    intern = {}
+    ids = np.fromiter((intern.setdefault(w["word"], len(intern)) for w in words), dtype=np.uint32, count=len(words))
+    columns = {f: np.fromiter((w.get(f, np.nan) for w in words), dtype=np.float32, count=len(words))
+               for f in WORD_FIELDS[1:] if words and f in words[0]}
+    blob = np.frombuffer("\0".join(intern).encode("utf-8"), dtype=np.uint8)
+    with open(path, "wb") as f:
+        np.savez_compressed(f, text_id=ids, texts=blob, **columns)
 
+def load_words(path):
+    """Word dicts as saved by save_words."""
+    import numpy as np
+
+    with np.load(path) as data:
+        texts = data["texts"].tobytes().decode("utf-8").split("\0")
+        ids = data["text_id"].tolist()
+        columns = {f: data[f].tolist() for f in WORD_FIELDS[1:] if f in data.files}
+    return [{"word": texts[t], **{f: col[i] for f, col in columns.items()}} for i, t in enumerate(ids)]
+
+def transcribe_audio(audio_path, model_id=DEFAULT_MODEL_ID, model=None, words_path=None):
+    all_words = transcribe_words(audio_path, model_id=model_id, model=model)
+    if words_path:
+        save_words(all_words, words_path)
     events = segment_smart_stream(all_words, pause_ms=400, max_chars=84, max_dur_s=7.0)
     return events
+
+# --- Parallel (chunked) ASR -------------------------------------------------
+# The 16kHz audio is cut at the quietest point near every chunk boundary, the
+# chunks are transcribed in a process pool (one resident model per process)
+# and word timestamps are shifted back by each chunk's offset.
+
+DEFAULT_CHUNK_S = 120.0
+
+def find_silence_cuts(audio, sample_rate=16000, chunk_s=DEFAULT_CHUNK_S, search_s=10.0, frame_s=0.02, smooth_s=0.3):
+    """
+    Returns sample indices to cut at: for every multiple of chunk_s, the
+    quietest point (smoothed frame energy) within +/- search_s of it.
+    """
+    import numpy as np
+
+    frame_len = int(frame_s * sample_rate)
+    n_frames = len(audio) // frame_len
+    if n_frames == 0 or len(audio) <= chunk_s * sample_rate:
+        return []
+    frames = np.asarray(audio[:n_frames * frame_len], dtype=np.float32).reshape(n_frames, frame_len)
+    energy = np.mean(frames * frames, axis=1)
+    k = max(1, int(smooth_s / frame_s))
+    energy = np.convolve(energy, np.ones(k, dtype=np.float32) / k, mode="same")
+
+    cuts = []
+    total_s = len(audio) / sample_rate
+    target = chunk_s
+    while target < total_s - search_s:
+        lo = max(0, int((target - search_s) / frame_s))
+        hi = min(n_frames, int((target + search_s) / frame_s))
+        if cuts:
+            lo = max(lo, cuts[-1] // frame_len + 1)
+        if lo >= hi:
+            target += chunk_s
+            continue
+        best = lo + int(np.argmin(energy[lo:hi]))
+        # Centre of the quietest frame.
+        cuts.append(best * frame_len + frame_len // 2)
+        target = best * frame_s + chunk_s
+    return cuts
+
+_pool_model = None
+
+def _pool_init(model_id, cpu_threads, compute_type=None):
+    global _pool_model
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    _pool_model = load_whisper_model(model_id, cpu_threads=cpu_threads, compute_type=compute_type)
+
+def _pool_transcribe(chunk, offset_s, options=None):
+    segments, _ = _pool_model.transcribe(chunk, **(options or TRANSCRIBE_OPTIONS))
+    return segment_words(segments, offset_s)
+
+def open_asr_pool(workers, model_id=DEFAULT_MODEL_ID, cpu_threads=0, compute_type=None):
+    """
+    Starts a process pool with one resident WhisperModel per process.
+    spawn avoids forking a parent that may already hold torch/CUDA state.
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    logging.info(f"Starting ASR pool: {workers} processes x {cpu_threads or 'auto'} threads ({model_id})")
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_pool_init,
+        initargs=(model_id, cpu_threads, compute_type),
+    )
+
+def load_16k(audio_path):
+    """16kHz mono float32 array from a WAV path or an array."""
+    import numpy as np
+
+    if isinstance(audio_path, str):
+        import soundfile as sf
+        audio, sr = sf.read(audio_path, dtype="float32")
+        if sr != 16000:
+            raise ValueError(f"Chunked ASR expects 16kHz audio, got {sr}Hz: {audio_path}")
+    else:
+        audio = np.asarray(audio_path, dtype=np.float32)
+    if audio.ndim > 1:
+        audio = audio.mean(axis=1)
+    return audio
+
+def transcribe_words_parallel(audio_path, pool, chunk_s=DEFAULT_CHUNK_S, options=None):
+    """
+    Chunked equivalent of transcribe_words over a process pool.
+    Returns the merged word list in timeline order.
+    """
+    audio = load_16k(audio_path)
+    bounds = [0] + find_silence_cuts(audio, chunk_s=chunk_s) + [len(audio)]
+    logging.info(f"Parallel ASR: {len(audio) / 16000:.1f}s in {len(bounds) - 1} chunks.")
+    futures = [
+        pool.submit(_pool_transcribe, audio[a:b], a / 16000.0, options)
+        for a, b in zip(bounds[:-1], bounds[1:]) if b > a
+    ]
+    all_words = []
+    for f in futures:
+        all_words.extend(f.result())
+    return all_words
+
+# --- Cascade ASR ------------------------------------------------------------
+# A small draft model transcribes everything; segments it was unsure about
+# (same signals faster-whisper uses for temperature fallback) are cut out at
+# the gaps between draft words and re-decoded with the large model, whose
+# words replace the draft's there.
+
+DRAFT_MODEL_ID = "small"
+CASCADE_LOGPROB = -0.6          # avg_logprob below this
+CASCADE_COMPRESSION = 2.4       # compression_ratio above this (repetition loops)
+CASCADE_NO_SPEECH = 0.6         # no_speech_prob above this, yet words came out
+CASCADE_PAD_S = 0.5
+CASCADE_MERGE_GAP_S = 1.0       # closer regions are decoded as one
+
+class CascadeBackend:
+    """Draft WhisperModel plus the large backend (a WhisperModel or an ASR pool)."""
+
+    def __init__(self, draft, full, draft_id=DRAFT_MODEL_ID):
+        self.draft = draft
+        self.full = full
+        self.draft_id = draft_id
+
+    def shutdown(self):
+        if hasattr(self.full, "shutdown"):
+            self.full.shutdown()
+
+def needs_second_pass(segment, logprob=CASCADE_LOGPROB):
+    return (segment.avg_logprob < logprob
+            or getattr(segment, "compression_ratio", 0.0) > CASCADE_COMPRESSION
+            or segment.no_speech_prob > CASCADE_NO_SPEECH)
+
+def cascade_regions(segments, total_s, logprob=CASCADE_LOGPROB):
+    """
+    (start_s, end_s) regions to re-decode: flagged segments padded by
+    CASCADE_PAD_S without reaching into neighbouring draft words, merged
+    when closer than CASCADE_MERGE_GAP_S.
+    """
+    spans = [(s.words[0].start, s.words[-1].end, needs_second_pass(s, logprob)) for s in segments if s.words]
+    regions = []
+    for i, (start, end, flagged) in enumerate(spans):
+        if not flagged:
+            continue
+        lo = max(start - CASCADE_PAD_S, spans[i - 1][1] if i > 0 else 0.0, 0.0)
+        hi = min(end + CASCADE_PAD_S, spans[i + 1][0] if i + 1 < len(spans) else total_s, total_s)
+        if regions and lo - regions[-1][1] < CASCADE_MERGE_GAP_S:
+            regions[-1] = (regions[-1][0], hi)
+        else:
+            regions.append((lo, hi))
+    return regions
+
+def transcribe_words_cascade(audio_path, backend, model_id=DEFAULT_MODEL_ID, logprob=CASCADE_LOGPROB, options=None):
+    """
+    Two-pass transcribe_words with a CascadeBackend. Returns the merged word
+    list in timeline order; with an ASR pool as the large backend the
+    regions are re-decoded in parallel.
+    """
+    audio = load_16k(audio_path)
+    total_s = len(audio) / 16000
+    logging.info(f"Cascade ASR: draft pass over {total_s:.1f}s with {backend.draft_id}...")
+    options = options or TRANSCRIBE_OPTIONS
+    segments, _ = backend.draft.transcribe(audio, **options)
+    segments = list(segments)
+    regions = cascade_regions(segments, total_s, logprob)
+
+    def inside(w):
+        mid = (w["start"] + w["end"]) / 2
+        return any(lo <= mid < hi for lo, hi in regions)
+
+    words = [w for w in segment_words(segments) if not inside(w)]
+    pieces = [(lo, audio[int(lo * 16000):int(hi * 16000)]) for lo, hi in regions]
+    if hasattr(backend.full, "submit"):
+        redone = [backend.full.submit(_pool_transcribe, chunk, lo, options) for lo, chunk in pieces]
+        redone = [f.result() for f in redone]
+    else:
+        redone = [segment_words(backend.full.transcribe(chunk, **options)[0], lo) for lo, chunk in pieces]
+    for batch in redone:
+        words.extend(w for w in batch if inside(w))
+    words.sort(key=lambda w: w["start"])
+
+    second = sum(hi - lo for lo, hi in regions)
+    logging.info(
+        f"Cascade ASR: {len(regions)} region(s), {second:.1f}s of {total_s:.1f}s "
+        f"({second / max(total_s, 1e-9) * 100:.1f}%) re-decoded with {model_id}."
+    )
+    return words
@@ -8,6 +8,9 @@ import subprocess
 import json
 import logging
 
+# Whisper preprocessing filter; shared by the file and in-memory paths.
+PREPROCESS_FILTER = "highpass=f=100,lowpass=f=8000"
+
 def probe_file(filepath):
     """
     Probes the media file using ffprobe and returns the JSON output.
@@ -57,20 +60,72 @@ def select_best_audio_stream(probe_data):
     selected = candidates[0]
     return int(selected["index"])
 
-def extract_audio(input_path, stream_index, output_path):
+def select_audio_streams(probe_data, spec="best"):
     """
-    Extracts the specified audio stream to 48kHz Stereo PCM WAV.
+    Selects the audio streams to subtitle. spec is "best" (the single stream
+    select_best_audio_stream picks), "all", or a comma-separated list of
+    stream indices and language codes, e.g. "1,3" or "eng,jpn".
+    Returns stream indices in container order.
+    """
+    if not spec or spec == "best":
+        return [select_best_audio_stream(probe_data)]
+
+    audio_streams = [s for s in probe_data.get("streams", []) if s["codec_type"] == "audio"]
+    if not audio_streams:
+        raise ValueError("No audio streams found.")
+    if spec == "all":
+        return [int(s["index"]) for s in audio_streams]
+
+    selected = set()
+    for item in (part.strip().lower() for part in spec.split(",")):
+        if not item:
+            continue
+        if item.isdigit():
+            if not any(int(s["index"]) == int(item) for s in audio_streams):
+                raise ValueError(f"Stream {item} is not an audio stream.")
+            selected.add(int(item))
+        else:
+            # "en" matches "eng", same as select_best_audio_stream.
+            selected.update(
+                int(s["index"]) for s in audio_streams
+                if s.get("tags", {}).get("language", "").lower().startswith(item)
+            )
+    if not selected:
+        raise ValueError(f"No audio streams match '{spec}'.")
+    return sorted(selected)
+
+def parse_time(value):
+    """Seconds from "90", "1:30" or "01:01:30.5" (command-line --start/--end)."""
+    seconds = 0.0
+    for part in str(value).strip().split(":"):
+        seconds = seconds * 60 + float(part)
+    if seconds < 0:
+        raise ValueError(f"negative time: {value}")
+    return seconds
+
+def _seek_args(start_s):
+    # Input seeking: ffmpeg jumps near start_s and decodes from there, so a
+    # window late in a long file costs no more than one at the start.
+    return ["-ss", f"{start_s:.3f}"] if start_s else []
+
+def extract_audio(input_path, stream_index, output_path, duration_s=None, start_s=None):
+    """
+    Extracts the specified audio stream to 48kHz Stereo PCM WAV
+    (only duration_s seconds from start_s when given).
     """
     cmd = [
         "ffmpeg",
         "-y",
+        *_seek_args(start_s),
         "-i", input_path,
         "-map", f"0:{stream_index}",
         "-ac", "2",              # Stereo
         "-ar", "48000",          # 48kHz
         "-c:a", "pcm_f32le",     # 32-bit float PCM
-        output_path
     ]
+    if duration_s:
+        cmd += ["-t", f"{duration_s:.3f}"]
+    cmd.append(output_path)
     logging.info(f"Extracting stream {stream_index} to {output_path}...")
     try:
         subprocess.run(cmd, check=True)
@@ -78,6 +133,22 @@ def extract_audio(input_path, stream_index, output_path):
         logging.error(f"Error extracting audio: {e}")
         raise
 
+def extract_audio_multi(input_path, stream_indices, output_paths, duration_s=None, start_s=None):
+    """
+    Extracts several audio streams in one ffmpeg run, so the container is
+    demuxed and read once. Same format and window as extract_audio.
+    """
+    cmd = ["ffmpeg", "-y", *_seek_args(start_s), "-i", input_path]
+    window = ["-t", f"{duration_s:.3f}"] if duration_s else []
+    for stream_index, output_path in zip(stream_indices, output_paths):
+        cmd += ["-map", f"0:{stream_index}", "-ac", "2", "-ar", "48000", "-c:a", "pcm_f32le", *window, output_path]
+    logging.info(f"Extracting streams {', '.join(map(str, stream_indices))} in one pass...")
+    try:
+        subprocess.run(cmd, check=True)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error extracting audio: {e}")
+        raise
+
 def preprocess_audio(input_path, output_path):
     """
     Preprocesses audio for Whisper:
@@ -91,7 +162,7 @@ def preprocess_audio(input_path, output_path):
         "-i", input_path,
         "-ac", "1",
         "-ar", "16000",
-        "-af", "highpass=f=100,lowpass=f=8000",
+        "-af", PREPROCESS_FILTER,
         output_path
     ]
     logging.info(f"Preprocessing {input_path} -> {output_path}...")
@@ -100,3 +171,232 @@ def preprocess_audio(input_path, output_path):
     except subprocess.CalledProcessError as e:
         logging.error(f"Error preprocessing audio: {e}")
         raise
+
+# --- In-memory mode -------------------------------------------------------
+# ffmpeg decodes to raw float32 on stdout and the samples land directly in
+# NumPy arrays, so no intermediate WAV files touch the disk.
+
+PIPE_CHUNK_BYTES = 1 << 20
+
+def _run_ffmpeg_pipe(cmd, input_bytes=None):
+    """
+    Runs ffmpeg with raw PCM on stdout (and optionally stdin) and returns the
+    decoded bytes as a bytearray. stdin is fed from a thread so neither pipe
+    can fill up and deadlock the other.
+    """
+    import threading
+
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if input_bytes is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+    )
+    writer = None
+    if input_bytes is not None:
+        def feed():
+            try:
+                proc.stdin.write(input_bytes)
+            except BrokenPipeError:
+                pass
+            finally:
+                proc.stdin.close()
+        writer = threading.Thread(target=feed, daemon=True)
+        writer.start()
+
+    buf = bytearray()
+    while True:
+        chunk = proc.stdout.read(PIPE_CHUNK_BYTES)
+        if not chunk:
+            break
+        buf.extend(chunk)
+    proc.stdout.close()
+    if writer is not None:
+        writer.join()
+    ret = proc.wait()
+    if ret != 0:
+        raise subprocess.CalledProcessError(ret, cmd)
+    return buf
+
+def _pcm_to_array(buf, channels):
+    import numpy as np
+    # Drop a trailing partial frame if ffmpeg was cut short.
+    frame_bytes = 4 * channels
+    usable = len(buf) - (len(buf) % frame_bytes)
+    audio = np.frombuffer(memoryview(buf)[:usable], dtype=np.float32)
+    return audio.reshape(-1, channels) if channels > 1 else audio
+
+def extract_audio_array(input_path, stream_index, sample_rate=48000, channels=2, start_s=None, duration_s=None):
+    """
+    Decodes the specified audio stream (or duration_s seconds of it from
+    start_s) straight into memory. Returns float32 samples shaped (frames, channels).
+    """
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        *_seek_args(start_s),
+        "-i", input_path,
+        "-map", f"0:{stream_index}",
+        "-ac", str(channels),
+        "-ar", str(sample_rate),
+    ]
+    if duration_s:
+        cmd += ["-t", f"{duration_s:.3f}"]
+    cmd += ["-f", "f32le", "pipe:1"]
+    logging.info(f"Extracting stream {stream_index} to memory ({sample_rate}Hz, {channels}ch)...")
+    try:
+        buf = _run_ffmpeg_pipe(cmd)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error extracting audio: {e}")
+        raise
+    audio = _pcm_to_array(buf, channels)
+    logging.info(f"Extracted {len(audio) / sample_rate:.1f}s of audio ({len(buf) / 1e6:.1f} MB in memory).")
+    return audio
+
+def extract_audio_arrays(input_path, stream_indices, sample_rate=48000, channels=2, duration_s=None, start_s=None):
+    """
+    Decodes several audio streams into memory with a single ffmpeg run.
+    The streams are merged into one interleaved pipe (amerge) and split
+    apart again here. Without duration_s the result stops at the shortest
+    stream; with it, shorter streams are padded with silence to that length.
+    start_s seeks the input first, like extract_audio.
+    Returns a list of float32 arrays shaped (frames, channels).
+    """
+    import numpy as np
+
+    layout = "mono" if channels == 1 else "stereo"
+    pad = ",apad" if duration_s else ""
+    graph = ";".join(
+        f"[0:{idx}]aresample={sample_rate},aformat=sample_fmts=flt:channel_layouts={layout}{pad}[a{i}]"
+        for i, idx in enumerate(stream_indices)
+    )
+    inputs = "".join(f"[a{i}]" for i in range(len(stream_indices)))
+    graph += f";{inputs}amerge=inputs={len(stream_indices)}[out]"
+    cmd = ["ffmpeg", "-nostdin", *_seek_args(start_s), "-i", input_path, "-filter_complex", graph, "-map", "[out]"]
+    if duration_s:
+        cmd += ["-t", f"{duration_s:.3f}"]
+    cmd += ["-f", "f32le", "pipe:1"]
+    logging.info(f"Extracting streams {', '.join(map(str, stream_indices))} to memory in one pass...")
+    try:
+        buf = _run_ffmpeg_pipe(cmd)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error extracting audio: {e}")
+        raise
+    merged = _pcm_to_array(buf, channels * len(stream_indices))
+    if merged.ndim == 1:
+        merged = merged.reshape(-1, 1)
+    logging.info(f"Extracted {len(merged) / sample_rate:.1f}s x {len(stream_indices)} streams ({len(buf) / 1e6:.1f} MB in memory).")
+    tracks = []
+    for i in range(len(stream_indices)):
+        track = np.ascontiguousarray(merged[:, i * channels:(i + 1) * channels])
+        tracks.append(track[:, 0] if channels == 1 else track)
+    return tracks
+
+def preprocess_array(audio, sample_rate):
+    """
+    Same processing as preprocess_audio (16kHz, mono, 100Hz-8kHz band-pass)
+    run as a single ffmpeg filtergraph over an in-memory array.
+    Returns a 1-D float32 array at 16kHz.
+    """
+    import numpy as np
+
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    channels = 1 if audio.ndim == 1 else audio.shape[1]
+    cmd = [
+        "ffmpeg",
+        "-f", "f32le",
+        "-ar", str(sample_rate),
+        "-ac", str(channels),
+        "-i", "pipe:0",
+        "-ac", "1",
+        "-ar", "16000",
+        "-af", PREPROCESS_FILTER,
+        "-f", "f32le",
+        "pipe:1"
+    ]
+    logging.info(f"Preprocessing {len(audio) / sample_rate:.1f}s in memory -> 16kHz mono...")
+    try:
+        buf = _run_ffmpeg_pipe(cmd, input_bytes=memoryview(audio).cast("B"))
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error preprocessing audio: {e}")
+        raise
+    return _pcm_to_array(buf, 1)
+
+def resample_mono(source, out_rate, in_rate=None):
+    """
+    Downmixes and resamples a media path, or a (frames, channels) array at
+    in_rate, to a 1-D float32 array at out_rate (no filtering beyond ffmpeg's
+    resampler).
+    """
+    import numpy as np
+
+    if isinstance(source, str):
+        cmd = ["ffmpeg", "-nostdin", "-i", source, "-ac", "1", "-ar", str(out_rate), "-f", "f32le", "pipe:1"]
+        input_bytes = None
+    else:
+        audio = np.ascontiguousarray(source, dtype=np.float32)
+        channels = 1 if audio.ndim == 1 else audio.shape[1]
+        cmd = ["ffmpeg", "-f", "f32le", "-ar", str(in_rate), "-ac", str(channels), "-i", "pipe:0",
+               "-ac", "1", "-ar", str(out_rate), "-f", "f32le", "pipe:1"]
+        input_bytes = memoryview(audio).cast("B")
+    try:
+        buf = _run_ffmpeg_pipe(cmd, input_bytes=input_bytes)
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error resampling audio: {e}")
+        raise
+    return _pcm_to_array(buf, 1)
+
+def encode_wav_bytes(audio, sample_rate):
+    """Encodes float samples as a 16-bit PCM WAV held in memory."""
+    import io
+    import wave
+    import numpy as np
+
+    channels = 1 if audio.ndim == 1 else audio.shape[1]
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767.0).astype("<i2")
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm.tobytes())
+    return out.getvalue()
+
+# Compact upload formats: ffmpeg output options and MIME type.
+SPEECH_CODECS = {
+    "opus": (["-c:a", "libopus", "-b:a", "32k", "-application", "voip", "-f", "ogg"], "audio/ogg"),
+    "flac": (["-c:a", "flac", "-sample_fmt", "s16", "-f", "flac"], "audio/flac"),
+}
+
+def encode_speech_bytes(audio, sample_rate, codec="opus"):
+    """
+    Encodes mono float samples for upload. Returns (bytes, mime_type);
+    codec "wav" skips ffmpeg and returns 16-bit PCM.
+    """
+    import numpy as np
+
+    if codec == "wav":
+        return encode_wav_bytes(audio, sample_rate), "audio/wav"
+    options, mime_type = SPEECH_CODECS[codec]
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    cmd = [
+        "ffmpeg",
+        "-hide_banner", "-loglevel", "error",
+        "-f", "f32le",
+        "-ar", str(sample_rate),
+        "-ac", "1",
+        "-i", "pipe:0",
+        *options,
+        "pipe:1"
+    ]
+    try:
+        buf = _run_ffmpeg_pipe(cmd, input_bytes=memoryview(audio).cast("B"))
+    except subprocess.CalledProcessError as e:
+        logging.error(f"Error encoding audio to {codec}: {e}")
+        raise
+    return bytes(buf), mime_type
+
+def write_wav(path, audio, sample_rate):
+    """Writes an in-memory array to disk (used for --keep-temp in in-memory mode)."""
+    with open(path, "wb") as f:
+        f.write(encode_wav_bytes(audio, sample_rate))
+    logging.info(f"Wrote {path}")
@@ -0,0 +1,205 @@
+"""
+Per-host tuning of ASR and separation settings.
+
+`main.py --autotune SAMPLE` cuts the first CLIP_S seconds of SAMPLE's best
+audio stream and times short calibration passes on it:
+
+- separation: MDXC batch size and segment size, each compared with the stem
+  of the default settings; candidates below SEPARATION_MIN_SNR_DB are dropped.
+- ASR on that stem: compute type and beam size against a reference decode
+  (float32/float16, beam 5); candidates with a word error rate above
+  ASR_MAX_WER against it are dropped. Then processes x threads per process,
+  measured as throughput with every process busy.
+
+The fastest remaining settings are saved as JSON per host name (together
+with the CPU count, so a resized VM is re-tuned) and become the CLI defaults
+on later runs; options given on the command line still win.
+"""
+import os
+import json
+import time
+import socket
+import logging
+import tempfile
+
+DEFAULT_PROFILE_DIR = os.environ.get(
+    "LIVESUBS_CONFIG_DIR", os.path.join(os.path.expanduser("~"), ".config", "livesubs")
+)
+CLIP_S = 60.0
+ASR_MAX_WER = 0.03
+SEPARATION_MIN_SNR_DB = 30.0
+MAX_ASR_PROCS = 8
+
+# Argument names a profile may set.
+PROFILE_KEYS = ("asr_compute_type", "beam_size", "asr_procs", "asr_threads",
+                "separator_batch_size", "separator_segment_size")
+
+def hardware():
+    return {"host": socket.gethostname(), "cpus": os.cpu_count() or 1}
+
+def profile_path():
+    return os.path.join(DEFAULT_PROFILE_DIR, f"profile-{hardware()['host']}.json")
+
+def load_profile():
+    """Saved settings for this host as {arg name: value}, or None."""
+    path = profile_path()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable autotune profile {path}: {e}")
+        return None
+    if profile.get("hardware") != hardware():
+        logging.warning(f"Autotune profile {path} was made on {profile.get('hardware')}; run --autotune again.")
+        return None
+    settings = {k: v for k, v in profile.get("settings", {}).items() if k in PROFILE_KEYS}
+    logging.info(f"Autotune profile: {', '.join(f'{k}={v}' for k, v in settings.items())}")
+    return settings
+
+def save_profile(settings, results):
+    os.makedirs(DEFAULT_PROFILE_DIR, exist_ok=True)
+    path = profile_path()
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"hardware": hardware(), "created": time.time(), "settings": settings, "results": results}, f, indent=2)
+    os.replace(tmp, path)
+    return path
+
+def _norm_words(words):
+    table = str.maketrans("", "", ".,!?…:;\"'()-")
+    return [t for t in (w["word"].lower().translate(table) for w in words) if t]
+
+def word_error_rate(reference, hypothesis):
+    """Word-level edit distance over the reference length, on word dicts."""
+    ref, hyp = _norm_words(reference), _norm_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    prev = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        cur = [i] + [0] * len(hyp)
+        for j, h in enumerate(hyp, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (r != h))
+        prev = cur
+    return prev[-1] / len(ref)
+
+def snr_db(reference, test):
+    import numpy as np
+    n = min(len(reference), len(test))
+    noise = float(np.sum((reference[:n] - test[:n]) ** 2))
+    # Identical stems come out around +200 dB instead of inf, which JSON lacks.
+    return 10.0 * np.log10((float(np.sum(reference[:n] ** 2)) + 1e-20) / (noise + 1e-20))
+
+def _timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+def _fastest(results, ok):
+    passing = [r for r in results if ok(r)]
+    return min(passing, key=lambda r: r["seconds"]) if passing else None
+
+def tune_separation(clip_path, work_dir):
+    """Returns (settings, stem path of the default settings, per-candidate results)."""
+    import soundfile as sf
+    from src.separator import load_separator, separate_vocals
+    from src.asr import detect_device
+
+    batches = (1, 2, 4, 8) if detect_device()[0] == "cuda" else (1, 2, 4)
+    results = []
+    reference = reference_path = None
+    for segment_size in (None, 256, 512):
+        for batch_size in batches:
+            out_dir = os.path.join(work_dir, f"sep_b{batch_size}_s{segment_size or 'model'}")
+            os.makedirs(out_dir, exist_ok=True)
+            sep = load_separator(out_dir, batch_size=batch_size, segment_size=segment_size)
+            stem, seconds = _timed(lambda: separate_vocals(clip_path, out_dir, separator=sep))
+            del sep
+            audio, _ = sf.read(stem, dtype="float32")
+            if reference is None:
+                reference, reference_path = audio, stem
+            result = {"batch_size": batch_size, "segment_size": segment_size, "seconds": seconds,
+                      "snr_db": snr_db(reference, audio)}
+            logging.info(f"Autotune separation: batch {batch_size}, segment {segment_size or 'model'}: "
+                         f"{seconds:.1f}s, {result['snr_db']:.1f} dB vs default")
+            results.append(result)
+    best = _fastest(results, lambda r: r["snr_db"] >= SEPARATION_MIN_SNR_DB)
+    return {"separator_batch_size": best["batch_size"], "separator_segment_size": best["segment_size"]}, reference_path, results
+
+def _pool_throughput(audio, procs, threads, compute_type, options):
+    """Clips per second with procs ASR processes all busy (model loads excluded)."""
+    import numpy as np
+    from src.asr import open_asr_pool, _pool_transcribe
+
+    pool = open_asr_pool(procs, cpu_threads=threads, compute_type=compute_type)
+    try:
+        warm = np.zeros(16000, dtype=np.float32)
+        for f in [pool.submit(_pool_transcribe, warm, 0.0, options) for _ in range(procs)]:
+            f.result()
+        _, seconds = _timed(lambda: [f.result() for f in
+                                     [pool.submit(_pool_transcribe, audio, 0.0, options) for _ in range(procs)]])
+    finally:
+        pool.shutdown()
+    return procs / seconds
+
+def tune_asr(audio):
+    """Returns (settings, per-candidate results) for 16kHz mono audio."""
+    from src.asr import detect_device, load_whisper_model, transcribe_words, decode_options
+
+    device, _ = detect_device()
+    cpus = hardware()["cpus"]
+    types = ("float16", "int8_float16") if device == "cuda" else ("float32", "int8_float32", "int8")
+    results = []
+    reference = None
+    for compute_type in types:
+        model = load_whisper_model(cpu_threads=cpus if device == "cpu" else 0, compute_type=compute_type)
+        for beam_size in (5, 1):
+            words, seconds = _timed(lambda: transcribe_words(audio, model=model, options=decode_options(beam_size)))
+            if reference is None:
+                reference = words
+            result = {"compute_type": compute_type, "beam_size": beam_size, "seconds": seconds,
+                      "wer": word_error_rate(reference, words)}
+            logging.info(f"Autotune ASR: {compute_type}, beam {beam_size}: {seconds:.1f}s, WER {result['wer'] * 100:.1f}% vs reference")
+            results.append(result)
+        del model
+    best = _fastest(results, lambda r: r["wer"] <= ASR_MAX_WER)
+    settings = {"asr_compute_type": best["compute_type"], "beam_size": best["beam_size"], "asr_procs": 1,
+                "asr_threads": cpus if device == "cpu" else 0}
+    if device == "cuda" or cpus < 4:
+        return settings, results
+
+    # One model on every core rarely scales; compare layouts by throughput.
+    best_rate = 1.0 / best["seconds"]
+    procs = 2
+    while procs <= min(MAX_ASR_PROCS, cpus // 2):
+        threads = cpus // procs
+        rate = _pool_throughput(audio, procs, threads, best["compute_type"], decode_options(best["beam_size"]))
+        logging.info(f"Autotune ASR: {procs} processes x {threads} threads: {rate * len(audio) / 16000:.2f}x real time "
+                     f"(1 process: {best_rate * len(audio) / 16000:.2f}x)")
+        results.append({"procs": procs, "threads": threads, "clips_per_s": rate})
+        if rate > best_rate:
+            best_rate = rate
+            settings.update(asr_procs=procs, asr_threads=threads)
+        procs *= 2
+    return settings, results
+
+def run_autotune(sample_path, keep_dir=None):
+    """Calibrates on sample_path and saves the profile. Returns the settings."""
+    from src.audio import probe_file, select_best_audio_stream, extract_audio, preprocess_audio
+    from src.asr import load_16k
+
+    logging.info(f"Autotune: calibrating on the first {CLIP_S:.0f}s of {sample_path} "
+                 f"({hardware()['cpus']} CPUs on {hardware()['host']})")
+    with tempfile.TemporaryDirectory(dir=keep_dir) as work_dir:
+        clip = os.path.join(work_dir, "clip_48k.wav")
+        extract_audio(sample_path, select_best_audio_stream(probe_file(sample_path)), clip, duration_s=CLIP_S)
+        sep_settings, stem, sep_results = tune_separation(clip, work_dir)
+        final = os.path.join(work_dir, "clip_16k.wav")
+        preprocess_audio(stem, final)
+        asr_settings, asr_results = tune_asr(load_16k(final))
+
+    settings = dict(sep_settings, **asr_settings)
+    path = save_profile(settings, {"separation": sep_results, "asr": asr_results})
+    logging.info(f"Autotune profile saved to {path}: {', '.join(f'{k}={v}' for k, v in settings.items())}")
+    return settings
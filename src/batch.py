@@ -0,0 +1,147 @@
+"""
+Batch processing with cross-file stage pipelining.
+
+Stages (extract -> separate -> transcribe -> finish) run in their own worker
+threads connected by bounded queues, so while file N is transcribed, file N+1
+is being separated and file N+2 extracted. Each separate/transcribe worker
+loads its model once and keeps it resident for the whole batch.
+"""
+import os
+import queue
+import logging
+import threading
+
+from src.pipeline import (
+    new_job, stage_extract, stage_separate, stage_transcribe, stage_finish,
+    load_asr_backend, close_asr_backend,
+)
+
+MEDIA_EXTENSIONS = (
+    ".mkv", ".mp4", ".m4v", ".mov", ".avi", ".webm", ".ts", ".m2ts",
+    ".wav", ".flac", ".mp3", ".m4a", ".aac", ".ogg", ".opus",
+)
+
+_DONE = object()
+
+def collect_inputs(paths):
+    """
+    Expands directories (non-recursive, sorted) into media files.
+    Plain file paths are kept in the order given.
+    """
+    files = []
+    for p in paths:
+        p = os.path.abspath(p)
+        if os.path.isdir(p):
+            for name in sorted(os.listdir(p)):
+                full = os.path.join(p, name)
+                if os.path.isfile(full) and name.lower().endswith(MEDIA_EXTENSIONS):
+                    files.append(full)
+        elif os.path.isfile(p):
+            files.append(p)
+        else:
+            raise FileNotFoundError(f"Input not found: {p}")
+    return files
+
+def output_path_for(input_path, output_dir):
+    base_name = os.path.splitext(os.path.basename(input_path))[0]
+    out_dir = output_dir or os.path.dirname(input_path)
+    return os.path.join(out_dir, f"{base_name}.srt")
+
+def _stage_worker(name, fn, in_q, out_q, failures, init=None, close=None, eager=False):
+    resource = None
+    if eager and init is not None:
+        # Warm up while the first file is still being extracted; on failure retry per job below.
+        try:
+            resource = init()
+        except Exception as e:
+            logging.warning(f"[{name}] model warmup failed: {e}")
+    while True:
+        job = in_q.get()
+        if job is _DONE:
+            if close is not None and resource is not None:
+                close(resource)
+            return
+        try:
+            # Without warmup (or after it failed) load on the first job, so an idle stage holds no model.
+            if init is not None and resource is None:
+                resource = init()
+            job = fn(job, resource)
+        except Exception as e:
+            logging.error(f"[{name}] {os.path.basename(job['input'])} failed: {e}")
+            failures.append((job["input"], name, e))
+            continue
+        if out_q is not None:
+            # stage_extract fans a file out into one job per selected stream.
+            for out in (job if isinstance(job, list) else [job]):
+                out_q.put(out)
+
+def run_batch(inputs, work_dir, args, output_dir=None):
+    """
+    Processes all inputs through the pipelined stages.
+    Returns a list of (input_path, stage, exception) for files that failed.
+    """
+    from src.separator import load_separator, separator_options
+    from src.cache import open_cache
+
+    keep_temp = getattr(args, "keep_temp", False)
+    cache = open_cache(args)
+
+    def finish(job, _):
+        job = stage_finish(job, args)
+        if not keep_temp:
+            # Intermediates of a whole season do not fit on disk; drop them as we go.
+            import shutil
+            shutil.rmtree(job["work_dir"], ignore_errors=True)
+        return job
+
+    # (name, fn, workers, depth of the queue feeding this stage, model loader, model release)
+    stages = [
+        ("extract", lambda job, _: stage_extract(job, args),
+         getattr(args, "extract_workers", 1), 0, None, None),
+        ("separate", lambda job, sep: stage_separate(job, args, separator=sep),
+         getattr(args, "separate_workers", 1), getattr(args, "separate_queue", 1),
+         lambda: load_separator(work_dir, **separator_options(args)), None),
+        ("transcribe", lambda job, model: stage_transcribe(job, args, model=model),
+         getattr(args, "asr_workers", 1), getattr(args, "asr_queue", 1),
+         lambda: load_asr_backend(args), close_asr_backend),
+        ("finish", finish,
+         getattr(args, "finish_workers", 1), getattr(args, "finish_queue", 2), None, None),
+    ]
+
+    # Models load when their worker starts, overlapping the first extractions.
+    eager = not getattr(args, "no_warmup", False)
+    queues = [queue.Queue(maxsize=max(0, stage[3])) for stage in stages]
+    failures = []
+    threads = []
+    for k, (name, fn, workers, _, init, close) in enumerate(stages):
+        out_q = queues[k + 1] if k + 1 < len(stages) else None
+        stage_threads = [
+            threading.Thread(
+                target=_stage_worker, args=(name, fn, queues[k], out_q, failures, init, close, eager),
+                name=f"{name}-{n}", daemon=True
+            )
+            for n in range(max(1, workers))
+        ]
+        for t in stage_threads: t.start()
+        threads.append(stage_threads)
+
+    logging.info(f"Batch: {len(inputs)} files.")
+    job_metrics = []
+    for i, input_path in enumerate(inputs):
+        job_dir = os.path.join(work_dir, f"{i:04d}")
+        os.makedirs(job_dir, exist_ok=True)
+        job = new_job(input_path, output_path_for(input_path, output_dir), job_dir, cache=cache)
+        job_metrics.append(job["metrics"])
+        queues[0].put(job)
+
+    # Shut down stage by stage so every queued job drains before its consumers exit.
+    for k, stage_threads in enumerate(threads):
+        for _ in stage_threads: queues[k].put(_DONE)
+        for t in stage_threads: t.join()
+
+    logging.info(f"Batch complete: {len(inputs) - len(failures)}/{len(inputs)} succeeded.")
+    if cache is not None:
+        cache.report()
+    from src.metrics import write_reports
+    write_reports(job_metrics, args)
+    return failures
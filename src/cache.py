@@ -0,0 +1,200 @@
+"""
+Content-addressed cache for expensive pipeline stages.
+
+Entries are keyed by a hash of the input file's content, the selected
+stream and every parameter of the stage and the stages before it, so a
+change anywhere upstream produces a new key. Stored artifacts are the
+separated vocals, the 16kHz audio and the raw ASR word list. The cache
+directory is bounded in size and evicts least recently used entries.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "LIVESUBS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "livesubs")
+)
+DEFAULT_MAX_GB = 20.0
+HASH_CHUNK_BYTES = 8 << 20
+
+def make_key(stage, *parts, **params):
+    """Builds a stable key from a stage name, parent keys and parameters."""
+    payload = json.dumps([stage, list(parts), params], sort_keys=True, default=str)
+    return f"{stage}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]}"
+
+class StageCache:
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=int(DEFAULT_MAX_GB * 1e9), refresh=False):
+        self.root = root
+        self.max_bytes = max_bytes
+        # refresh: never read entries, but still write fresh ones.
+        self.refresh = refresh
+        self.stats = {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, "entries"), exist_ok=True)
+
+    # --- keys -------------------------------------------------------------
+
+    def file_hash(self, path):
+        """
+        Content hash of a media file. Hashes are memoized by (path, size, mtime)
+        so unchanged files are only read once.
+        """
+        st = os.stat(path)
+        memo_key = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+        memo_path = os.path.join(self.root, "file_hashes.json")
+        with self._lock:
+            memo = self._read_json(memo_path) or {}
+        if memo_key in memo:
+            return memo[memo_key]
+
+        logging.info(f"Hashing {path} for cache lookup...")
+        h = hashlib.blake2b(digest_size=20)
+        with open(path, "rb") as f:
+            while True:
+                chunk = f.read(HASH_CHUNK_BYTES)
+                if not chunk:
+                    break
+                h.update(chunk)
+        digest = h.hexdigest()
+
+        with self._lock:
+            memo = self._read_json(memo_path) or {}
+            memo[memo_key] = digest
+            # Batch threads, shard workers and the daemon share this file:
+            # readers must never see it half written.
+            self._write_json_atomic(memo_path, memo)
+        return digest
+
+    # --- lookups ----------------------------------------------------------
+
+    def _entry(self, key, suffix):
+        return os.path.join(self.root, "entries", key + suffix)
+
+    def _hit(self, key, suffix):
+        path = self._entry(key, suffix)
+        stage = key.split("-", 1)[0]
+        hit = not self.refresh and os.path.exists(path)
+        with self._lock:
+            counts = self.stats.setdefault(stage, {"hits": 0, "misses": 0})
+            counts["hits" if hit else "misses"] += 1
+        if not hit:
+            return None
+        # mtime doubles as the LRU timestamp.
+        os.utime(path)
+        logging.info(f"Cache hit: {stage} ({key})")
+        return path
+
+    def get_file(self, key, suffix=".wav"):
+        return self._hit(key, suffix)
+
+    def get_json(self, key):
+        path = self._hit(key, ".json")
+        return self._read_json(path) if path else None
+
+    def get_array(self, key):
+        path = self._hit(key, ".npy")
+        if not path:
+            return None
+        import numpy as np
+        return np.load(path)
+
+    # --- stores -----------------------------------------------------------
+
+    def _publish(self, key, suffix, write):
+        dest = self._entry(key, suffix)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(dest), suffix=".tmp")
+        os.close(fd)
+        try:
+            write(tmp)
+            os.replace(tmp, dest)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        self.evict()
+        return dest
+
+    def put_file(self, key, src_path, suffix=".wav"):
+        return self._publish(key, suffix, lambda tmp: shutil.copyfile(src_path, tmp))
+
+    def put_json(self, key, data):
+        return self._publish(key, ".json", lambda tmp: self._write_json(tmp, data))
+
+    def put_array(self, key, array):
+        import numpy as np
+        def write(tmp):
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+        return self._publish(key, ".npy", write)
+
+    # --- maintenance ------------------------------------------------------
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits max_bytes."""
+        entries_dir = os.path.join(self.root, "entries")
+        with self._lock:
+            entries = []
+            for name in os.listdir(entries_dir):
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(entries_dir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+            total = sum(size for _, size, _ in entries)
+            entries.sort()
+            while total > self.max_bytes and entries:
+                _, size, path = entries.pop(0)
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                logging.info(f"Cache evicted {os.path.basename(path)} ({size / 1e6:.1f} MB)")
+
+    def report(self):
+        if not self.stats:
+            return
+        parts = [f"{stage} {c['hits']} hit/{c['misses']} miss" for stage, c in sorted(self.stats.items())]
+        logging.info("Cache: " + ", ".join(parts))
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    @staticmethod
+    def _write_json(path, data):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    @classmethod
+    def _write_json_atomic(cls, path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        os.close(fd)
+        try:
+            cls._write_json(tmp, data)
+            os.replace(tmp, path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+def open_cache(args):
+    """Creates the StageCache requested by CLI args, or None with --no-cache."""
+    if getattr(args, "no_cache", False):
+        return None
+    root = getattr(args, "cache_dir", None) or DEFAULT_CACHE_DIR
+    max_gb = getattr(args, "cache_size_gb", None) or DEFAULT_MAX_GB
+    # On by default and it holds full-length WAV stems; say where and how big.
+    logging.info(f"Stage cache: {root} (up to {max_gb:g} GB; --no-cache to disable, --cache-size-gb to limit)")
+    return StageCache(root, max_bytes=int(max_gb * 1e9), refresh=getattr(args, "refresh", False))
@@ -0,0 +1,287 @@
+"""
+Columnar event store for post-processing long inputs.
+
+Words live in flat NumPy columns (start, end, interned text id) and each
+event is a contiguous word range plus start/end columns. The offset,
+linger and gap/min-duration passes become whole-array operations, and
+merging marks events dead and relinks neighbours instead of removing
+them from a list. The passes do the same float arithmetic in the same
+order as the dict-based functions in src.postprocess, so results are
+identical.
+
+The pipeline keeps one table from post-processing to write_srt; dict
+events are only built for the stages that edit single lines (Gemini,
+fingerprint reuse, time-range splicing).
+"""
+import copy
+import numpy as np
+
+class EventTable:
+    def __init__(self, word_start, word_end, word_text, texts, ev_lo, ev_hi, ev_start, ev_end, words=None, events=None):
+        # Word columns.
+        self.word_start = word_start
+        self.word_end = word_end
+        self.word_text = word_text          # index into texts
+        self.texts = texts                  # interned, stripped word strings
+        self.text_len = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        # Event columns: words [ev_lo, ev_hi) belong to the event.
+        self.ev_lo = ev_lo
+        self.ev_hi = ev_hi
+        self.ev_start = ev_start
+        self.ev_end = ev_end
+        self.ev_text = [""] * len(ev_lo)
+        # Source event of each row; a merge keeps the surviving event's id.
+        self.ev_id = np.arange(len(ev_lo))
+        # Original word and event dicts, kept when built from dict events so
+        # to_events() hands back the same objects (with any extra keys).
+        self.words = words
+        self.events = events
+
+    @classmethod
+    def from_events(cls, events, keep_words=True):
+        flat = [w for ev in events for w in ev["words"]]
+        counts = np.fromiter((len(ev["words"]) for ev in events), dtype=np.int64, count=len(events))
+        ev_hi = np.cumsum(counts)
+        intern = {}
+        word_ids = [intern.setdefault((w.get("word") or "").strip(), len(intern)) for w in flat]
+        return cls(
+            np.fromiter((w["start"] for w in flat), dtype=np.float64, count=len(flat)),
+            np.fromiter((w["end"] for w in flat), dtype=np.float64, count=len(flat)),
+            np.asarray(word_ids, dtype=np.int32), list(intern), ev_hi - counts, ev_hi,
+            np.fromiter((ev["start"] for ev in events), dtype=np.float64, count=len(events)),
+            np.fromiter((ev["end"] for ev in events), dtype=np.float64, count=len(events)),
+            words=flat if keep_words else None, events=events if keep_words else None,
+        )
+
+    def copy(self):
+        """Fresh event columns over the shared word columns, which no pass changes."""
+        table = copy.copy(self)
+        table.ev_lo, table.ev_hi = self.ev_lo.copy(), self.ev_hi.copy()
+        table.ev_start, table.ev_end = self.ev_start.copy(), self.ev_end.copy()
+        table.ev_text, table.ev_id = list(self.ev_text), self.ev_id.copy()
+        return table
+
+    def __len__(self):
+        return len(self.ev_lo)
+
+    def word_event(self):
+        """Event index of every word."""
+        return np.repeat(np.arange(len(self.ev_lo)), self.ev_hi - self.ev_lo)
+
+    def event_text_len(self):
+        """len(" ".join(words)) per event, from a prefix sum over word lengths."""
+        csum = np.concatenate(([0], np.cumsum(self.text_len[self.word_text])))
+        n = self.ev_hi - self.ev_lo
+        return np.where(n > 0, csum[self.ev_hi] - csum[self.ev_lo] + n - 1, 0)
+
+    def event_tokens(self, k):
+        return [self.texts[t] for t in self.word_text[self.ev_lo[k]:self.ev_hi[k]]]
+
+    def rows(self):
+        """{"start", "end", "text"} per event: what the SRT and the fingerprint index keep."""
+        return [{"start": s, "end": e, "text": t.strip()}
+                for s, e, t in zip(self.ev_start.tolist(), self.ev_end.tolist(), self.ev_text)]
+
+    def to_events(self):
+        """
+        Dict events for the current rows. When built from dict events, the
+        surviving source dicts are updated in place, like the dict passes do.
+        """
+        events = []
+        starts, ends, ids = self.ev_start.tolist(), self.ev_end.tolist(), self.ev_id.tolist()
+        for k, (lo, hi) in enumerate(zip(self.ev_lo.tolist(), self.ev_hi.tolist())):
+            if self.words is not None:
+                words = self.words[lo:hi]
+            else:
+                words = [
+                    {"word": self.texts[self.word_text[j]], "start": float(self.word_start[j]), "end": float(self.word_end[j])}
+                    for j in range(lo, hi)
+                ]
+            ev = self.events[ids[k]] if self.events is not None else {}
+            ev["start"] = starts[k]
+            ev["end"] = ends[k]
+            ev["words"] = words
+            ev["text"] = self.ev_text[k]
+            events.append(ev)
+        return events
+
+def apply_global_start_offset(table, offset_ms=50):
+    start = table.ev_start + offset_ms / 1000.0
+    table.ev_start = start
+    table.ev_end = np.where(start >= table.ev_end, start + 0.1, table.ev_end)
+    return table
+
+def apply_extension_then_merge(table, target_cps=22.0, max_silence_s=1.0, max_chars_total=84, min_gap=0.084):
+    """
+    Same walk as the dict version, over a linked list of event indices.
+    Merged-away events are marked dead and compacted out once at the end.
+    """
+    n = len(table)
+    if not n: return table
+    start = table.ev_start.tolist()
+    end = table.ev_end.tolist()
+    lens = table.event_text_len().tolist()
+    lo = table.ev_lo.tolist()
+    hi = table.ev_hi.tolist()
+    nxt = list(range(1, n + 1)); nxt[-1] = -1
+    prv = list(range(-1, n - 1))
+    alive = [True] * n
+
+    i = 0
+    while i != -1:
+        txt_len = lens[i]
+        dur = end[i] - start[i]
+        cps = txt_len / max(0.1, dur)
+        if cps <= target_cps and dur >= 1.0:
+            i = nxt[i]; continue
+        j = nxt[i]
+        gap_next = (start[j] - end[i]) if j != -1 else 999.0
+        needed = txt_len / target_cps
+        missing = max(0, needed - dur)
+        if dur + missing < 1.0: missing = 1.0 - dur
+        extended = False
+        if missing > 0:
+            rn = max(0, gap_next - min_gap)
+            if rn > 0:
+                take_next = min(missing, rn)
+                end[i] += take_next
+                if take_next >= missing or take_next > 0.3: extended = True
+        if extended: i = nxt[i]; continue
+        merged = False
+        p = prv[i]
+        gap_prev = (start[i] - end[p]) if p != -1 else 999.0
+        gap_next = (start[j] - end[i]) if j != -1 else 999.0
+        if min(gap_prev, gap_next) <= max_silence_s:
+            if gap_prev <= gap_next:
+                a, b = p, i
+            else:
+                a, b = i, j
+            new_len = lens[a] + lens[b] + 1 if hi[a] > lo[a] and hi[b] > lo[b] else lens[a] + lens[b]
+            if new_len <= max_chars_total:
+                # b's words directly follow a's, so the merged range stays contiguous.
+                hi[a] = hi[b]; end[a] = end[b]; lens[a] = new_len
+                alive[b] = False
+                nxt[a] = nxt[b]
+                if nxt[b] != -1: prv[nxt[b]] = a
+                merged = True
+                # Merging into prev re-examines prev; merging next re-examines this event.
+                i = a
+        if not merged: i = nxt[i]
+
+    keep = np.asarray(alive)
+    table.ev_start = np.asarray(start)[keep]
+    table.ev_end = np.asarray(end)[keep]
+    table.ev_lo = np.asarray(lo, dtype=np.int64)[keep]
+    table.ev_hi = np.asarray(hi, dtype=np.int64)[keep]
+    table.ev_text = [t for t, k in zip(table.ev_text, alive) if k]
+    table.ev_id = table.ev_id[keep]
+    return table
+
+def apply_hybrid_linger_with_report(table, linger_ms=600, min_gap=0.084):
+    linger_s = linger_ms / 1000.0
+    MIN_GAP = min_gap
+    CHAIN_THRESHOLD = 0.500
+    FORBIDDEN_MIDPOINT = (MIN_GAP + CHAIN_THRESHOLD) / 2.0
+    if not len(table): return table
+    start, end = table.ev_start, table.ev_end
+
+    # Every new end depends only on its own end and the next start, which
+    # this pass never changes, so all events are updated at once.
+    next_start = start[1:]
+    desired_end = end[:-1] + linger_s
+    potential_gap = next_start - desired_end
+    new_end = np.select(
+        [potential_gap >= CHAIN_THRESHOLD, potential_gap <= MIN_GAP, potential_gap < FORBIDDEN_MIDPOINT],
+        [desired_end, next_start - MIN_GAP, next_start - MIN_GAP],
+        next_start - CHAIN_THRESHOLD,
+    )
+    new_end = np.where(new_end <= start[:-1], start[:-1] + 0.1, new_end)
+    table.ev_end = np.concatenate((new_end, end[-1:] + linger_s))
+    return table
+
+def enforce_timing_constraints(table, min_dur=1.0, min_gap=0.084):
+    if not len(table): return table
+    start, end = table.ev_start, table.ev_end.copy()
+
+    cur_start, cur_end, nxt_start = start[:-1], end[:-1], start[1:]
+    cur_end = np.where(nxt_start - cur_end < min_gap, nxt_start - min_gap, cur_end)
+    max_end = nxt_start - min_gap
+    desired_end = cur_start + min_dur
+    cur_end = np.where(desired_end > cur_end, np.where(desired_end <= max_end, desired_end, max_end), cur_end)
+    cur_end = np.where(cur_end <= cur_start, cur_start + 0.1, cur_end)
+    end[:-1] = cur_end
+
+    # Last event: only minimum duration.
+    if end[-1] - start[-1] < min_dur:
+        end[-1] = start[-1] + min_dur
+    if end[-1] <= start[-1]:
+        end[-1] = start[-1] + 0.1
+    table.ev_end = end
+    return table
+
+def balanced_split_indices(table, max_chars=42):
+    """
+    get_balanced_split_index for every event at once: each word is scored as
+    the last word of line one, and the first best cut per event wins.
+    Events with fewer than two words get their word count.
+    """
+    from src.postprocess import HARD_PUNCT, SOFT_PUNCT
+    lo, hi = table.ev_lo, table.ev_hi
+    n = hi - lo
+    cuts = n.copy()
+    multi = n >= 2
+    if not multi.any(): return cuts
+
+    csum = np.concatenate(([0], np.cumsum(table.text_len[table.word_text])))
+    ev = table.word_event()
+    j = np.arange(len(table.word_text))
+    count1 = j - lo[ev] + 1
+    prefix = csum[j + 1] - csum[lo[ev]]
+    len1 = prefix + count1 - 1
+    len2 = (csum[hi[ev]] - csum[lo[ev]] - prefix) + (n[ev] - count1) - 1
+
+    bonus = np.fromiter(
+        (5 if t.endswith(HARD_PUNCT) else 3 if t.endswith(SOFT_PUNCT) else 0 for t in table.texts),
+        dtype=np.float64, count=len(table.texts),
+    )
+    score = -5000.0 * (len1 > max_chars) - 5000.0 * (len2 > max_chars)
+    score = score - np.abs(len1 - len2) * 5.0 + bonus[table.word_text] + (len2 >= len1)
+    # The last word of an event cannot end line one.
+    score[(count1 == n[ev]) | ~multi[ev]] = -np.inf
+
+    starts = lo[multi]
+    best = np.maximum.reduceat(score, starts)
+    rank = np.cumsum(multi) - 1
+    at_best = (score == best[rank[ev]]) & multi[ev]
+    first = np.minimum.reduceat(np.where(at_best, j, len(j)), starts)
+    cuts[multi] = first - starts + 1
+    return cuts
+
+def shape_texts(table, max_chars=42):
+    cuts = balanced_split_indices(table, max_chars)
+    words = [table.texts[t] for t in table.word_text.tolist()]
+    texts = []
+    for lo, hi, cut in zip(table.ev_lo.tolist(), table.ev_hi.tolist(), cuts.tolist()):
+        if hi - lo >= 2:
+            cut += lo
+            texts.append(f"{' '.join(words[lo:cut])}\n{' '.join(words[cut:hi])}".strip())
+        else:
+            texts.append(" ".join(words[lo:hi]))
+    table.ev_text = texts
+    return table
+
+def run_post_processing(table, target_cps=22.0, max_chars_total=84, linger_ms=600, min_gap=0.084):
+    # Defaults are the pipeline's; other values come from src.sweep.
+    table = apply_global_start_offset(table, offset_ms=50)
+    table = apply_extension_then_merge(table, target_cps=target_cps, max_chars_total=max_chars_total, min_gap=min_gap)
+    table = apply_hybrid_linger_with_report(table, linger_ms=linger_ms, min_gap=min_gap)
+    table = shape_texts(table, max_chars=42)
+    table = enforce_timing_constraints(table, min_dur=1.0, min_gap=min_gap)
+    return table
+
+def write_srt(table, out_path):
+    """postprocess.write_srt straight from the columns; texts come from shape_texts."""
+    from src.postprocess import _fmt_ms
+    with open(out_path, "w", encoding="utf-8") as f:
+        for i, row in enumerate(table.rows(), 1):
+            f.write(f"{i}\n{_fmt_ms(row['start'])} --> {_fmt_ms(row['end'])}\n{row['text']}\n\n")
@@ -0,0 +1,234 @@
+"""
+Audio fingerprint index for recurring segments (openings, endings, recaps).
+
+Each processed file is fingerprinted from its extracted mix: the two most
+prominent spectral peaks per 64 ms frame (8 kHz mono), paired with peaks a
+few frames later into 24-bit (f1, f2, dt) hashes. The hashes, the output SRT
+path and the final events are stored per file in SQLite, grouped by series.
+
+A new file is matched against the other files of its series: hash hits are
+grouped by time offset, and a run of hits at one offset lasting at least
+MIN_SPAN_S is a shared segment. For such a span the pipeline skips
+separation and ASR and reuses the earlier file's subtitle events, shifted by
+the offset. They are read from that file's SRT when it still exists, so
+hand fixes carry over.
+"""
+import os
+import json
+import sqlite3
+import logging
+import numpy as np
+
+FP_RATE = 8000
+N_FFT = 1024
+HOP = 512
+FPS = FP_RATE / HOP
+BAND_EDGES = (8, 16, 32, 64, 128, 256, 512)     # FFT bins, ~60 Hz - 4 kHz
+PEAKS_PER_FRAME = 2
+PAIR_DTS = (2, 5)                                # frames between paired peaks
+MIN_RMS = 1e-4                                   # quieter frames carry no hashes
+BLOCK_FRAMES = 4096
+
+MIN_SPAN_S = 20.0       # shortest segment worth reusing
+MAX_GAP_S = 3.0         # hit-free stretch that ends a run
+EDGE_GAP_S = 0.5        # runs start and end on hits this close together
+MIN_HITS_PER_S = 2.0
+MAX_BUCKET = 8          # hashes this common in one file are ignored
+EDGE_MARGIN_S = 1.0     # fresh ASR covers the edges of a reused span
+
+def spectral_peaks(audio):
+    """(frames, PEAKS_PER_FRAME) peak bins and a mask of frames loud enough to use."""
+    n_frames = max(0, 1 + (len(audio) - N_FFT) // HOP)
+    peaks = np.zeros((n_frames, PEAKS_PER_FRAME), dtype=np.uint32)
+    valid = np.zeros(n_frames, dtype=bool)
+    window = np.hanning(N_FFT).astype(np.float32)
+    bands = list(zip(BAND_EDGES[:-1], BAND_EDGES[1:]))
+    for start in range(0, n_frames, BLOCK_FRAMES):
+        stop = min(n_frames, start + BLOCK_FRAMES)
+        idx = np.arange(start, stop)[:, None] * HOP + np.arange(N_FFT)
+        frames = audio[idx]
+        valid[start:stop] = np.sqrt(np.mean(frames ** 2, axis=1)) > MIN_RMS
+        mag = np.log(np.abs(np.fft.rfft(frames * window, axis=1)) + 1e-6)
+        # Strongest bin per band, ranked by how far it stands out of its band;
+        # frame-local so the same audio hashes the same at any position.
+        band_bins = np.stack([lo + np.argmax(mag[:, lo:hi], axis=1) for lo, hi in bands], axis=1)
+        rows = np.arange(stop - start)[:, None]
+        prominence = mag[rows, band_bins] - np.stack([mag[:, lo:hi].mean(axis=1) for lo, hi in bands], axis=1)
+        best = np.argsort(-prominence, axis=1, kind="stable")[:, :PEAKS_PER_FRAME]
+        peaks[start:stop] = np.take_along_axis(band_bins, best, axis=1)
+    return peaks, valid
+
+def fingerprint(audio):
+    """
+    Hashes of 8 kHz mono audio. Returns (hashes, frames) as uint32 arrays,
+    sorted by hash.
+    """
+    peaks, valid = spectral_peaks(np.asarray(audio, dtype=np.float32))
+    hashes, frames = [], []
+    for dt in PAIR_DTS:
+        if len(peaks) <= dt:
+            continue
+        ok = valid[:-dt] & valid[dt:]
+        t = np.nonzero(ok)[0].astype(np.uint32)
+        for a in range(PEAKS_PER_FRAME):
+            for b in range(PEAKS_PER_FRAME):
+                hashes.append((peaks[t, a] << 15) | (peaks[t + dt, b] << 6) | dt)
+                frames.append(t)
+    if not hashes:
+        return np.zeros(0, np.uint32), np.zeros(0, np.uint32)
+    hashes, frames = np.concatenate(hashes).astype(np.uint32), np.concatenate(frames)
+    order = np.argsort(hashes, kind="stable")
+    return hashes[order], frames[order]
+
+def fingerprint_audio(source, sample_rate=None):
+    """Fingerprint of a media path or a (frames, channels) array at sample_rate."""
+    from src.audio import resample_mono
+    return fingerprint(resample_mono(source, FP_RATE, sample_rate))
+
+def match_spans(new_hashes, new_frames, old_hashes, old_frames):
+    """
+    Segments the two fingerprints share (old ones sorted by hash). Returns
+    [(start_s, end_s, offset_s)] on the new file's timeline, offset_s being
+    new time minus old time, longest first and not overlapping.
+    """
+    left = np.searchsorted(old_hashes, new_hashes, "left")
+    right = np.searchsorted(old_hashes, new_hashes, "right")
+    counts = right - left
+    counts[counts > MAX_BUCKET] = 0
+    total = int(counts.sum())
+    if total == 0:
+        return []
+    new_idx = np.repeat(np.arange(len(new_hashes)), counts)
+    within = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    old_idx = np.repeat(left, counts) + within
+    t_new = new_frames[new_idx].astype(np.int64)
+    offsets = t_new - old_frames[old_idx].astype(np.int64)
+
+    # Hits per offset, allowing one frame of jitter either side.
+    base = offsets.min()
+    hist = np.bincount(offsets - base)
+    smooth = np.convolve(hist, np.ones(3, dtype=np.int64), mode="same")
+    min_hits = int(MIN_SPAN_S * MIN_HITS_PER_S)
+    candidates = [int(k) for k in np.argsort(-smooth, kind="stable") if smooth[k] >= min_hits]
+
+    spans = []
+    taken = []
+    max_gap = int(MAX_GAP_S * FPS)
+    edge_gap = int(EDGE_GAP_S * FPS)
+    for k in candidates:
+        if any(abs(k - j) <= 2 for j in taken):
+            continue
+        taken.append(k)
+        times = np.unique(t_new[np.abs(offsets - base - k) <= 1])
+        breaks = np.nonzero(np.diff(times) > max_gap)[0]
+        for run in np.split(times, breaks + 1):
+            # Stray hits at the run's ends would stretch it into fresh dialogue.
+            dense = np.nonzero(np.diff(run) <= edge_gap)[0]
+            if not len(dense):
+                continue
+            run = run[dense[0]:dense[-1] + 2]
+            start_s, end_s = run[0] / FPS, (run[-1] + 1) / FPS + N_FFT / FP_RATE
+            if end_s - start_s >= MIN_SPAN_S and len(run) >= MIN_HITS_PER_S * (end_s - start_s):
+                spans.append((float(start_s), float(end_s), float((k + base) / FPS)))
+
+    result = []
+    for span in sorted(spans, key=lambda s: s[0] - s[1]):
+        if all(span[1] <= s[0] or span[0] >= s[1] for s in result):
+            result.append(span)
+    return result
+
+class FingerprintIndex:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS episodes ("
+                "series TEXT, source TEXT, hashes BLOB, frames BLOB, output TEXT, events TEXT, "
+                "PRIMARY KEY (series, source))"
+            )
+
+    def _connect(self):
+        # One short-lived connection per call, like the correction memo.
+        return sqlite3.connect(self.path, timeout=30)
+
+    def add(self, series, source, hashes, frames, output, events):
+        from src.postprocess import shape_block_text
+        stored = [{"start": ev["start"], "end": ev["end"],
+                   "text": ev.get("text", "").strip() or (shape_block_text(ev["words"]) if "words" in ev else "")}
+                  for ev in events]
+        with self._connect() as db:
+            db.execute(
+                "INSERT OR REPLACE INTO episodes VALUES (?, ?, ?, ?, ?, ?)",
+                (series, source, hashes.astype("<u4").tobytes(), frames.astype("<u4").tobytes(),
+                 output, json.dumps(stored)),
+            )
+
+    def find(self, series, hashes, frames, exclude_input=None):
+        """
+        Shared segments with other files of the series, as match dicts sorted
+        by start. Sources are "<input>#<stream>"; streams of exclude_input are
+        skipped, since dubs of one file share their whole music track.
+        """
+        with self._connect() as db:
+            sources = [r[0] for r in db.execute("SELECT source FROM episodes WHERE series = ?", (series,))
+                       if r[0].rpartition("#")[0] != exclude_input]
+        matches = []
+        for source in sources:
+            # One file's hashes in memory at a time.
+            with self._connect() as db:
+                row = db.execute(
+                    "SELECT hashes, frames, output, events FROM episodes WHERE series = ? AND source = ?",
+                    (series, source),
+                ).fetchone()
+            old_hashes, old_frames = np.frombuffer(row[0], "<u4"), np.frombuffer(row[1], "<u4")
+            for start_s, end_s, offset_s in match_spans(hashes, frames, old_hashes, old_frames):
+                matches.append({"source": source, "start": start_s, "end": end_s, "offset": offset_s,
+                                "output": row[2], "events": row[3]})
+        result = []
+        for m in sorted(matches, key=lambda m: m["start"] - m["end"]):
+            if all(m["end"] <= r["start"] or m["start"] >= r["end"] for r in result):
+                result.append(m)
+        return sorted(result, key=lambda m: m["start"])
+
+def reused_events(match, margin_s=EDGE_MARGIN_S):
+    """
+    Events of the earlier file inside a match, shifted onto the new timeline,
+    and the (start, end) span they let us skip. Lines crossing the span's
+    edges are left to fresh ASR.
+    """
+    from src.postprocess import read_srt
+
+    if match["output"] and os.path.isfile(match["output"]):
+        old_events = read_srt(match["output"])
+    else:
+        old_events = json.loads(match["events"])
+    offset = match["offset"]
+    lo, hi = match["start"] + margin_s, match["end"] - margin_s
+    events = []
+    for ev in old_events:
+        start, end = ev["start"] + offset, ev["end"] + offset
+        if start >= lo and end <= hi:
+            events.append({"start": start, "end": end, "text": ev["text"], "reused": match["source"]})
+        elif start < lo < end:
+            lo = end
+        elif start < hi < end:
+            hi = start
+    if hi - lo < MIN_SPAN_S / 2:
+        return [], None
+    return [ev for ev in events if ev["start"] >= lo and ev["end"] <= hi], (lo, hi)
+
+def open_fingerprint_index(args):
+    """The index lives in the cache directory; only used with --fingerprint."""
+    from src.cache import DEFAULT_CACHE_DIR
+    if not getattr(args, "fingerprint", False):
+        return None
+    root = getattr(args, "cache_dir", None) or DEFAULT_CACHE_DIR
+    return FingerprintIndex(os.path.join(root, "fingerprints.sqlite"))
+
+def report_reuse(spans, total_s):
+    skipped = sum(e - s for s, e in spans)
+    logging.info(
+        f"Fingerprint: {len(spans)} known segment(s), {skipped:.0f}s of {total_s:.0f}s "
+        f"({skipped / max(total_s, 1e-9) * 100:.1f}%) reuse earlier subtitles."
+    )
@@ -3,119 +3,440 @@ Gemini API integration for text correction.
 
 Handles subtitle text correction using Google's Gemini API,
 including spelling fixes, typo corrections, and style guide enforcement.
+
+By default the whole 16kHz track and every line go out in one request.
+With chunk_lines set, lines are corrected in windows of that many lines
+(plus a few context lines either side), each with only its own audio
+slice, on a bounded thread pool; a long gap between lines also starts a
+new window. A window that still fails after retries keeps its ASR text.
+Any object with the genai.Client files.upload / files.get /
+models.generate_content interface can be passed as client.
+
+Audio is uploaded as 16kHz mono Opus (or FLAC) rather than PCM WAV. An
+UploadRegistry remembers uploads by content hash until shortly before
+Gemini expires them, so re-runs of unchanged audio upload nothing.
+
+With a CorrectionMemo (src.memo), lines corrected before in the same
+series are applied locally and only the rest are sent. With a confidence
+threshold, only lines Whisper was unsure about go out, with a few context
+lines around them. IDs always index the full event list.
 """
+import io
 import os
+import json
+import time
+import random
+import hashlib
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from google import genai
 from google.genai import types
 from src.postprocess import reshape_text_string
 
 MODEL_ID = os.environ.get("GEMINI_MODEL_ID", "gemini-2.0-flash")
+SAMPLE_RATE = 16000
+
+# Chunked mode
+CONTEXT_LINES = 3       # read-only lines sent on each side of a window
+SLICE_PAD_S = 1.0       # audio kept around the window's first/last line
+WINDOW_GAP_S = 30.0     # a longer gap between target lines starts a new window
+RETRIES = 3
+BACKOFF_S = 2.0
+
+# Confidence filter: besides the word probability threshold, lines from
+# doubtful Whisper segments are always sent.
+LOW_AVG_LOGPROB = -1.0
+HIGH_NO_SPEECH_PROB = 0.6
+
+# Uploads
+DEFAULT_CODEC = "opus"
+FILE_TTL_S = 48 * 3600      # Gemini keeps uploaded files for 48 hours
+REUSE_MARGIN_S = 3600       # do not hand out files about to expire
+
+PROMPT = """
+You are a professional subtitle editor.
+I will provide a list of subtitle lines in the format 'ID|Text'.
+The audio file is provided for context.
+
+TASK:
+1. Listen to the audio to identify correct Name spellings (Context: Anime).
+   * Pay attention to Character Names, Locations, and specific Terminology.
+   * Maintain standard romanization for Japanese (Anime) names (e.g. 'Satou', 'Kyouma').
+2. Fix phonetic typos and capitalization.
+3. STRICTLY follow the STYLE GUIDE below.
+
+STYLE GUIDE:
+- Ellipses: Use the single char (…, U+2026). Do NOT use three dots.
+  * Use to indicate trailing off or pauses >2s.
+  * NO space after ellipsis at start of line (e.g., "…and then").
+- Numbers & Decades:
+  * Decades: "1950s" or "'50s".
+  * Ages: Always use numerals (e.g., "He is 5").
+  * Times: "9:30 a.m.", "a.m./p.m." (lowercase). Spell out "noon", "midnight", "half past", "quarter of".
+  * "o'clock": Spell out the number (e.g., "eleven o'clock").
+- Punctuation:
+  * Exclamation marks (!): Use ONLY for shouting/surprise. Avoid overuse.
+  * Interrobangs (?!): Allowed for emphatic disbelief (e.g., "What did you say?!").
+  * Ampersands (&): Only in initialisms (e.g., "R&B").
+  * Hashtags (#): Allowed if mentioned (e.g., "#winning"). Spell out "hashtag" if used as a verb.
+
+OUTPUT FORMAT:
+- Output ONLY the corrected list in 'ID|Corrected Text' format.
+- Do NOT include timestamps.
+- Do NOT merge or split lines. Keep line count identical.
 
-def correct_text_only_with_gemini(audio_path, events):
+INPUT DATA:"""
+
+SUBSET_PROMPT = PROMPT.replace("INPUT DATA:", """PARTIAL INPUT:
+- Only some lines of the episode are listed; "---" marks skipped lines.
+- The audio may cover only the listed part of the episode.
+- Lines under CONTEXT are for reference only. Do NOT output them.
+- Output ONLY the lines under CORRECT, keeping their IDs.
+
+INPUT DATA:""")
+
+def _make_client():
     api_key = os.environ.get("GEMINI_API_KEY")
     if not api_key:
         logging.warning("GEMINI_API_KEY not set. Skipping Gemini correction.")
-        return events
+        return None
+    return genai.Client(api_key=api_key)
 
-    logging.info("Uploading to Gemini...")
-    client = genai.Client(api_key=api_key)
+class UploadRegistry:
+    """
+    Uploaded Gemini files by content hash, persisted as JSON so later runs
+    can reuse them until they expire.
+    """
 
-    # Upload file
-    try:
-        file_ref = client.files.upload(file=audio_path)
-        if not file_ref:
-            logging.error("Upload to Gemini returned an invalid or empty file reference.")
-            return events
-    except Exception as e:
-        logging.error(f"Failed to upload audio to Gemini: {e}")
-        return events
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
 
-    payload_lines = []
-    for i, ev in enumerate(events, 1):
-        clean_text = ev.get('text', '').replace('\n', ' ')
-        payload_lines.append(f"{i}|{clean_text}")
-    full_payload = "\n".join(payload_lines)
+    def _read(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
 
-    logging.info("Requesting Text Corrections (Safe Mode - Anime)...")
+    def get(self, key):
+        with self._lock:
+            entry = self._read().get(key)
+        if entry and entry["expires"] > time.time() + REUSE_MARGIN_S:
+            return entry
+        return None
 
-    prompt = """
-    You are a professional subtitle editor.
-    I will provide a list of subtitle lines in the format 'ID|Text'.
-    The audio file is provided for context.
-
-    TASK:
-    1. Listen to the audio to identify correct Name spellings (Context: Anime).
-       * Pay attention to Character Names, Locations, and specific Terminology.
-       * Maintain standard romanization for Japanese (Anime) names (e.g. 'Satou', 'Kyouma').
-    2. Fix phonetic typos and capitalization.
-    3. STRICTLY follow the STYLE GUIDE below.
-
-    STYLE GUIDE:
-    - Ellipses: Use the single char (…, U+2026). Do NOT use three dots.
-      * Use to indicate trailing off or pauses >2s.
-      * NO space after ellipsis at start of line (e.g., "…and then").
-    - Numbers & Decades:
-      * Decades: "1950s" or "'50s".
-      * Ages: Always use numerals (e.g., "He is 5").
-      * Times: "9:30 a.m.", "a.m./p.m." (lowercase). Spell out "noon", "midnight", "half past", "quarter of".
-      * "o'clock": Spell out the number (e.g., "eleven o'clock").
-    - Punctuation:
-      * Exclamation marks (!): Use ONLY for shouting/surprise. Avoid overuse.
-      * Interrobangs (?!): Allowed for emphatic disbelief (e.g., "What did you say?!").
-      * Ampersands (&): Only in initialisms (e.g., "R&B").
-      * Hashtags (#): Allowed if mentioned (e.g., "#winning"). Spell out "hashtag" if used as a verb.
-
-    OUTPUT FORMAT:
-    - Output ONLY the corrected list in 'ID|Corrected Text' format.
-    - Do NOT include timestamps.
-    - Do NOT merge or split lines. Keep line count identical.
-
-    INPUT DATA:
-    """
+    def put(self, key, name, expires):
+        with self._lock:
+            entries = self._read()
+            now = time.time()
+            entries = {k: e for k, e in entries.items() if e["expires"] > now}
+            entries[key] = {"name": name, "expires": expires}
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(entries, f)
+            os.replace(tmp, self.path)
+
+def open_upload_registry(args):
+    """The registry lives next to the stage cache; --no-cache disables it."""
+    from src.cache import DEFAULT_CACHE_DIR
+    if getattr(args, "no_cache", False):
+        return None
+    root = getattr(args, "cache_dir", None) or DEFAULT_CACHE_DIR
+    return UploadRegistry(os.path.join(root, "gemini_uploads.json"))
+
+def _expiry(file_ref):
+    expires = getattr(file_ref, "expiration_time", None)
+    if hasattr(expires, "timestamp"):
+        return expires.timestamp()
+    return time.time() + FILE_TTL_S
 
+def _upload_audio(client, audio, codec=DEFAULT_CODEC, registry=None):
+    """Uploads 16kHz mono samples, reusing a live earlier upload of the same audio."""
+    import numpy as np
+    from src.audio import encode_speech_bytes
+
+    audio = np.ascontiguousarray(audio, dtype=np.float32)
+    h = hashlib.blake2b(memoryview(audio).cast("B"), digest_size=20)
+    key = f"{h.hexdigest()}-{codec}"
+    if registry is not None:
+        entry = registry.get(key)
+        if entry:
+            try:
+                file_ref = client.files.get(name=entry["name"])
+                logging.info(f"Reusing Gemini upload {entry['name']} ({len(audio) / SAMPLE_RATE:.0f}s of audio).")
+                return file_ref
+            except Exception as e:
+                logging.info(f"Registered upload {entry['name']} is gone ({e}); uploading again.")
+
+    data, mime_type = encode_speech_bytes(audio, SAMPLE_RATE, codec)
+    start = time.monotonic()
+    file_ref = client.files.upload(file=io.BytesIO(data), config=types.UploadFileConfig(mime_type=mime_type))
+    logging.info(
+        f"Uploaded {len(data) / 1e6:.2f} MB ({codec}, {len(audio) / SAMPLE_RATE:.0f}s of audio, "
+        f"{len(audio) * 2 / max(1, len(data)):.0f}x smaller than WAV) in {time.monotonic() - start:.1f}s."
+    )
+    if registry is not None and file_ref:
+        registry.put(key, file_ref.name, _expiry(file_ref))
+    return file_ref
+
+def _payload_line(i, ev):
+    clean_text = ev.get('text', '').replace('\n', ' ')
+    return f"{i}|{clean_text}"
+
+def _generate(client, contents):
     config = types.GenerateContentConfig(
         automatic_function_calling=types.AutomaticFunctionCallingConfig(disable=True)
     )
+    response = client.models.generate_content(model=MODEL_ID, config=config, contents=contents)
+    return getattr(response, "text", None)
+
+def _parse_corrections(response_text):
+    corrected_map = {}
+    if response_text is None:
+        logging.warning("Gemini response.text is None; no corrections returned.")
+        return corrected_map
+    raw_response = response_text.strip()
+    if not raw_response:
+        logging.info("Gemini returned empty text; no corrections to apply.")
+        return corrected_map
+    for line in raw_response.split('\n'):
+        if "|" in line:
+            parts = line.split("|", 1)
+            if len(parts) == 2 and parts[0].strip().isdigit():
+                idx = int(parts[0].strip())
+                new_text = parts[1].strip()
+                corrected_map[idx] = new_text
+    return corrected_map
+
+def _apply_corrections(events, corrected_map):
+    update_count = 0
+    for i, ev in enumerate(events, 1):
+        if i in corrected_map:
+            old_text = ev.get('text', '').replace('\n', ' ')
+            new_text = corrected_map[i]
+            if new_text and old_text != new_text:
+                ev['text'] = reshape_text_string(new_text, max_chars=42)
+                update_count += 1
+    return update_count
+
+def _load_audio(audio):
+    if isinstance(audio, str):
+        import soundfile as sf
+        audio, _ = sf.read(audio, dtype="float32")
+    return audio if audio.ndim == 1 else audio.mean(axis=1)
 
+def _subset_payload(events, targets, context_lines=CONTEXT_LINES):
+    """
+    Payload for correcting only the target lines (0-based indices, sorted),
+    each run with up to context_lines read-only neighbours on either side.
+    IDs stay the 1-based positions in the full event list.
+    Returns (payload, first, last): the span of lines it covers.
+    """
+    wanted = set(targets)
+    shown = set()
+    for i in targets:
+        shown.update(range(max(0, i - context_lines), min(len(events), i + context_lines + 1)))
+    lines = []
+    section = None
+    prev = None
+    for i in sorted(shown):
+        if prev is not None and i != prev + 1:
+            lines.append("---")
+            section = None
+        label = "CORRECT:" if i in wanted else "CONTEXT:"
+        if label != section:
+            lines.append(label)
+            section = label
+        lines.append(_payload_line(i + 1, events[i]))
+        prev = i
+    order = sorted(shown)
+    return "\n".join(lines), order[0], order[-1]
+
+def _correct_window(client, audio, events, targets, codec=DEFAULT_CODEC, registry=None):
+    """
+    Corrects the target lines (0-based) with their context lines and the
+    matching audio slice. Returns {line_id: text} for the targets only;
+    raises once every attempt has failed.
+    """
+    payload, first, last = _subset_payload(events, targets)
+    t0 = max(0.0, events[first]["start"] - SLICE_PAD_S)
+    t1 = events[last]["end"] + SLICE_PAD_S
+    audio_slice = audio[int(t0 * SAMPLE_RATE):int(t1 * SAMPLE_RATE)]
+    wanted = set(i + 1 for i in targets)
+    label = f"{targets[0] + 1}-{targets[-1] + 1}"
+
+    file_ref = None
     try:
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            config=config,
-            contents=[prompt, file_ref, full_payload]
-        )
+        for attempt in range(RETRIES + 1):
+            try:
+                # The slice is uploaded once; retries only repeat what failed.
+                if not file_ref:
+                    file_ref = _upload_audio(client, audio_slice, codec, registry)
+                    if not file_ref:
+                        raise RuntimeError("upload returned an empty file reference")
+                corrected = _parse_corrections(_generate(client, [SUBSET_PROMPT, file_ref, payload]))
+                corrected = {i: t for i, t in corrected.items() if i in wanted}
+                if not corrected:
+                    raise RuntimeError("no lines returned")
+                return corrected
+            except Exception as e:
+                if attempt == RETRIES:
+                    raise
+                delay = BACKOFF_S * 2 ** attempt * (0.5 + random.random())
+                logging.warning(f"Gemini lines {label}: {e}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+    finally:
+        # Without a registry nobody can reuse the slice; remove it right away.
+        if file_ref and registry is None:
+            try:
+                client.files.delete(name=file_ref.name)
+            except Exception as e:
+                logging.debug(f"Could not delete Gemini upload: {e}")
 
-        corrected_map = {}
-        response_text = getattr(response, "text", None)
-        if response_text is None:
-            logging.warning("Gemini response.text is None; no corrections returned.")
+def _chunk_windows(events, targets, chunk_lines, max_gap_s=WINDOW_GAP_S):
+    """
+    Target lines (0-based, sorted) in windows of at most chunk_lines. Sparse
+    targets (confidence filter) are also split where they are more than
+    max_gap_s apart, so a window's audio slice never spans long stretches
+    nobody asked about.
+    """
+    windows = []
+    for i in targets:
+        w = windows[-1] if windows else None
+        if w and len(w) < chunk_lines and events[i]["start"] - events[w[-1]]["end"] <= max_gap_s:
+            w.append(i)
         else:
-            raw_response = response_text.strip()
-            if not raw_response:
-                logging.info("Gemini returned empty text; no corrections to apply.")
-            else:
-                for line in raw_response.split('\n'):
-                    if "|" in line:
-                        parts = line.split("|", 1)
-                        if len(parts) == 2 and parts[0].strip().isdigit():
-                            idx = int(parts[0].strip())
-                            new_text = parts[1].strip()
-                            corrected_map[idx] = new_text
+            windows.append([i])
+    return windows
 
-        logging.info(f"Received {len(corrected_map)} corrected lines.")
+def _correct_chunked(client, audio, events, targets, chunk_lines, workers, codec=DEFAULT_CODEC, registry=None):
+    audio = _load_audio(audio)
+    windows = _chunk_windows(events, targets, chunk_lines)
+    logging.info(f"Requesting Text Corrections in {len(windows)} chunks of up to {chunk_lines} lines ({workers} workers)...")
+
+    corrected_map = {}
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = [(w, pool.submit(_correct_window, client, audio, events, w, codec, registry)) for w in windows]
+        for w, future in futures:
+            try:
+                corrected_map.update(future.result())
+            except Exception as e:
+                # This window keeps its ASR text.
+                logging.error(f"Gemini lines {w[0] + 1}-{w[-1] + 1} failed, keeping ASR text: {e}")
+                failed += 1
+
+    logging.info(f"Received {len(corrected_map)} corrected lines ({failed} of {len(windows)} chunks failed).")
+    return corrected_map
+
+def _request_corrections(client, audio_path, events, targets, chunk_lines, workers, codec, registry):
+    """
+    Sends the target lines (0-based indices) to Gemini; returns
+    {line_id: text} with 1-based IDs into events, empty on failure.
+    """
+    if chunk_lines and chunk_lines > 0:
+        return _correct_chunked(client, audio_path, events, targets, chunk_lines, workers, codec, registry)
+
+    logging.info("Uploading to Gemini...")
+
+    # Upload file
+    try:
+        file_ref = _upload_audio(client, _load_audio(audio_path), codec, registry)
+        if not file_ref:
+            logging.error("Upload to Gemini returned an invalid or empty file reference.")
+            return {}
+    except Exception as e:
+        logging.error(f"Failed to upload audio to Gemini: {e}")
+        return {}
 
-        update_count = 0
-        for i, ev in enumerate(events, 1):
-            if i in corrected_map:
-                old_text = ev.get('text', '').replace('\n', ' ')
-                new_text = corrected_map[i]
-                if new_text and old_text != new_text:
-                    ev['text'] = reshape_text_string(new_text, max_chars=42)
-                    update_count += 1
+    if len(targets) == len(events):
+        prompt = PROMPT
+        full_payload = "\n".join(_payload_line(i, ev) for i, ev in enumerate(events, 1))
+    else:
+        prompt = SUBSET_PROMPT
+        full_payload = _subset_payload(events, targets)[0]
 
-        logging.info(f"Updated {update_count} lines with Gemini corrections.")
+    logging.info("Requesting Text Corrections (Safe Mode - Anime)...")
 
+    try:
+        corrected_map = _parse_corrections(_generate(client, [prompt, file_ref, full_payload]))
+        wanted = set(i + 1 for i in targets)
+        corrected_map = {i: t for i, t in corrected_map.items() if i in wanted}
+        logging.info(f"Received {len(corrected_map)} corrected lines.")
+        return corrected_map
     except Exception as e:
         logging.error(f"Gemini API Error: {e}")
+        return {}
+
+def is_low_confidence(ev, min_word_prob):
+    """
+    True if any word is below min_word_prob, or Whisper's segment scores look
+    doubtful. Lines without stored scores count as low confidence.
+    """
+    words = ev.get("words") or []
+    if not words or any("probability" not in w for w in words):
+        return True
+    if min(w["probability"] for w in words) < min_word_prob:
+        return True
+    if min(w.get("avg_logprob", 0.0) for w in words) < LOW_AVG_LOGPROB:
+        return True
+    return max(w.get("no_speech_prob", 0.0) for w in words) > HIGH_NO_SPEECH_PROB
+
+def correct_text_only_with_gemini(audio_path, events, chunk_lines=0, workers=4, client=None,
+                                  codec=DEFAULT_CODEC, registry=None, memo=None, series="",
+                                  min_confidence=None):
+    """
+    Corrects event texts in place and returns events. With a CorrectionMemo,
+    lines it already knows are applied locally, the series glossary is applied
+    to the rest, and only those are sent. With min_confidence, only lines
+    with a word below that probability (see is_low_confidence) are sent,
+    with CONTEXT_LINES neighbours either side.
+    """
+    if not events:
+        return events
+
+    asr_texts = [ev.get('text', '') for ev in events]
+    corrected_map = {}
+    pending = list(range(len(events)))
+    glossary_fixes = 0
+    if memo is not None:
+        known = memo.lookup(series, asr_texts)
+        corrected_map = {i + 1: text for i, text in known.items()}
+        pending = [i for i in pending if i not in known]
+        glossary = memo.glossary(series)
+        for i in pending:
+            fixed = memo.apply_glossary(events[i].get('text', ''), glossary)
+            if fixed != events[i].get('text', ''):
+                events[i]['text'] = fixed
+                glossary_fixes += 1
+        from src.memo import report_savings
+        saved_chars = 2 * sum(len(_payload_line(i + 1, events[i])) for i in known)
+        report_savings(len(known), glossary_fixes, len(events), saved_chars)
+
+    if min_confidence is not None:
+        unsure = [i for i in pending if is_low_confidence(events[i], min_confidence)]
+        payload = _subset_payload(events, unsure)[0] if unsure else ""
+        payload_lines = sum(1 for line in payload.splitlines() if "|" in line)
+        logging.info(
+            f"Confidence filter (word probability < {min_confidence:.2f}): sending {len(unsure)} of "
+            f"{len(pending)} lines ({len(unsure) / max(1, len(pending)) * 100:.1f}%), "
+            f"{payload_lines} payload lines with context."
+        )
+        pending = unsure
+
+    if pending and client is None:
+        client = _make_client()
+    if pending and client is not None:
+        received = _request_corrections(client, audio_path, events, pending, chunk_lines, workers, codec, registry)
+        corrected_map.update(received)
+        if memo is not None:
+            # A line Gemini left as Whisper heard it is not a correction.
+            memo.record(series, [(asr_texts[k - 1], text) for k, text in received.items()
+                                 if " ".join(text.split()) != " ".join(asr_texts[k - 1].split())])
 
+    update_count = _apply_corrections(events, corrected_map)
+    logging.info(f"Updated {update_count} lines with Gemini corrections.")
     return events
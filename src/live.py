@@ -0,0 +1,211 @@
+"""
+Live mode: incremental subtitles from a streaming source.
+
+ffmpeg decodes a pipe, stdin, URL or growing file to 16kHz mono (with the
+same band-pass as the batch path) and the samples are read as they arrive.
+Whisper re-decodes a short rolling window every step; words that end far
+enough behind the live edge are committed, and a watermark says no later
+word can start before the cut. Words and watermarks flow through
+iter_segment_smart_stream and iter_post_processing, and every finalized
+event is written immediately as SRT or WebVTT.
+
+Vocal separation and Gemini are skipped: both need the whole file.
+"""
+import sys
+import time
+import bisect
+import logging
+import subprocess
+import numpy as np
+
+from src.audio import PREPROCESS_FILTER
+
+SAMPLE_RATE = 16000
+MAX_BUFFER_S = 30.0     # Whisper's input length
+
+def open_live_source(source):
+    """
+    Starts ffmpeg on the live source and returns the process.
+    "-" reads stdin; files are followed while they grow (stopping after
+    10s without new data); anything else is handed to ffmpeg as is.
+    """
+    import os
+
+    cmd = ["ffmpeg", "-hide_banner", "-loglevel", "error"]
+    if source == "-":
+        cmd += ["-i", "pipe:0"]
+        stdin = None
+    elif os.path.isfile(source):
+        cmd += ["-follow", "1", "-rw_timeout", "10000000", "-i", f"file:{source}"]
+        stdin = subprocess.DEVNULL
+    else:
+        cmd += ["-i", source]
+        stdin = subprocess.DEVNULL
+    cmd += ["-vn", "-ac", "1", "-ar", str(SAMPLE_RATE), "-af", PREPROCESS_FILTER, "-f", "f32le", "pipe:1"]
+    logging.info(f"Live source: {source}")
+    return subprocess.Popen(cmd, stdin=stdin, stdout=subprocess.PIPE, bufsize=0)
+
+def iter_pcm_chunks(stream, chunk_s):
+    """Yields float32 chunks of up to chunk_s seconds as soon as they are read."""
+    chunk_bytes = int(chunk_s * SAMPLE_RATE) * 4
+    pending = b""
+    while True:
+        # Unbuffered pipe: returns whatever has arrived, up to chunk_bytes.
+        data = stream.read(chunk_bytes)
+        if not data:
+            break
+        pending += data
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield np.frombuffer(pending[:usable], dtype=np.float32)
+            pending = pending[usable:]
+
+class LatencyTracker:
+    """Maps stream time to the wall-clock time that audio arrived."""
+
+    def __init__(self):
+        self.stream_ends = []
+        self.arrivals = []
+        self.latencies = []
+
+    def arrived(self, stream_end_s):
+        self.stream_ends.append(stream_end_s)
+        self.arrivals.append(time.monotonic())
+
+    def emitted(self, event_end_s):
+        i = bisect.bisect_left(self.stream_ends, event_end_s)
+        if i >= len(self.arrivals):
+            i = len(self.arrivals) - 1
+        if i < 0:
+            return None
+        latency = time.monotonic() - self.arrivals[i]
+        self.latencies.append(latency)
+        return latency
+
+    def summary(self):
+        if not self.latencies:
+            return {"events": 0}
+        lat = np.asarray(self.latencies)
+        return {
+            "events": int(len(lat)),
+            "mean_s": float(lat.mean()),
+            "p50_s": float(np.percentile(lat, 50)),
+            "p95_s": float(np.percentile(lat, 95)),
+            "max_s": float(lat.max()),
+        }
+
+def iter_live_words(chunks, model, tracker, step_s=2.0, hold_s=1.5, options=None, max_buffer_s=MAX_BUFFER_S):
+    """
+    Rolling-window transcription. Yields committed words in stream time and
+    float watermarks. The window is cut at now - hold_s once it is longer
+    than max_buffer_s, even through a word.
+    """
+    from src.asr import TRANSCRIBE_OPTIONS, segment_words
+
+    options = options or TRANSCRIBE_OPTIONS
+    buf = np.zeros(0, dtype=np.float32)
+    buf_t0 = 0.0
+    since_decode = 0.0
+    for chunk in chunks:
+        buf = np.concatenate((buf, chunk))
+        since_decode += len(chunk) / SAMPLE_RATE
+        now_t = buf_t0 + len(buf) / SAMPLE_RATE
+        tracker.arrived(now_t)
+        if since_decode < step_s:
+            continue
+        since_decode = 0.0
+
+        segments, _ = model.transcribe(buf, **options)
+        words = segment_words(segments, buf_t0)
+
+        # Words ending before the cut are final; the cut only splits a word
+        # when no cut before it would bound the buffer.
+        cut = now_t - hold_s
+        final = [w for w in words if w["end"] <= cut]
+        tail = [w for w in words if w["end"] > cut]
+        if tail and now_t - buf_t0 < max_buffer_s:
+            cut = min(cut, tail[0]["start"])
+            final = [w for w in final if w["end"] <= cut]
+        elif tail and tail[0]["start"] < cut:
+            logging.warning(f"Live: {now_t - buf_t0:.1f}s buffered without a pause; cutting through {tail[0]['word']!r}.")
+        cut = max(cut, buf_t0)
+
+        yield from final
+        yield float(cut)
+        buf = buf[int(round((cut - buf_t0) * SAMPLE_RATE)):]
+        buf_t0 = cut
+
+    # End of stream: everything left is final.
+    if len(buf):
+        segments, _ = model.transcribe(buf, **options)
+        yield from segment_words(segments, buf_t0)
+
+def _fmt_vtt(t):
+    return f"{int(t//3600):02}:{int((t%3600)//60):02}:{int(t%60):02}.{int((t*1000)%1000):03}"
+
+def write_live_events(events, out, fmt, tracker):
+    """Writes each finalized event as soon as it is produced."""
+    from src.postprocess import _fmt_ms
+
+    if fmt == "vtt":
+        out.write("WEBVTT\n\n")
+        out.flush()
+    n = 0
+    for ev in events:
+        n += 1
+        text = ev.get("text", "").strip()
+        if fmt == "vtt":
+            out.write(f"{_fmt_vtt(ev['start'])} --> {_fmt_vtt(ev['end'])}\n{text}\n\n")
+        else:
+            out.write(f"{n}\n{_fmt_ms(ev['start'])} --> {_fmt_ms(ev['end'])}\n{text}\n\n")
+        out.flush()
+        # Speech end, not the lingered display end.
+        words = ev.get("words")
+        latency = tracker.emitted(words[-1]["end"] if words else ev["end"])
+        if latency is not None:
+            logging.debug(f"Event {n} committed, latency {latency:.2f}s")
+    return n
+
+def run_live(source, output, args):
+    """
+    Runs live mode from source to output ("-" for stdout).
+    The target latency sets the decode step, the commit hold and the
+    post-processing hold. Returns the latency summary.
+    """
+    from src.asr import load_whisper_model, decode_options, iter_segment_smart_stream
+    from src.postprocess import iter_post_processing
+
+    target = getattr(args, "target_latency", 6.0)
+    fmt = getattr(args, "live_format", "srt")
+    step_s = max(0.5, target / 4.0)
+    hold_s = max(1.0, target / 4.0)
+    max_buffer_s = max(MAX_BUFFER_S, 2.0 * (step_s + hold_s))
+    pause_s = 0.4
+    post_hold_s = max(0.5, target - step_s - hold_s - pause_s)
+    logging.info(f"Live: target latency {target:.1f}s (step {step_s:.1f}s, hold {hold_s:.1f}s, post hold {post_hold_s:.1f}s)")
+
+    model = load_whisper_model(cpu_threads=getattr(args, "asr_threads", 0) or 0,
+                               compute_type=getattr(args, "asr_compute_type", None))
+    tracker = LatencyTracker()
+    proc = open_live_source(source)
+    out = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    try:
+        words = iter_live_words(iter_pcm_chunks(proc.stdout, step_s / 2.0), model, tracker, step_s=step_s, hold_s=hold_s,
+                                max_buffer_s=max_buffer_s, options=decode_options(getattr(args, "beam_size", None)))
+        items = iter_segment_smart_stream(words, pause_ms=pause_s * 1000.0, max_chars=84, max_dur_s=7.0)
+        events = iter_post_processing(items, max_hold_s=post_hold_s)
+        count = write_live_events(events, out, fmt, tracker)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        proc.stdout.close()
+        proc.wait()
+
+    stats = tracker.summary()
+    if count:
+        logging.info(
+            f"Live latency over {stats['events']} events: mean {stats['mean_s']:.2f}s, "
+            f"p50 {stats['p50_s']:.2f}s, p95 {stats['p95_s']:.2f}s, max {stats['max_s']:.2f}s "
+            f"(target {target:.1f}s)"
+        )
+    return stats
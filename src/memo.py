@@ -0,0 +1,153 @@
+"""
+Persistent memo of Gemini line corrections and a per-series name glossary.
+
+Accepted corrections are stored in SQLite, keyed by series and the
+normalized ASR line. Once Gemini has given the same correction for a line
+MIN_CONFIRMATIONS times, later runs apply it locally and leave the line out
+of the payload. Single-word spelling fixes to capitalized words (names,
+places, terms) are collected into a glossary that is applied to every
+outgoing line without an API call.
+"""
+import os
+import re
+import sqlite3
+import logging
+
+MIN_CONFIRMATIONS = 2       # identical corrections before a line is served locally
+MIN_GLOSSARY_COUNT = 2      # times a name fix must be seen before it is applied
+CHARS_PER_TOKEN = 4.0       # rough estimate for the savings report
+
+_WORD = re.compile(r"[\w']+")
+_EPISODE = re.compile(r"[\s._-]*(s\d+\s*e\d+|e\d+|ep\.?\s*\d+|episode\s*\d+|\d{1,3})\b.*$", re.IGNORECASE)
+
+def normalize_line(text):
+    """Lowercase words only; punctuation, case and line breaks do not matter."""
+    return " ".join(_WORD.findall(text.lower()))
+
+def series_from_path(path):
+    """'Show Name - S01E03 [1080p].mkv' -> 'show name'."""
+    base = os.path.splitext(os.path.basename(path))[0]
+    base = re.sub(r"\[[^\]]*\]|\([^)]*\)", " ", base)
+    name = _EPISODE.sub("", base).replace(".", " ").replace("_", " ")
+    return " ".join(name.split()).lower() or base.lower()
+
+def _split_token(token):
+    """('"', 'Satou', ',') -- leading punctuation, word, trailing punctuation."""
+    m = re.match(r"^(\W*)(.*?)(\W*)$", token)
+    return m.group(1), m.group(2), m.group(3)
+
+def _name_fixes(asr_text, corrected):
+    """Single-token spelling changes where the corrected word is capitalized."""
+    before, after = asr_text.split(), corrected.split()
+    if len(before) != len(after):
+        return []
+    fixes = []
+    for a, b in zip(before, after):
+        wrong, right = _split_token(a)[1], _split_token(b)[1]
+        # Case-only changes ("will" -> "Will") are too ambiguous to learn.
+        if wrong and right[:1].isupper() and wrong.lower() != right.lower():
+            fixes.append((wrong.lower(), right))
+    return fixes
+
+class CorrectionMemo:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS corrections ("
+                "series TEXT, line TEXT, corrected TEXT, confirmations INTEGER, "
+                "PRIMARY KEY (series, line))"
+            )
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS glossary ("
+                "series TEXT, wrong TEXT, right TEXT, count INTEGER, "
+                "PRIMARY KEY (series, wrong))"
+            )
+
+    def _connect(self):
+        # One short-lived connection per call: batch finish workers share the file.
+        return sqlite3.connect(self.path, timeout=30)
+
+    def glossary(self, series):
+        with self._connect() as db:
+            rows = db.execute(
+                "SELECT wrong, right FROM glossary WHERE series = ? AND count >= ?",
+                (series, MIN_GLOSSARY_COUNT),
+            ).fetchall()
+        return dict(rows)
+
+    def apply_glossary(self, text, glossary):
+        """Replaces known misspellings word by word, keeping punctuation and line breaks."""
+        if not glossary:
+            return text
+        lines = []
+        for line in text.split("\n"):
+            tokens = []
+            for token in line.split(" "):
+                lead, word, trail = _split_token(token)
+                right = glossary.get(word.lower())
+                tokens.append(f"{lead}{right}{trail}" if right else token)
+            lines.append(" ".join(tokens))
+        return "\n".join(lines)
+
+    def lookup(self, series, texts):
+        """Confident corrections for the given ASR lines, as {index: corrected}."""
+        keys = {i: normalize_line(t) for i, t in enumerate(texts)}
+        wanted = sorted(set(k for k in keys.values() if k))
+        found = {}
+        with self._connect() as db:
+            # Stay under SQLite's bound-parameter limit.
+            for start in range(0, len(wanted), 500):
+                part = wanted[start:start + 500]
+                rows = db.execute(
+                    f"SELECT line, corrected FROM corrections WHERE series = ? AND confirmations >= ? "
+                    f"AND line IN ({','.join('?' * len(part))})",
+                    (series, MIN_CONFIRMATIONS, *part),
+                ).fetchall()
+                found.update(rows)
+        return {i: found[k] for i, k in keys.items() if k in found}
+
+    def record(self, series, pairs):
+        """
+        Stores (asr_text, corrected_text) pairs returned by Gemini. A repeat of
+        the stored correction confirms it; a different one replaces it.
+        """
+        with self._connect() as db:
+            for asr_text, corrected in pairs:
+                line = normalize_line(asr_text)
+                if not line or not corrected:
+                    continue
+                row = db.execute(
+                    "SELECT corrected, confirmations FROM corrections WHERE series = ? AND line = ?",
+                    (series, line),
+                ).fetchone()
+                confirmations = row[1] + 1 if row and row[0] == corrected else 1
+                db.execute(
+                    "INSERT OR REPLACE INTO corrections VALUES (?, ?, ?, ?)",
+                    (series, line, corrected, confirmations),
+                )
+                for wrong, right in _name_fixes(asr_text.replace("\n", " "), corrected):
+                    row = db.execute(
+                        "SELECT right, count FROM glossary WHERE series = ? AND wrong = ?",
+                        (series, wrong),
+                    ).fetchone()
+                    count = row[1] + 1 if row and row[0] == right else 1
+                    db.execute(
+                        "INSERT OR REPLACE INTO glossary VALUES (?, ?, ?, ?)",
+                        (series, wrong, right, count),
+                    )
+
+def open_correction_memo(args):
+    """The memo lives in the cache directory; --no-memo disables it."""
+    from src.cache import DEFAULT_CACHE_DIR
+    if getattr(args, "no_memo", False):
+        return None
+    root = getattr(args, "cache_dir", None) or DEFAULT_CACHE_DIR
+    return CorrectionMemo(os.path.join(root, "corrections.sqlite"))
+
+def report_savings(hits, glossary_fixes, total, saved_chars):
+    logging.info(
+        f"Correction memo: {hits} of {total} lines applied locally "
+        f"(~{saved_chars / CHARS_PER_TOKEN:.0f} tokens saved), glossary fixed {glossary_fixes} lines."
+    )
@@ -0,0 +1,205 @@
+"""
+Per-stage metrics for pipeline jobs.
+
+Each job carries a JobMetrics; stages run inside job_metrics.stage(name),
+which records wall time, CPU time (this process plus finished ffmpeg
+children), bytes read/written through syscalls, the real-time factor
+against the media duration and peak RSS. The OS only reports peaks since
+process start, so a stage's peak RSS is the high-water mark up to its
+end, for this process and separately for its largest finished child.
+Reports are written as JSON (--metrics-json) or a Prometheus textfile
+(--metrics-prom).
+
+Library callers can subscribe to stage events with add_listener(callback);
+the callback gets {"event": "stage_start" | "stage_end", "input", "stage", "stream"}
+plus the stage record on stage_end. In batch mode stages of different
+files overlap, so CPU time and I/O of one stage include whatever else the
+process did meanwhile.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+_listeners = []
+_listeners_lock = threading.Lock()
+
+def add_listener(callback):
+    with _listeners_lock:
+        _listeners.append(callback)
+
+def remove_listener(callback):
+    with _listeners_lock:
+        if callback in _listeners:
+            _listeners.remove(callback)
+
+def _emit(event):
+    with _listeners_lock:
+        listeners = list(_listeners)
+    for callback in listeners:
+        try:
+            callback(event)
+        except Exception as e:
+            logging.warning(f"Metrics listener failed: {e}")
+
+def _cpu_s():
+    if resource is None:
+        return time.process_time()
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def _peak_rss_mb(who=None):
+    """
+    Peak RSS so far of this process, or with RUSAGE_CHILDREN of the largest
+    waited-for child (ffmpeg, pool workers that exited). It never goes
+    down, so a stage's value is the high-water mark up to its end.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF if who is None else who).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere.
+    return peak / 1e6 if sys.platform == "darwin" else peak / 1024.0
+
+def _io_bytes():
+    """(read, written) through read/write syscalls, including pipes; Linux only."""
+    try:
+        with open("/proc/self/io", "r") as f:
+            fields = dict(line.split(":", 1) for line in f)
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+class JobMetrics:
+    def __init__(self, input_path, listener=None):
+        self.input = input_path
+        self.listener = listener    # per-job callback, on top of the global listeners
+        self.duration_s = None      # media duration, from probe_file
+        self.stages = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name, stream=None):
+        """stream labels stages of one audio stream when a file has several."""
+        self._notify({"event": "stage_start", "input": self.input, "stage": name, "stream": stream})
+        wall0, cpu0 = time.perf_counter(), _cpu_s()
+        read0, written0 = _io_bytes()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall0
+            read1, written1 = _io_bytes()
+            record = {
+                "stage": name,
+                "wall_s": wall,
+                "cpu_s": _cpu_s() - cpu0,
+                "process_peak_rss_mb": _peak_rss_mb(),
+                "children_peak_rss_mb": _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource else None,
+                "bytes_read": read1 - read0 if read0 is not None else None,
+                "bytes_written": written1 - written0 if written0 is not None else None,
+                "rtf": wall / self.duration_s if self.duration_s else None,
+            }
+            if stream is not None:
+                record["stream"] = stream
+            with self._lock:
+                self.stages.append(record)
+            self._notify({"event": "stage_end", "input": self.input, "stage": name, "stream": stream, "metrics": record})
+
+    def _notify(self, event):
+        _emit(event)
+        if self.listener is not None:
+            try:
+                self.listener(event)
+            except Exception as e:
+                logging.warning(f"Metrics listener failed: {e}")
+
+    def set_duration(self, probe_data):
+        try:
+            self.duration_s = float(probe_data["format"]["duration"])
+        except (KeyError, TypeError, ValueError):
+            self.duration_s = None
+        # Stages that ran before the duration was known (probe).
+        for record in self.stages:
+            if self.duration_s and record["rtf"] is None:
+                record["rtf"] = record["wall_s"] / self.duration_s
+
+    def report(self):
+        with self._lock:
+            stages = list(self.stages)
+        wall = sum(s["wall_s"] for s in stages)
+        return {
+            "input": self.input,
+            "duration_s": self.duration_s,
+            "stages": stages,
+            "total": {
+                "wall_s": wall,
+                "cpu_s": sum(s["cpu_s"] for s in stages),
+                "process_peak_rss_mb": max((s["process_peak_rss_mb"] or 0 for s in stages), default=None),
+                "children_peak_rss_mb": max((s["children_peak_rss_mb"] or 0 for s in stages), default=None),
+                "rtf": wall / self.duration_s if self.duration_s else None,
+            },
+        }
+
+    def log_summary(self):
+        parts = [f"{s['stage']}{'[' + s['stream'] + ']' if 'stream' in s else ''} {s['wall_s']:.1f}s" for s in self.stages]
+        total = self.report()["total"]
+        rtf = f", RTF {total['rtf']:.3f}" if total["rtf"] is not None else ""
+        logging.info(f"Stage times: {', '.join(parts)} (total {total['wall_s']:.1f}s{rtf})")
+
+def _atomic_write(path, text):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def _prom_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def prometheus_text(reports):
+    """Prometheus text exposition format, one series per job and stage."""
+    metrics = [
+        ("wall_s", "livesubs_stage_wall_seconds", "Wall time of a pipeline stage."),
+        ("cpu_s", "livesubs_stage_cpu_seconds", "CPU time of a pipeline stage, including ffmpeg children."),
+        ("process_peak_rss_mb", "livesubs_stage_process_peak_rss_megabytes",
+         "Peak RSS of the process so far (not of the stage alone) at the end of a stage."),
+        ("children_peak_rss_mb", "livesubs_stage_children_peak_rss_megabytes",
+         "Largest peak RSS of a finished child process (ffmpeg, pool workers) at the end of a stage."),
+        ("bytes_read", "livesubs_stage_read_bytes", "Bytes read through syscalls during a stage."),
+        ("bytes_written", "livesubs_stage_written_bytes", "Bytes written through syscalls during a stage."),
+        ("rtf", "livesubs_stage_real_time_factor", "Stage wall time divided by media duration."),
+    ]
+    lines = []
+    for key, name, help_text in metrics:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for report in reports:
+            for s in report["stages"]:
+                if s[key] is not None:
+                    stream = f',stream="{s["stream"]}"' if "stream" in s else ""
+                    lines.append(f'{name}{{input="{_prom_label(report["input"])}",stage="{s["stage"]}"{stream}}} {s[key]}')
+    lines.append("# HELP livesubs_media_duration_seconds Media duration from ffprobe.")
+    lines.append("# TYPE livesubs_media_duration_seconds gauge")
+    for report in reports:
+        if report["duration_s"] is not None:
+            lines.append(f'livesubs_media_duration_seconds{{input="{_prom_label(report["input"])}"}} {report["duration_s"]}')
+    return "\n".join(lines) + "\n"
+
+def write_reports(job_metrics, args):
+    """Writes --metrics-json / --metrics-prom for the given JobMetrics."""
+    reports = [m.report() for m in job_metrics if m is not None]
+    json_path = getattr(args, "metrics_json", None)
+    if json_path:
+        _atomic_write(json_path, json.dumps({"jobs": reports}, indent=2))
+        logging.info(f"Metrics written to {json_path}")
+    prom_path = getattr(args, "metrics_prom", None)
+    if prom_path:
+        _atomic_write(prom_path, prometheus_text(reports))
+        logging.info(f"Prometheus metrics written to {prom_path}")
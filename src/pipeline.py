@@ -0,0 +1,690 @@
+"""
+Pipeline stages shared by the single-file CLI and batch mode.
+
+Each stage takes a job dict (input path, output path, work dir and the
+intermediate results filled in by earlier stages) and returns it updated.
+Heavy models can be passed in so callers processing many files keep them
+resident instead of reloading them per file.
+
+Audio moves between stages under job["extracted"], job["vocals"] and
+job["final"]. Normally these are WAV paths; with args.in_memory they are
+NumPy arrays and files are only written when args.keep_temp is set.
+
+stage_extract returns a list: one job per selected audio stream, each with
+its own work dir and output path when there are several (all streams come
+out of a single ffmpeg run). The other stages take and return one job.
+
+If the job carries a StageCache (job["cache"]), stage_extract looks up the
+latest cached artifact and later stages skip whatever is already filled in.
+
+Every step runs inside job["metrics"].stage(name) (see src.metrics), so
+each job ends up with timings for probe, extract, separate, preprocess,
+asr, postprocess, gemini and write (skipped steps are not recorded).
+
+With args.fingerprint, stage_separate first matches the extracted audio
+against earlier files of the series (src.fingerprint); known segments are
+left out of separation and ASR and their old events are merged back in
+stage_finish.
+
+With args.start/args.end only that window (plus SPLICE_MARGIN_S of context
+when splicing) is decoded and processed; job["window"] holds its offset and
+words stay on the window's timeline until stage_finish shifts the events.
+With args.splice the existing output SRT is read in stage_extract and the
+new events replace its lines in the range (src.postprocess.splice_events).
+
+With args.align the words come from forced alignment of a reference script
+(src.align) instead of decoding, and Gemini is skipped.
+"""
+import os
+import logging
+import contextlib
+import numpy as np
+
+SPLICE_MARGIN_S = 5.0       # ASR context decoded on each side of a spliced range
+MIN_GAP_S = 0.084           # between consecutive lines, as in post-processing
+REUSE_MIN_DUR_S = 0.5       # shorter lines left by merging reused events are folded into the next
+
+def new_job(input_path, output_srt, work_dir, cache=None):
+    from src.metrics import JobMetrics
+    return {"input": input_path, "output_srt": output_srt, "work_dir": work_dir, "cache": cache,
+            "metrics": JobMetrics(input_path)}
+
+def _stage(job, name):
+    metrics = job.get("metrics")
+    if metrics is None:
+        return contextlib.nullcontext()
+    return metrics.stage(name, stream=job.get("stream_label"))
+
+def _cache_keys(job, args):
+    from src.cache import make_key
+    from src.audio import PREPROCESS_FILTER
+    from src.separator import MODEL_NAME, SAMPLE_RATE, separator_options
+    from src.asr import DEFAULT_MODEL_ID, WORD_FIELDS, decode_options
+
+    in_memory = getattr(args, "in_memory", False)
+    source = job["cache"].file_hash(job["input"])
+    sep_params = dict(
+        stream=job["stream_idx"], model=MODEL_NAME,
+        in_memory=in_memory, sample_rate=SAMPLE_RATE if in_memory else 48000,
+        speech_gate=getattr(args, "speech_gate", False) and getattr(args, "gate_margin_db", 6.0),
+    )
+    # Segment and batch size change the stem (autotune checks them by SNR); unset keeps old keys.
+    sep_params.update({k: v for k, v in separator_options(args).items() if v is not None})
+    if "window" in job:
+        sep_params["window"] = (job["window"]["offset"], job["window"]["duration"])
+    if getattr(args, "separate_chunk_s", 0):
+        # Seams are blended, not bit-identical to a whole-track run.
+        sep_params["chunk"] = (args.separate_chunk_s, getattr(args, "separate_overlap_s", 2.0))
+    sep_key = make_key("separate", source, **sep_params)
+    pre_key = make_key("preprocess", sep_key, sample_rate=16000, channels=1, filter=PREPROCESS_FILTER)
+    asr_params = dict(decode_options(getattr(args, "beam_size", None)), model=DEFAULT_MODEL_ID, fields=WORD_FIELDS)
+    if getattr(args, "asr_compute_type", None):
+        asr_params["compute_type"] = args.asr_compute_type
+    if getattr(args, "asr_procs", 1) > 1:
+        # Chunk boundaries can change decoding slightly; worker count cannot.
+        asr_params["chunk_s"] = getattr(args, "asr_chunk_s", None)
+    if getattr(args, "align", None):
+        asr_params["align"] = job["cache"].file_hash(args.align)
+    if getattr(args, "cascade", False):
+        from src.asr import DRAFT_MODEL_ID, CASCADE_LOGPROB
+        logprob = getattr(args, "cascade_logprob", None)
+        asr_params["cascade"] = (getattr(args, "draft_model", None) or DRAFT_MODEL_ID,
+                                 CASCADE_LOGPROB if logprob is None else logprob)
+    asr_key = make_key("asr", pre_key, **asr_params)
+    from src.fingerprint import FP_RATE
+    fp_key = make_key("fingerprint", source, stream=job["stream_idx"], rate=FP_RATE)
+    return {"separate": sep_key, "preprocess": pre_key, "asr": asr_key, "fingerprint": fp_key}
+
+def _cache_get_audio(job, args, stage):
+    cache = job["cache"]
+    key = job["cache_keys"][stage]
+    return cache.get_array(key) if getattr(args, "in_memory", False) else cache.get_file(key)
+
+def _cache_put_audio(job, args, stage, audio):
+    cache = job.get("cache")
+    if cache is None or "reuse" in job:
+        # Reused spans are silent in the stem; it is not a full-track result.
+        return
+    key = job["cache_keys"][stage]
+    if getattr(args, "in_memory", False):
+        cache.put_array(key, audio)
+    else:
+        cache.put_file(key, audio)
+
+def _needs_audio(job, args):
+    # Audio stages can be skipped entirely once the words are known, unless
+    # Gemini still needs the 16kHz audio.
+    return "words" not in job or not getattr(args, "no_gemini", False)
+
+def _resume_from_cache(job, args):
+    """Fills in the latest cached artifacts; returns True if extraction can be skipped."""
+    cache = job["cache"]
+    job["cache_keys"] = _cache_keys(job, args)
+
+    words = cache.get_json(job["cache_keys"]["asr"])
+    if words is not None:
+        job["words"] = words
+        if not _needs_audio(job, args):
+            return True
+    final = _cache_get_audio(job, args, "preprocess")
+    if final is not None:
+        job["final"] = final
+        return True
+    vocals = _cache_get_audio(job, args, "separate")
+    if vocals is not None:
+        job["vocals"] = vocals
+        return True
+    return False
+
+def _stream_output_path(output_srt, stream_idx, language):
+    """'ep1.srt' -> 'ep1.2.eng.srt', so players still read the language tag."""
+    root, ext = os.path.splitext(output_srt)
+    suffix = f".{stream_idx}.{language}" if language else f".{stream_idx}"
+    return f"{root}{suffix}{ext or '.srt'}"
+
+def output_paths(output_srt, probe_data, stream_indices):
+    """The SRT each selected stream is written to."""
+    if len(stream_indices) == 1:
+        return [output_srt]
+    languages = {int(s["index"]): s.get("tags", {}).get("language", "") for s in probe_data.get("streams", [])}
+    return [_stream_output_path(output_srt, idx, languages.get(idx, "").lower()) for idx in stream_indices]
+
+def _stream_jobs(job, probe_data, stream_indices):
+    if len(stream_indices) == 1:
+        job["stream_idx"] = stream_indices[0]
+        return [job]
+    jobs = []
+    for idx, output_srt in zip(stream_indices, output_paths(job["output_srt"], probe_data, stream_indices)):
+        work_dir = os.path.join(job["work_dir"], f"stream{idx}")
+        os.makedirs(work_dir, exist_ok=True)
+        # Shallow copy: the cache and metrics objects are shared by all streams.
+        jobs.append(dict(job, stream_idx=idx, stream_label=str(idx), work_dir=work_dir, output_srt=output_srt))
+    return jobs
+
+def _plan_window(jobs, args):
+    """
+    Sets job["window"] for --start/--end: the range the output covers
+    ("start", "end", widened over lines an existing SRT has across its edges
+    with --splice) and the audio to decode ("offset", "duration"; one window
+    for all streams, since they come out of one ffmpeg run). Returns that
+    (offset, duration), or None without a range.
+    """
+    from src.postprocess import read_srt, splice_bounds
+
+    start, end = getattr(args, "start", None), getattr(args, "end", None)
+    if start is None and end is None:
+        return None
+    splice = getattr(args, "splice", False)
+    for j in jobs:
+        lo, hi = start or 0.0, end
+        if splice:
+            if not os.path.isfile(j["output_srt"]):
+                raise FileNotFoundError(f"Nothing to splice into: {j['output_srt']} does not exist")
+            j["splice"] = read_srt(j["output_srt"])
+            lo, hi = splice_bounds(j["splice"], lo, hi)
+        j["window"] = {"start": lo, "end": hi}
+    margin = SPLICE_MARGIN_S if splice else 0.0
+    offset = max(0.0, min(j["window"]["start"] for j in jobs) - margin)
+    ends = [j["window"]["end"] for j in jobs]
+    duration = None if None in ends else max(ends) + margin - offset
+    for j in jobs:
+        j["window"].update(offset=offset, duration=duration)
+    logging.info(f"Processing {offset:.1f}s to {'the end' if duration is None else f'{offset + duration:.1f}s'} only.")
+    return offset, duration
+
+def stage_extract(job, args, warmup=None):
+    """
+    Probe, select streams and extract stereo audio (48kHz WAV, or an array at
+    the separator rate). Returns a list with one job per selected stream
+    (args.streams); several streams are extracted in a single ffmpeg run.
+    With --start/--end ffmpeg seeks, so only the window is decoded.
+    A ModelWarmup created with start=False is started here, for the models
+    the cache did not make unnecessary, so they load during extraction.
+    """
+    from src.audio import probe_file, select_audio_streams, extract_audio, extract_audio_multi
+
+    with _stage(job, "probe"):
+        probe_data = probe_file(job["input"])
+        stream_indices = select_audio_streams(probe_data, getattr(args, "streams", None) or "best")
+    if job.get("metrics") is not None:
+        job["metrics"].set_duration(probe_data)
+    logging.info(f"Selected audio stream index: {', '.join(map(str, stream_indices))}")
+    jobs = _stream_jobs(job, probe_data, stream_indices)
+    start_s, duration_s = _plan_window(jobs, args) or (None, None)
+    metrics = job.get("metrics")
+    if start_s is not None and metrics is not None and metrics.duration_s:
+        # Real-time factors are against the audio actually processed.
+        metrics.duration_s = min(duration_s or metrics.duration_s, metrics.duration_s - start_s)
+
+    if job.get("cache") is not None:
+        pending = [j for j in jobs if not _resume_from_cache(j, args)]
+    else:
+        pending = jobs
+    if warmup is not None:
+        warmup.start(separator=any(_needs_separation(j, args) for j in jobs),
+                     asr=any("words" not in j for j in jobs))
+    if not pending:
+        return jobs
+
+    with _stage(job, "extract"):
+        if getattr(args, "in_memory", False):
+            from src.audio import extract_audio_array, extract_audio_arrays, write_wav
+            from src.separator import SAMPLE_RATE
+            # Decode straight to the separator's rate; no separate resample later.
+            if len(pending) == 1:
+                arrays = [extract_audio_array(job["input"], pending[0]["stream_idx"], sample_rate=SAMPLE_RATE,
+                                              start_s=start_s, duration_s=duration_s)]
+            else:
+                duration = metrics.duration_s if metrics is not None else duration_s
+                arrays = extract_audio_arrays(job["input"], [j["stream_idx"] for j in pending],
+                                              sample_rate=SAMPLE_RATE, duration_s=duration, start_s=start_s)
+            for j, audio in zip(pending, arrays):
+                j["extracted"] = audio
+                if getattr(args, "keep_temp", False):
+                    write_wav(os.path.join(j["work_dir"], "extracted_44k.wav"), audio, SAMPLE_RATE)
+            return jobs
+
+        paths = [os.path.join(j["work_dir"], "extracted_48k.wav") for j in pending]
+        if len(pending) == 1:
+            extract_audio(job["input"], pending[0]["stream_idx"], paths[0], duration_s=duration_s, start_s=start_s)
+        else:
+            extract_audio_multi(job["input"], [j["stream_idx"] for j in pending], paths,
+                                duration_s=duration_s, start_s=start_s)
+        for j, path in zip(pending, paths):
+            j["extracted"] = path
+    return jobs
+
+def _separate_file(path, work_dir, separator, args):
+    """separate_vocals, or its windowed variant with --separate-chunk-s."""
+    from src.separator import separator_options
+    chunk_s = getattr(args, "separate_chunk_s", 0)
+    if chunk_s:
+        from src.separator import separate_vocals_chunked
+        return separate_vocals_chunked(
+            path, work_dir, separator=separator, chunk_s=chunk_s,
+            overlap_s=getattr(args, "separate_overlap_s", 2.0), workers=getattr(args, "separate_procs", 1),
+            options=separator_options(args),
+        )
+    from src.separator import separate_vocals
+    return separate_vocals(path, work_dir, separator=separator, options=separator_options(args))
+
+def _separate_array(audio, separator, args):
+    chunk_s = getattr(args, "separate_chunk_s", 0)
+    if chunk_s:
+        from src.separator import separate_vocals_array_chunked
+        return separate_vocals_array_chunked(audio, separator, chunk_s=chunk_s,
+                                             overlap_s=getattr(args, "separate_overlap_s", 2.0))
+    from src.separator import separate_vocals_array
+    return separate_vocals_array(audio, separator)
+
+def _separate_gated(job, args, separator):
+    """
+    Runs separation only on detected speech regions (or the whole track
+    without --speech-gate), minus spans reused through the fingerprint index,
+    and puts the stem back on the original timeline. Returns the vocals (path
+    or array), or None when too little would be skipped to be worth it.
+    """
+    from src.vad import speech_regions, gate_report, compact_regions, expand_regions, subtract_regions
+    from src.separator import SAMPLE_RATE
+
+    in_memory = getattr(args, "in_memory", False)
+    if in_memory:
+        audio, sr = job["extracted"], SAMPLE_RATE
+    else:
+        import soundfile as sf
+        audio, sr = sf.read(job["extracted"], dtype="float32", always_2d=True)
+    total_s = len(audio) / sr
+
+    gate = getattr(args, "speech_gate", False)
+    if gate:
+        regions = speech_regions(audio, sr, margin_db=getattr(args, "gate_margin_db", 6.0))
+    else:
+        regions = [(0.0, total_s)]
+    regions = subtract_regions(regions, job.get("reuse", {}).get("spans", []))
+    if gate:
+        skipped = job["gate_skipped"] = gate_report(regions, total_s)
+    else:
+        skipped = 1.0 - sum(e - s for s, e in regions) / total_s if total_s > 0 else 0.0
+    if regions and skipped < 0.05:
+        logging.info("Too little to skip, separating the full track.")
+        return None
+
+    if not regions:
+        out, out_sr, offsets = np.zeros((0, audio.shape[1]), dtype=np.float32), SAMPLE_RATE, []
+    else:
+        compact, offsets = compact_regions(audio, sr, regions)
+        del audio
+        if in_memory:
+            job.pop("extracted")
+            out, out_sr = _separate_array(compact, separator, args), SAMPLE_RATE
+        else:
+            compact_path = os.path.join(job["work_dir"], "speech_only.wav")
+            sf.write(compact_path, compact, sr, subtype="FLOAT")
+            del compact
+            vocal_path = _separate_file(compact_path, job["work_dir"], separator, args)
+            out, out_sr = sf.read(vocal_path, dtype="float32", always_2d=True)
+
+    vocals = expand_regions(out, out_sr, regions, offsets, sr, total_s)
+    if in_memory:
+        job.pop("extracted", None)
+        return vocals
+    import soundfile as sf
+    vocal_wav_path = os.path.join(job["work_dir"], "vocals_gated.wav")
+    sf.write(vocal_wav_path, vocals, out_sr, subtype="FLOAT")
+    return vocal_wav_path
+
+def _fingerprint(job, args):
+    """(hashes, frames) of the job's stream: from the cache, the extracted audio, or a fresh 8kHz decode."""
+    import numpy as np
+    from src.fingerprint import FP_RATE, fingerprint, fingerprint_audio
+    from src.separator import SAMPLE_RATE
+
+    cache = job.get("cache")
+    key = job.get("cache_keys", {}).get("fingerprint")
+    if cache is not None and key:
+        cached = cache.get_array(key)
+        if cached is not None:
+            return cached[0], cached[1]
+    if "extracted" in job:
+        hashes, frames = fingerprint_audio(job["extracted"], SAMPLE_RATE if getattr(args, "in_memory", False) else None)
+    else:
+        from src.audio import extract_audio_array
+        hashes, frames = fingerprint(extract_audio_array(job["input"], job["stream_idx"], sample_rate=FP_RATE, channels=1)[:, 0])
+    if cache is not None and key:
+        cache.put_array(key, np.stack([hashes, frames]))
+    return hashes, frames
+
+def _find_reuse(job, args):
+    """
+    Looks the extracted audio up in the fingerprint index (src.fingerprint).
+    Segments known from other files of the series end up in job["reuse"]:
+    the spans to skip and the earlier subtitle events covering them. A job
+    resumed from the cache is only fingerprinted, so stage_finish still
+    adds it to the index.
+    """
+    from src.fingerprint import open_fingerprint_index, reused_events, report_reuse
+    from src.memo import series_from_path
+
+    index = open_fingerprint_index(args)
+    if index is None or "window" in job or getattr(args, "align", None):
+        # A window is not the whole file, and a script covers the reused spans too.
+        return
+    resumed = "extracted" not in job
+    with _stage(job, "fingerprint"):
+        hashes, frames = _fingerprint(job, args)
+        input_path = os.path.abspath(job["input"])
+        series = getattr(args, "series", None) or series_from_path(job["input"])
+        job["fingerprint"] = {"index": index, "series": series, "source": f"{input_path}#{job['stream_idx']}",
+                              "hashes": hashes, "frames": frames}
+        if resumed:
+            # Separation or ASR is already done; reused lines would only double the cached ones.
+            return
+        spans, events = [], []
+        for match in index.find(series, hashes, frames, exclude_input=input_path):
+            reused, span = reused_events(match)
+            if span is not None:
+                spans.append(span)
+                events.extend(reused)
+    if spans:
+        duration = job["metrics"].duration_s if job.get("metrics") is not None else None
+        report_reuse(spans, duration or spans[-1][1])
+        job["reuse"] = {"spans": spans, "events": events}
+
+def stage_separate(job, args, separator=None):
+    """Separate vocals from the extracted audio."""
+    if getattr(args, "fingerprint", False) and "fingerprint" not in job:
+        _find_reuse(job, args)
+    if "vocals" in job or "final" in job or not _needs_audio(job, args):
+        return job
+    with _stage(job, "separate"):
+        return _separate(job, args, separator)
+
+def _separate(job, args, separator):
+    in_memory = getattr(args, "in_memory", False)
+    gated = getattr(args, "speech_gate", False) or "reuse" in job
+    if separator is None and (in_memory or gated):
+        from src.separator import load_separator, separator_options
+        separator = load_separator(job["work_dir"], **separator_options(args))
+
+    vocals = _separate_gated(job, args, separator) if gated else None
+
+    if vocals is None and in_memory:
+        # Release the mix as soon as the stem exists; it is the largest buffer.
+        vocals = _separate_array(job.pop("extracted"), separator, args)
+    elif vocals is None:
+        # separate_vocals takes input path and output DIR.
+        # It returns the full path to the vocal file.
+        vocals = _separate_file(job["extracted"], job["work_dir"], separator, args)
+
+    if in_memory:
+        from src.audio import write_wav
+        from src.separator import SAMPLE_RATE
+        if getattr(args, "keep_temp", False):
+            write_wav(os.path.join(job["work_dir"], "vocals_44k.wav"), vocals, SAMPLE_RATE)
+    else:
+        if not vocals or not os.path.exists(vocals):
+            logging.error(f"Vocal separation failed; invalid vocal path returned: {vocals}")
+            raise FileNotFoundError(f"Vocal track not found at path: {vocals}")
+        logging.info(f"Vocals separated: {vocals}")
+
+    job["vocals"] = vocals
+    _cache_put_audio(job, args, "separate", vocals)
+    return job
+
+def load_asr_backend(args):
+    """
+    Loads what stage_transcribe runs on: a WhisperModel, or a process pool of
+    them when args.asr_procs > 1, wrapped in a CascadeBackend with a draft
+    model when args.cascade is set. Alignment (args.align) always gets one
+    WhisperModel. Callers own the result and should pass it to
+    close_asr_backend when done.
+    """
+    from src.asr import load_whisper_model, open_asr_pool, CascadeBackend, DRAFT_MODEL_ID
+
+    procs = getattr(args, "asr_procs", 1)
+    cpu_threads = getattr(args, "asr_threads", 0) or 0
+    compute_type = getattr(args, "asr_compute_type", None)
+    if getattr(args, "align", None):
+        return load_whisper_model(cpu_threads=cpu_threads, compute_type=compute_type)
+    if procs > 1:
+        backend = open_asr_pool(procs, cpu_threads=cpu_threads, compute_type=compute_type)
+    else:
+        backend = load_whisper_model(cpu_threads=cpu_threads, compute_type=compute_type)
+    if getattr(args, "cascade", False):
+        draft_id = getattr(args, "draft_model", None) or DRAFT_MODEL_ID
+        draft = load_whisper_model(draft_id, cpu_threads=cpu_threads, compute_type=compute_type)
+        return CascadeBackend(draft, backend, draft_id)
+    return backend
+
+def close_asr_backend(backend):
+    if hasattr(backend, "shutdown"):
+        backend.shutdown()
+
+def stage_transcribe(job, args, model=None):
+    """Preprocess vocals to 16kHz mono and run ASR."""
+    from src.audio import preprocess_audio
+
+    if "final" not in job and _needs_audio(job, args):
+        with _stage(job, "preprocess"):
+            if getattr(args, "in_memory", False):
+                from src.audio import preprocess_array, write_wav
+                from src.separator import SAMPLE_RATE
+                job["final"] = preprocess_array(job.pop("vocals"), SAMPLE_RATE)
+                if getattr(args, "keep_temp", False):
+                    write_wav(os.path.join(job["work_dir"], "preprocessed_16k.wav"), job["final"], 16000)
+            else:
+                final_wav = os.path.join(job["work_dir"], "preprocessed_16k.wav")
+                preprocess_audio(job["vocals"], final_wav)
+                job["final"] = final_wav
+            _cache_put_audio(job, args, "preprocess", job["final"])
+
+    with _stage(job, "asr"):
+        _transcribe(job, args, model)
+    logging.info(f"ASR complete. {len(job['events'])} events.")
+    return job
+
+def _without_reused(final, spans):
+    """
+    16kHz audio with the reused spans cut out, and a function putting word
+    times from it back on the full timeline.
+    """
+    from src.vad import subtract_regions, compact_regions, restore_times
+
+    if isinstance(final, str):
+        import soundfile as sf
+        final, _ = sf.read(final, dtype="float32")
+    regions = subtract_regions([(0.0, len(final) / 16000)], spans)
+    if not regions:
+        return None, None
+    compact, offsets = compact_regions(final, 16000, regions)
+
+    def restore(words):
+        if not words:
+            return words
+        starts = restore_times([w["start"] for w in words], regions, offsets, 16000)
+        return [dict(w, start=float(s), end=float(s + w["end"] - w["start"])) for w, s in zip(words, starts)]
+    return compact, restore
+
+def _transcribe(job, args, model):
+    from src.asr import transcribe_words, segment_smart_stream, decode_options
+
+    if "words" not in job:
+        audio, restore = job["final"], None
+        options = decode_options(getattr(args, "beam_size", None))
+        if "reuse" in job:
+            audio, restore = _without_reused(audio, job["reuse"]["spans"])
+        owned = model is None and audio is not None
+        if owned:
+            model = load_asr_backend(args)
+        try:
+            if audio is None:
+                job["words"] = []
+            elif getattr(args, "align", None):
+                from src.align import align_words
+                job["words"] = align_words(audio, model, _reference_lines(job, args))
+            elif getattr(args, "cascade", False):
+                from src.asr import CASCADE_LOGPROB, transcribe_words_cascade
+                logprob = getattr(args, "cascade_logprob", None)
+                job["words"] = transcribe_words_cascade(audio, model, logprob=CASCADE_LOGPROB if logprob is None else logprob,
+                                                        options=options)
+            elif getattr(args, "asr_procs", 1) > 1:
+                from src.asr import DEFAULT_CHUNK_S, transcribe_words_parallel
+                chunk_s = getattr(args, "asr_chunk_s", None) or DEFAULT_CHUNK_S
+                job["words"] = transcribe_words_parallel(audio, model, chunk_s=chunk_s, options=options)
+            else:
+                job["words"] = transcribe_words(audio, model=model, options=options)
+        finally:
+            if owned:
+                close_asr_backend(model)
+        if restore is not None:
+            job["words"] = restore(job["words"])
+        if job.get("cache") is not None and "reuse" not in job:
+            job["cache"].put_json(job["cache_keys"]["asr"], job["words"])
+
+    if getattr(args, "save_words", False):
+        from src.asr import save_words, words_path_for
+        # Raw words for src.sweep, before segmentation.
+        save_words(job["words"], words_path_for(job["output_srt"]))
+    words = job["words"]
+    if "window" in job:
+        words = _window_words(words, job["window"])
+    job["events"] = segment_smart_stream(words, pause_ms=400, max_chars=84, max_dur_s=7.0)
+
+def _reference_lines(job, args):
+    """The --align script, on the timeline of the decoded window if there is one."""
+    from src.align import read_reference
+    lines = read_reference(args.align)
+    window = job.get("window")
+    if window is None:
+        return lines
+    offset = window["offset"]
+    hi = float("inf") if window["duration"] is None else offset + window["duration"]
+    return [dict(l, start=l["start"] - offset, end=l["end"] - offset)
+            for l in lines if l["end"] > offset and l["start"] < hi]
+
+def _window_words(words, window):
+    """Words whose midpoint is in the window's range; the margin is only context."""
+    lo = window["start"] - window["offset"]
+    hi = float("inf") if window["end"] is None else window["end"] - window["offset"]
+    return [w for w in words if lo <= (w["start"] + w["end"]) / 2 < hi]
+
+def stage_finish(job, args):
+    """
+    Post-process, correct with Gemini and write the SRT. The events stay in
+    a columnar table (src.columnar) unless a stage needs dict events; those
+    end up in job["events"], the final table in job["table"].
+    """
+    from src import columnar
+    from src.postprocess import write_srt
+
+    # Post Processing (Timing/Shaping)
+    with _stage(job, "postprocess"):
+        table = columnar.run_post_processing(columnar.EventTable.from_events(job["events"]))
+    logging.info("Post-processing complete.")
+    job["table"] = table
+    events = None
+
+    # Gemini (a reference script is already the right text)
+    if not getattr(args, "no_gemini", False) and not getattr(args, "align", None):
+        from src.gemini import correct_text_only_with_gemini, open_upload_registry
+        from src.memo import open_correction_memo, series_from_path
+        with _stage(job, "gemini"):
+            events = correct_text_only_with_gemini(
+                job["final"], table.to_events(),
+                chunk_lines=getattr(args, "gemini_chunk_lines", 0), workers=getattr(args, "gemini_workers", 4),
+                codec=getattr(args, "gemini_codec", "opus"), registry=open_upload_registry(args),
+                memo=open_correction_memo(args), series=getattr(args, "series", None) or series_from_path(job["input"]),
+                min_confidence=getattr(args, "gemini_min_confidence", None),
+            )
+
+    if "reuse" in job:
+        events = _merge_reused(events if events is not None else table.to_events(), job["reuse"]["events"])
+    if "window" in job:
+        events = _place_window(events if events is not None else table.to_events(), job)
+
+    with _stage(job, "write"):
+        if events is None:
+            columnar.write_srt(table, job["output_srt"])
+        else:
+            write_srt(events, job["output_srt"])
+    logging.info(f"Subtitle saved to: {job['output_srt']}")
+    if events is not None:
+        job["events"] = events
+
+    fp = job.get("fingerprint")
+    if fp is not None:
+        fp["index"].add(fp["series"], fp["source"], fp["hashes"], fp["frames"],
+                        os.path.abspath(job["output_srt"]), events if events is not None else table.rows())
+    return job
+
+def _place_window(events, job):
+    """Window events on the file's timeline, spliced into the old SRT with --splice."""
+    from src.postprocess import splice_events
+    window = job["window"]
+    for ev in events:
+        ev["start"] += window["offset"]
+        ev["end"] += window["offset"]
+    if "splice" not in job:
+        return events
+    spliced = splice_events(job["splice"], events, window["start"], window["end"])
+    logging.info(f"Spliced {len(events)} new line(s) into {len(spliced) - len(events)} kept from {job['output_srt']}.")
+    return spliced
+
+def _merge_reused(events, reused):
+    """
+    Fresh and reused events in time order, each ending MIN_GAP_S before the
+    next. A line that clipping leaves shorter than REUSE_MIN_DUR_S is the
+    same speech heard twice at a seam: it is dropped when the next line
+    repeats its words and otherwise merged into the next line.
+    """
+    from src.memo import normalize_line
+    from src.postprocess import reshape_text_string
+
+    merged = sorted(events + [dict(ev) for ev in reused], key=lambda ev: ev["start"])
+    out = []
+    for ev, nxt in zip(merged, merged[1:] + [None]):
+        if nxt is not None:
+            ev["end"] = min(ev["end"], nxt["start"] - MIN_GAP_S)
+            if ev["end"] - ev["start"] < REUSE_MIN_DUR_S:
+                text, nxt_text = ev.get("text", "").strip(), nxt.get("text", "").strip()
+                if normalize_line(text) not in normalize_line(nxt_text):
+                    nxt["text"] = reshape_text_string(f"{text} {nxt_text}", max_chars=42)
+                nxt["start"] = ev["start"]
+                continue
+        out.append(ev)
+    return out
+
+def _needs_separation(job, args):
+    return "vocals" not in job and "final" not in job and _needs_audio(job, args)
+
+def run_job(job, args, separator=None, model=None, warmup=None):
+    """
+    Runs every stage for one input in order. Returns the finished job, or a
+    list of them when args.streams selects several audio streams; the models
+    are then loaded once and shared by all streams. With a ModelWarmup
+    (src.warmup) the models come from its background loads.
+    """
+    jobs = stage_extract(job, args, warmup=warmup)
+    owned = False
+    if warmup is None and len(jobs) > 1:
+        if separator is None and any(_needs_separation(j, args) for j in jobs):
+            from src.separator import load_separator, separator_options
+            separator = load_separator(job["work_dir"], **separator_options(args))
+        owned = model is None and any("words" not in j for j in jobs)
+        if owned:
+            model = load_asr_backend(args)
+    try:
+        done = []
+        for j in jobs:
+            # Wait for a warming model only when a stage needs it; cache hits never do.
+            if warmup is not None and separator is None and _needs_separation(j, args):
+                separator = warmup.separator()
+            j = stage_separate(j, args, separator=separator)
+            if warmup is not None and model is None and "words" not in j:
+                model = warmup.model()
+            j = stage_transcribe(j, args, model=model)
+            done.append(stage_finish(j, args))
+        return done[0] if len(done) == 1 else done
+    finally:
+        if owned:
+            close_asr_backend(model)
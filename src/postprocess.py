@@ -12,15 +12,23 @@ SOFT_PUNCT = (",",)
 def _wtext(w: Dict[str,Any]) -> str:
     return (w.get("word") or "").strip()
 
+def _joined_len(total_chars, n_words):
+    # len(" ".join(words)) from the summed word lengths, without joining.
+    return total_chars + n_words - 1 if n_words else 0
+
 def get_balanced_split_index(words: List[str], max_chars: int) -> int:
     if len(words) < 2: return len(words)
     best_cut = -1
     best_score = -float('inf')
 
-    for i in range(len(words) - 1):
-        l1 = " ".join(words[:i+1])
-        l2 = " ".join(words[i+1:])
-        len1, len2 = len(l1), len(l2)
+    # Line lengths for every cut come from one running prefix sum.
+    n = len(words)
+    total = sum(len(w) for w in words)
+    prefix = 0
+    for i in range(n - 1):
+        prefix += len(words[i])
+        len1 = _joined_len(prefix, i + 1)
+        len2 = _joined_len(total - prefix, n - i - 1)
 
         score = 0
         if len1 > max_chars: score -= 5000
@@ -58,12 +66,21 @@ def apply_global_start_offset(events, offset_ms=50):
             ev["end"] = ev["start"] + 0.1
     return events
 
+def _text_len(words):
+    return _joined_len(sum(len(_wtext(w)) for w in words), len(words))
+
+def _concat_len(len_a, words_a, len_b, words_b):
+    # Joined length of words_a + words_b from the two joined lengths.
+    return len_a + len_b + 1 if words_a and words_b else len_a + len_b
+
 def apply_extension_then_merge(events, target_cps=22.0, max_silence_s=1.0, max_chars_total=84, min_gap=0.084):
     if not events: return []
+    # Text length per event, kept in step with events so merges never re-join text.
+    lens = [_text_len(ev["words"]) for ev in events]
     i = 0
     while i < len(events):
         ev = events[i]
-        txt_len = len(" ".join(_wtext(w) for w in ev["words"]))
+        txt_len = lens[i]
         dur = ev["end"] - ev["start"]
         cps = txt_len / max(0.1, dur)
         if cps <= target_cps and dur >= 1.0:
@@ -89,21 +106,23 @@ def apply_extension_then_merge(events, target_cps=22.0, max_silence_s=1.0, max_c
         if min_g <= max_silence_s:
             side = 'prev' if gap_prev <= gap_next else 'next'
             if side == 'prev':
-                new_w = prev_ev["words"] + ev["words"]
-                if len(" ".join(_wtext(w) for w in new_w)) <= max_chars_total:
-                    prev_ev["words"] = new_w; prev_ev["end"] = ev["end"]
-                    events.pop(i); i -= 1; merged = True
+                new_len = _concat_len(lens[i-1], prev_ev["words"], lens[i], ev["words"])
+                if new_len <= max_chars_total:
+                    prev_ev["words"] = prev_ev["words"] + ev["words"]; prev_ev["end"] = ev["end"]
+                    lens[i-1] = new_len
+                    events.pop(i); lens.pop(i); i -= 1; merged = True
             elif side == 'next':
-                new_w = ev["words"] + next_ev["words"]
-                if len(" ".join(_wtext(w) for w in new_w)) <= max_chars_total:
-                    ev["words"] = new_w; ev["end"] = next_ev["end"]
-                    events.pop(i+1); merged = True
+                new_len = _concat_len(lens[i], ev["words"], lens[i+1], next_ev["words"])
+                if new_len <= max_chars_total:
+                    ev["words"] = ev["words"] + next_ev["words"]; ev["end"] = next_ev["end"]
+                    lens[i] = new_len
+                    events.pop(i+1); lens.pop(i+1); merged = True
         if not merged: i += 1
     return events
 
-def apply_hybrid_linger_with_report(events: List[Dict[str, Any]], linger_ms: int = 600) -> List[Dict[str, Any]]:
+def apply_hybrid_linger_with_report(events: List[Dict[str, Any]], linger_ms: int = 600, min_gap: float = 0.084) -> List[Dict[str, Any]]:
     linger_s = linger_ms / 1000.0
-    MIN_GAP = 0.084
+    MIN_GAP = min_gap
     CHAIN_THRESHOLD = 0.500
     FORBIDDEN_MIDPOINT = (MIN_GAP + CHAIN_THRESHOLD) / 2.0
     for i in range(len(events)):
@@ -178,12 +197,119 @@ def write_srt(events, out_path):
 
             f.write(f"{i}\n{_fmt_ms(ev['start'])} --> {_fmt_ms(ev['end'])}\n{text}\n\n")
 
-def run_post_processing(events):
-    # Chain of post processing
-    events = apply_global_start_offset(events, offset_ms=50)
-    events = apply_extension_then_merge(events, target_cps=22.0)
-    events = apply_hybrid_linger_with_report(events, linger_ms=600)
-    # Shape text
-    for ev in events: ev["text"] = shape_block_text(ev["words"], max_chars=42)
-    events = enforce_timing_constraints(events, min_dur=1.0, min_gap=0.084)
+def _parse_ts(ts):
+    hms, ms = ts.strip().replace(".", ",").split(",")
+    h, m, sec = hms.split(":")
+    return int(h) * 3600 + int(m) * 60 + int(sec) + int(ms) / 1000.0
+
+def read_srt(path):
+    """Parses an SRT file into [{"start", "end", "text"}] (what write_srt writes, or a hand-edited copy)."""
+    with open(path, "r", encoding="utf-8-sig") as f:
+        blocks = f.read().replace("\r\n", "\n").strip().split("\n\n")
+    events = []
+    for block in blocks:
+        lines = block.split("\n")
+        # The index line is optional in the wild; find the timing line.
+        for k, line in enumerate(lines[:2]):
+            if "-->" in line:
+                start, end = line.split("-->")
+                events.append({"start": _parse_ts(start), "end": _parse_ts(end.split()[0]),
+                               "text": "\n".join(lines[k + 1:]).strip()})
+                break
     return events
+
+def splice_bounds(events, start, end=None):
+    """
+    Widens the range [start, end) (end None: to the end) so that no existing
+    event straddles either edge; those events are replaced, not cut.
+    """
+    lo, hi = start, end
+    for ev in events:
+        if ev["start"] < lo < ev["end"]:
+            lo = ev["start"]
+        if hi is not None and ev["start"] < hi < ev["end"]:
+            hi = ev["end"]
+    return lo, hi
+
+def splice_events(old, new, lo, hi=None):
+    """
+    Existing events outside [lo, hi) with the new (post-processed) ones in
+    between. The timing passes that reach across a gap, linger chaining and
+    gap/min duration, are re-run on the two pairs that meet at the seams; the
+    rest of the old file is left as it was. Merges never cross a seam: old
+    events carry no word timings.
+    """
+    before = [ev for ev in old if ev["end"] <= lo]
+    after = [ev for ev in old if hi is not None and ev["start"] >= hi]
+    events = before + new + after
+    for i in sorted({len(before) - 1, len(before) + len(new) - 1}):
+        if 0 <= i < len(events) - 1:
+            pair = events[i:i + 2]
+            # Zero linger: snaps the gap the way the chain rule would, adds nothing.
+            apply_hybrid_linger_with_report(pair, linger_ms=0)
+            # The event after the pair only bounds it; a copy stays untouched.
+            enforce_timing_constraints(pair + [dict(ev) for ev in events[i + 2:i + 3]])
+    return events
+
+def run_post_processing(events, **params):
+    # Chain of post processing, run on the columnar store (src.columnar):
+    # offset -> extension/merge -> linger -> text shaping -> gap/min duration.
+    # params override the pass settings (see columnar.run_post_processing).
+    from src import columnar
+    if not events: return events
+    table = columnar.EventTable.from_events(events)
+    table = columnar.run_post_processing(table, **params)
+    return table.to_events()
+
+def _seal_gap_s(target_cps=22.0, max_silence_s=1.0, max_chars_total=84, linger_ms=600, min_gap=0.084):
+    # Beyond this gap nothing on one side can affect the other: no merge
+    # (max_silence_s), no extension reaching across (max_chars_total /
+    # target_cps) and no linger/gap adjustment against the next start.
+    return max_silence_s + max_chars_total / target_cps + linger_ms / 1000.0 + min_gap
+
+def iter_post_processing(items, max_hold_s=None):
+    """
+    Incremental run_post_processing.
+    items yields raw events interleaved with float watermarks (no later event
+    starts before the watermark). Events are committed in runs that end at a
+    gap wide enough that later events cannot change them; those runs come out
+    identical to the batch passes. If max_hold_s is set, events older than
+    watermark - max_hold_s are committed anyway to bound latency; only
+    the boundary of such a forced run can differ from batch output.
+    """
+    seal = _seal_gap_s()
+    pending = []
+    watermark = 0.0
+
+    def commit(n):
+        nonlocal pending
+        run, pending = pending[:n], pending[n:]
+        out = run_post_processing(run)
+        if pending and out and out[-1]["end"] > pending[0]["start"] - 0.084:
+            # Forced boundary: never overlap the next, still unprocessed event.
+            out[-1]["end"] = max(out[-1]["start"] + 0.1, pending[0]["start"] - 0.084)
+        return out
+
+    for item in items:
+        if isinstance(item, float):
+            watermark = max(watermark, item)
+        else:
+            pending.append(item)
+            watermark = max(watermark, item["start"])
+        if not pending:
+            continue
+
+        # Last sealed boundary: between two pending events, or after the last
+        # one once the watermark has moved far enough past it.
+        n = len(pending) if watermark - pending[-1]["end"] >= seal else 0
+        if not n:
+            for j in range(len(pending) - 1, 0, -1):
+                if pending[j]["start"] - pending[j - 1]["end"] >= seal:
+                    n = j
+                    break
+        if not n and max_hold_s is not None:
+            n = sum(1 for ev in pending if ev["end"] < watermark - max_hold_s)
+        if n:
+            yield from commit(n)
+    if pending:
+        yield from commit(len(pending))
@@ -5,29 +5,72 @@ Isolates vocal tracks from audio using BS-Roformer-Viperx model (FV4).
 """
 import os
 import logging
-from audio_separator.separator import Separator
 
-def separate_vocals(input_path, output_dir):
+# The model filename for FV4 in audio-separator is typically 'model_bs_roformer_ep_317_sdr_12.9755.ckpt'
+# or known by key 'BS-Roformer-Viperx-1297'.
+# We use the key which the library resolves.
+MODEL_NAME = "BS-Roformer-Viperx-1297"
+
+# Rate the model runs at; in-memory mode decodes straight to it.
+SAMPLE_RATE = 44100
+
+# audio-separator's MDXC defaults (BS-Roformer runs as MDXC); the dict is
+# replaced as a whole, so overrides are merged into a full copy.
+MDXC_DEFAULTS = {"segment_size": 256, "override_model_segment_size": False, "batch_size": 1, "overlap": 8, "pitch_shift": 0}
+
+def separator_options(args):
+    """load_separator keyword arguments from --separator-batch-size/--separator-segment-size."""
+    return {"batch_size": getattr(args, "separator_batch_size", None),
+            "segment_size": getattr(args, "separator_segment_size", None)}
+
+def load_separator(output_dir, batch_size=None, segment_size=None):
     """
-    Separates vocals using audio-separator with FV4 model.
-    Returns the path to the vocal file.
+    Creates a Separator with the FV4 model loaded.
+    The returned instance can be reused across files via separate_vocals(separator=...).
+    segment_size replaces the model's own segment size when given.
     """
+    # Imported here: audio-separator pulls in torch, which takes seconds.
+    from audio_separator.separator import Separator
+
     logging.info("Initializing Audio Separator (FV4)...")
 
-    # Initialize Separator
     # We use output_single_stem="Vocals" to only save the vocal track
+    mdxc_params = dict(MDXC_DEFAULTS)
+    if batch_size:
+        mdxc_params["batch_size"] = batch_size
+    if segment_size:
+        mdxc_params.update(segment_size=segment_size, override_model_segment_size=True)
     sep = Separator(
         output_dir=output_dir,
-        output_single_stem="Vocals"
+        output_single_stem="Vocals",
+        sample_rate=SAMPLE_RATE,
+        mdxc_params=mdxc_params,
     )
 
-    # Load the FV4 model
-    # The model filename for FV4 in audio-separator is typically 'model_bs_roformer_ep_317_sdr_12.9755.ckpt'
-    # or known by key 'BS-Roformer-Viperx-1297'.
-    # We use the key which the library resolves.
-    model_name = "BS-Roformer-Viperx-1297"
-    logging.info(f"Loading model: {model_name}")
-    sep.load_model(model_filename=model_name)
+    logging.info(f"Loading model: {MODEL_NAME}")
+    sep.load_model(model_filename=MODEL_NAME)
+    return sep
+
+def _set_output_dir(sep, output_dir):
+    # The loaded model instance keeps its own copy of output_dir, so a resident
+    # separator has to be pointed at the new directory in both places.
+    sep.output_dir = output_dir
+    model_instance = getattr(sep, "model_instance", None)
+    if model_instance is not None:
+        model_instance.output_dir = output_dir
+
+def separate_vocals(input_path, output_dir, separator=None, options=None):
+    """
+    Separates vocals using audio-separator with FV4 model.
+    If separator is given, it is reused instead of loading the model again
+    (otherwise one is loaded with the load_separator options).
+    Returns the path to the vocal file.
+    """
+    if separator is None:
+        sep = load_separator(output_dir, **(options or {}))
+    else:
+        sep = separator
+        _set_output_dir(sep, output_dir)
 
     logging.info(f"Separating {input_path}...")
     # Perform separation
@@ -64,3 +107,219 @@ def separate_vocals(input_path, output_dir):
         f"Separation failed: none of the expected output files exist in '{output_dir}'. "
         f"Reported output files: {output_files}"
     )
+
+def separate_vocals_array(audio, separator):
+    """
+    Separates vocals from an in-memory (frames, channels) float32 array that is
+    already at SAMPLE_RATE.
+    Returns the vocal stem as a (frames, channels) float32 array; nothing is
+    written to disk.
+    """
+    import numpy as np
+    from audio_separator.separator.uvr_lib_v5 import spec_utils
+
+    model = getattr(separator, "model_instance", None)
+    if model is None or not hasattr(model, "demix"):
+        raise RuntimeError("In-memory separation needs a loaded model with a demix() method.")
+
+    logging.info(f"Separating {len(audio) / SAMPLE_RATE:.1f}s in memory...")
+    # prepare_mix expects (frames, channels) and returns (channels, frames).
+    mix = model.prepare_mix(np.asarray(audio, dtype=np.float32))
+    mix = spec_utils.normalize(wave=mix, max_peak=model.normalization_threshold, min_peak=model.amplification_threshold)
+    try:
+        source = model.demix(mix=mix)
+    finally:
+        model.clear_gpu_cache()
+
+    if isinstance(source, dict):
+        stems = {name.lower(): wave for name, wave in source.items()}
+        if "vocals" not in stems:
+            raise RuntimeError(f"Separation failed: no vocal stem in {list(source)}")
+        vocals = stems["vocals"]
+    else:
+        vocals = source
+    vocals = spec_utils.normalize(wave=vocals, max_peak=model.normalization_threshold, min_peak=model.amplification_threshold)
+    return np.ascontiguousarray(vocals.T, dtype=np.float32)
+
+# --- Chunked separation -----------------------------------------------------
+# Long inputs are separated in fixed-length overlapping windows, so memory
+# depends on the window length rather than the film's. Seams are blended with
+# complementary raised-cosine fades; they sum to one, so where both windows
+# agree the blend leaves the signal unchanged.
+
+DEFAULT_CHUNK_S = 300.0
+DEFAULT_OVERLAP_S = 2.0
+
+def chunk_windows(total, chunk, overlap):
+    """
+    (start, end) sample ranges of length chunk, each overlapping the previous
+    one by overlap; the last one ends at total and is longer than overlap.
+    """
+    hop = max(1, chunk - overlap)
+    windows = []
+    start = 0
+    while True:
+        end = min(start + chunk, total)
+        windows.append((start, end))
+        if end >= total:
+            return windows
+        start += hop
+
+def _output_ranges(windows, ratio):
+    # Window bounds in output samples (the separator may resample).
+    return [(round(start * ratio), round(end * ratio)) for start, end in windows]
+
+def _fit(block, length):
+    """Trims or zero-pads a (frames, channels) block to length frames."""
+    import numpy as np
+    if len(block) >= length:
+        return block[:length]
+    return np.concatenate([block, np.zeros((length - len(block), block.shape[1]), dtype=block.dtype)])
+
+class _SeamStitcher:
+    """Writes overlapping windows in order through write(), crossfading each seam."""
+
+    def __init__(self, write):
+        self.write = write
+        self.held = None     # tail of the previous window, still to be blended
+
+    def push(self, block, keep):
+        """block starts where the held tail starts; its last keep frames overlap the next window."""
+        import numpy as np
+        block = np.array(block, dtype=np.float32)
+        if self.held is not None and len(self.held):
+            n = min(len(self.held), len(block))
+            fade = (np.sin(0.5 * np.pi * (np.arange(n) + 0.5) / n) ** 2)[:, None].astype(np.float32)
+            block[:n] = self.held[:n] * (1.0 - fade) + block[:n] * fade
+        cut = len(block) - keep
+        self.write(block[:cut])
+        self.held = block[cut:]
+
+    def close(self):
+        if self.held is not None and len(self.held):
+            self.write(self.held)
+        self.held = None
+
+_pool_separator = None
+
+def _pool_init(output_dir, options):
+    global _pool_separator
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    _pool_separator = load_separator(output_dir, **options)
+
+def _pool_separate(input_path, output_dir):
+    return separate_vocals(input_path, output_dir, separator=_pool_separator)
+
+def open_separator_pool(workers, output_dir, options=None):
+    """Process pool with one resident Separator per process (spawn, like the ASR pool)."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    logging.info(f"Starting separation pool: {workers} processes")
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_pool_init,
+        initargs=(output_dir, options or {}),
+    )
+
+def separate_vocals_chunked(input_path, output_dir, separator=None, chunk_s=DEFAULT_CHUNK_S,
+                            overlap_s=DEFAULT_OVERLAP_S, workers=1, options=None):
+    """
+    Separates input_path window by window and streams the crossfaded vocal
+    stem to output_dir. Only a few windows are in memory at any time, however
+    long the input. With workers > 1 windows are separated in that many
+    processes, each loading its own model with the load_separator options.
+    Returns the path to the vocal file.
+    """
+    import shutil
+    import collections
+    import soundfile as sf
+
+    info = sf.info(input_path)
+    sr, total = info.samplerate, info.frames
+    windows = chunk_windows(total, int(chunk_s * sr), int(overlap_s * sr))
+    if len(windows) == 1:
+        return separate_vocals(input_path, output_dir, separator=separator, options=options)
+    logging.info(f"Chunked separation: {total / sr:.1f}s in {len(windows)} windows "
+                 f"of {chunk_s:.0f}s with {overlap_s:.1f}s crossfades.")
+
+    chunk_dir = os.path.join(output_dir, "chunks")
+    os.makedirs(chunk_dir, exist_ok=True)
+
+    def cut(k):
+        start, end = windows[k]
+        path = os.path.join(chunk_dir, f"window_{k:04d}.wav")
+        with sf.SoundFile(input_path) as f:
+            f.seek(start)
+            sf.write(path, f.read(end - start, dtype="float32", always_2d=True), sr, subtype="FLOAT")
+        return path
+
+    pool = open_separator_pool(workers, chunk_dir, options) if workers > 1 else None
+    if pool is None and separator is None:
+        separator = load_separator(chunk_dir, **(options or {}))
+    out_path = os.path.join(output_dir, "vocals_chunked.wav")
+    writer = None
+    try:
+        # At most 2 windows per worker are cut and waiting, which bounds disk and RAM.
+        in_flight = collections.deque()
+        submitted = 0
+        for k in range(len(windows)):
+            if pool is not None:
+                while submitted < len(windows) and len(in_flight) < 2 * workers:
+                    path = cut(submitted)
+                    in_flight.append((path, pool.submit(_pool_separate, path, chunk_dir)))
+                    submitted += 1
+                window_path, future = in_flight.popleft()
+                vocal_path = future.result()
+            else:
+                window_path = cut(k)
+                vocal_path = separate_vocals(window_path, chunk_dir, separator=separator)
+            block, out_sr = sf.read(vocal_path, dtype="float32", always_2d=True)
+            os.remove(vocal_path)
+            os.remove(window_path)
+
+            if writer is None:
+                ranges = _output_ranges(windows, out_sr / sr)
+                writer = sf.SoundFile(out_path, "w", samplerate=out_sr, channels=block.shape[1], subtype="FLOAT")
+                stitcher = _SeamStitcher(writer.write)
+            start, end = ranges[k]
+            keep = end - ranges[k + 1][0] if k + 1 < len(ranges) else 0
+            stitcher.push(_fit(block, end - start), keep)
+        stitcher.close()
+    finally:
+        if writer is not None:
+            writer.close()
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    return out_path
+
+def separate_vocals_array_chunked(audio, separator, chunk_s=DEFAULT_CHUNK_S, overlap_s=DEFAULT_OVERLAP_S):
+    """
+    separate_vocals_array over overlapping windows, so the model's working
+    buffers are sized by the window instead of the whole track.
+    """
+    import numpy as np
+
+    windows = chunk_windows(len(audio), int(chunk_s * SAMPLE_RATE), int(overlap_s * SAMPLE_RATE))
+    if len(windows) == 1:
+        return separate_vocals_array(audio, separator)
+    logging.info(f"Chunked separation: {len(audio) / SAMPLE_RATE:.1f}s in {len(windows)} windows.")
+
+    out = None
+    pos = 0
+    def write(block):
+        nonlocal pos
+        out[pos:pos + len(block)] = block
+        pos += len(block)
+
+    stitcher = _SeamStitcher(write)
+    for k, (start, end) in enumerate(windows):
+        block = separate_vocals_array(audio[start:end], separator)
+        if out is None:
+            out = np.empty((len(audio), block.shape[1]), dtype=np.float32)
+        keep = end - windows[k + 1][0] if k + 1 < len(windows) else 0
+        stitcher.push(_fit(block, end - start), keep)
+    stitcher.close()
+    return out
@@ -0,0 +1,492 @@
+"""
+Resident transcription daemon and its client.
+
+`main.py --serve` loads the Separator and Whisper once and accepts jobs over
+a local HTTP/JSON API, so each request skips the torch / faster-whisper /
+audio-separator imports and model loading:
+
+    POST   /jobs               {"input", "output", "priority", "options"} -> job
+    GET    /jobs               all jobs
+    GET    /jobs/<id>          one job (status, stage, metrics, outputs)
+    DELETE /jobs/<id>          cancel; running jobs stop at the next stage boundary
+    GET    /jobs/<id>/events   progress as newline-delimited JSON until the job ends
+    GET    /health             queue and memory-budget state
+
+Jobs wait in a priority queue (higher first, then submission order). A job
+starts only when its estimated memory fits in what is left of the budget,
+or when nothing else is running, so an oversized job still runs on its own.
+The resident models are shared: separation and ASR of different jobs take
+turns, while extraction, post-processing and Gemini overlap freely.
+
+Finished jobs and their event logs are forgotten after FINISHED_TTL_S, or
+sooner once more than KEEP_FINISHED have piled up.
+
+The daemon listens on loopback only unless it is given a token
+(--server-token); with a token every request must carry it as
+"Authorization: Bearer <token>". Job options that would need a different
+ASR backend than the resident one (e.g. align on a pool or cascade daemon)
+are refused at submission.
+
+`main.py --server URL` submits inputs to a running daemon and follows their
+progress instead of processing locally.
+"""
+import os
+import hmac
+import json
+import time
+import heapq
+import shutil
+import logging
+import argparse
+import itertools
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+# Per-job options a client may set; everything else comes from the daemon's own arguments.
+JOB_OPTIONS = (
+    "no_gemini", "streams", "in_memory", "speech_gate", "gate_margin_db", "fingerprint", "refresh",
+    "separate_chunk_s", "separate_overlap_s", "start", "end", "splice", "align", "save_words",
+    "gemini_chunk_lines", "gemini_workers", "gemini_codec", "gemini_min_confidence", "series", "no_memo",
+)
+
+# Rough memory model for admission: resident models are already loaded, a job
+# adds a fixed working set plus decoded PCM (44.1kHz stereo float32) for the
+# mix and the stem, and a third copy when stages hand arrays over in memory.
+JOB_BASE_MB = 256
+PCM_MB_PER_S = 44100 * 2 * 4 / 1e6
+
+FINAL_STATES = ("done", "failed", "cancelled")
+KEEP_FINISHED = 200         # finished jobs kept for GET /jobs
+FINISHED_TTL_S = 3600.0     # and for at most this long
+
+class JobCancelled(Exception):
+    pass
+
+def estimate_job_mb(duration_s, streams, in_memory):
+    copies = 3 if in_memory else 2
+    return JOB_BASE_MB + (duration_s or 0) * PCM_MB_PER_S * copies * max(1, streams)
+
+def _public(record):
+    return {k: v for k, v in record.items() if not k.startswith("_")}
+
+def asr_backend_kind(args):
+    """What load_asr_backend(args) builds: "model", "pool" or "cascade"."""
+    if getattr(args, "align", None):
+        return "model"
+    if getattr(args, "cascade", False):
+        return "cascade"
+    return "pool" if getattr(args, "asr_procs", 1) > 1 else "model"
+
+def is_loopback(host):
+    import ipaddress
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class JobServer:
+    def __init__(self, args, workers=2, memory_budget_mb=8192, keep_finished=KEEP_FINISHED,
+                 finished_ttl_s=FINISHED_TTL_S):
+        from src.cache import open_cache
+        from src.separator import load_separator, separator_options
+        from src.pipeline import load_asr_backend
+
+        self.args = args
+        self.memory_budget_mb = memory_budget_mb
+        self.keep_finished = keep_finished
+        self.finished_ttl_s = finished_ttl_s
+        self.work_root = tempfile.mkdtemp(prefix="livesubs-server-")
+        self.cache = open_cache(args)
+        self.separator = load_separator(self.work_root, **separator_options(args))
+        self.model = load_asr_backend(args)
+        self.backend_kind = asr_backend_kind(args)
+        self.separate_lock = threading.Lock()
+        self.asr_lock = threading.Lock()
+
+        self.jobs = {}
+        self._queue = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._used_mb = 0.0
+        self._running = 0
+        self._stopping = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=f"server-{n}", daemon=True)
+            for n in range(max(1, workers))
+        ]
+        for t in self._threads: t.start()
+
+    # --- queue ------------------------------------------------------------
+
+    def submit(self, input_path, output_srt, priority=0, options=None):
+        from src.audio import probe_file, select_audio_streams
+
+        job_args = argparse.Namespace(**vars(self.args))
+        for key, value in (options or {}).items():
+            if key not in JOB_OPTIONS:
+                raise ValueError(f"Unknown job option: {key}")
+            setattr(job_args, key, value)
+        need = asr_backend_kind(job_args)
+        if need != self.backend_kind:
+            raise ValueError(f"These options need a {need} ASR backend but the daemon runs a {self.backend_kind}; "
+                             f"start a daemon with matching --align / --asr-procs / --cascade")
+        align = getattr(job_args, "align", None)
+        if align and not os.path.isfile(align):
+            raise FileNotFoundError(f"align file not found: {align}")
+        splice = getattr(job_args, "splice", False)
+        if splice and getattr(job_args, "start", None) is None and getattr(job_args, "end", None) is None:
+            raise ValueError("splice needs start and/or end")
+
+        if not os.path.isfile(input_path):
+            raise FileNotFoundError(f"Input not found: {input_path}")
+        # Probe up front: bad inputs fail at submission and the estimate knows the duration.
+        probe_data = probe_file(input_path)
+        streams = select_audio_streams(probe_data, getattr(job_args, "streams", None) or "best")
+        if splice:
+            from src.pipeline import output_paths
+            for path in output_paths(output_srt, probe_data, streams):
+                if not os.path.isfile(path):
+                    raise FileNotFoundError(f"Nothing to splice into: {path} does not exist")
+        try:
+            duration = float(probe_data["format"]["duration"])
+        except (KeyError, TypeError, ValueError):
+            duration = None
+
+        seq = next(self._seq)
+        record = {
+            "id": f"{seq + 1:06d}", "input": input_path, "output": output_srt, "priority": priority,
+            "status": "queued", "stage": None, "error": None, "outputs": [], "metrics": None,
+            "estimate_mb": round(estimate_job_mb(duration, len(streams), getattr(job_args, "in_memory", False))),
+            "submitted": time.time(), "started": None, "finished": None,
+            "_args": job_args, "_events": [], "_cancel": threading.Event(),
+        }
+        with self._cond:
+            self._evict()
+            self.jobs[record["id"]] = record
+            heapq.heappush(self._queue, (-priority, seq, record["id"]))
+            self._event(record, {"event": "queued", "estimate_mb": record["estimate_mb"]})
+            self._cond.notify_all()
+        logging.info(f"Job {record['id']} queued: {input_path} (priority {priority}, ~{record['estimate_mb']} MB)")
+        return record
+
+    def cancel(self, job_id):
+        with self._cond:
+            record = self.jobs[job_id]
+            if record["status"] == "queued":
+                self._queue = [item for item in self._queue if item[2] != job_id]
+                heapq.heapify(self._queue)
+                self._finish(record, "cancelled")
+            elif record["status"] == "running":
+                record["_cancel"].set()
+                self._event(record, {"event": "cancelling"})
+            return record
+
+    def health(self):
+        with self._cond:
+            return {
+                "status": "ok", "running": self._running, "queued": len(self._queue),
+                "used_mb": round(self._used_mb), "budget_mb": self.memory_budget_mb,
+            }
+
+    def shutdown(self):
+        from src.pipeline import close_asr_backend
+        with self._cond:
+            self._stopping = True
+            for record in self.jobs.values():
+                record["_cancel"].set()
+            self._cond.notify_all()
+        for t in self._threads: t.join()
+        close_asr_backend(self.model)
+        shutil.rmtree(self.work_root, ignore_errors=True)
+
+    # --- events -----------------------------------------------------------
+
+    def _event(self, record, event):
+        # Condition() wraps an RLock, so this is safe from code already holding it.
+        with self._cond:
+            record["_events"].append(dict(event, job=record["id"], time=time.time()))
+            if event.get("event") == "stage_start":
+                record["stage"] = event["stage"] if event.get("stream") is None else f"{event['stage']}[{event['stream']}]"
+            self._cond.notify_all()
+
+    def events(self, job_id, start=0, timeout=None):
+        """
+        Events from index start on; blocks until there are new ones or the
+        job has ended. A job evicted meanwhile counts as ended.
+        """
+        with self._cond:
+            record = self.jobs.get(job_id)
+            if record is None:
+                return [], True
+            self._cond.wait_for(
+                lambda: len(record["_events"]) > start or record["status"] in FINAL_STATES, timeout=timeout
+            )
+            return record["_events"][start:], record["status"] in FINAL_STATES
+
+    def _finish(self, record, status, error=None):
+        record["status"] = status
+        record["error"] = error
+        record["finished"] = time.time()
+        self._event(record, {"event": status, "error": error, "outputs": record["outputs"]})
+        self._evict()
+
+    def _evict(self):
+        """Forgets finished jobs past the TTL and the oldest beyond keep_finished."""
+        with self._cond:
+            now = time.time()
+            finished = sorted((r for r in self.jobs.values() if r["status"] in FINAL_STATES),
+                              key=lambda r: r["finished"])
+            extra = len(finished) - self.keep_finished
+            for k, record in enumerate(finished):
+                if k < extra or now - record["finished"] > self.finished_ttl_s:
+                    del self.jobs[record["id"]]
+
+    # --- workers ----------------------------------------------------------
+
+    def _fits(self):
+        record = self.jobs[self._queue[0][2]]
+        return self._running == 0 or self._used_mb + record["estimate_mb"] <= self.memory_budget_mb
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                # Strict priority: the head of the queue waits for memory rather than being overtaken.
+                self._cond.wait_for(lambda: self._stopping or (self._queue and self._fits()))
+                if self._stopping:
+                    return
+                _, _, job_id = heapq.heappop(self._queue)
+                record = self.jobs[job_id]
+                record["status"] = "running"
+                record["started"] = time.time()
+                self._running += 1
+                self._used_mb += record["estimate_mb"]
+            self._event(record, {"event": "started"})
+            try:
+                self._run(record)
+                self._finish(record, "done")
+            except JobCancelled:
+                self._finish(record, "cancelled")
+            except Exception as e:
+                logging.error(f"Job {record['id']} failed: {e}")
+                self._finish(record, "failed", error=str(e))
+            finally:
+                with self._cond:
+                    self._running -= 1
+                    self._used_mb -= record["estimate_mb"]
+                    self._cond.notify_all()
+
+    def _run(self, record):
+        from src.metrics import JobMetrics
+        from src.pipeline import new_job, stage_extract, stage_separate, stage_transcribe, stage_finish
+
+        args = record["_args"]
+        cancel = record["_cancel"]
+
+        def check():
+            if cancel.is_set():
+                raise JobCancelled()
+
+        work_dir = os.path.join(self.work_root, record["id"])
+        os.makedirs(work_dir, exist_ok=True)
+        job = new_job(record["input"], record["output"], work_dir, cache=self.cache)
+        job["metrics"] = JobMetrics(record["input"], listener=lambda ev: self._event(record, ev))
+        try:
+            jobs = stage_extract(job, args)
+            for j in jobs:
+                check()
+                with self.separate_lock:
+                    j = stage_separate(j, args, separator=self.separator)
+                check()
+                with self.asr_lock:
+                    j = stage_transcribe(j, args, model=self.model)
+                check()
+                j = stage_finish(j, args)
+                record["outputs"].append(j["output_srt"])
+        finally:
+            record["metrics"] = job["metrics"].report()
+            if not getattr(args, "keep_temp", False):
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _authorized(self):
+        token = self.server.token
+        if not token:
+            return True
+        given = self.headers.get("Authorization", "")
+        if hmac.compare_digest(given.encode("utf-8"), f"Bearer {token}".encode("utf-8")):
+            return True
+        self._send(401, {"error": "Missing or wrong token"})
+        return False
+
+    def _route(self):
+        if not self._authorized():
+            return None, None
+        parts = [p for p in self.path.split("?")[0].split("/") if p]
+        jobs = self.server.jobs
+        if len(parts) >= 2 and parts[0] == "jobs" and parts[1] not in jobs.jobs:
+            self._send(404, {"error": f"No such job: {parts[1]}"})
+            return None, None
+        return parts, jobs
+
+    def do_GET(self):
+        parts, jobs = self._route()
+        if parts is None:
+            return
+        if parts == ["health"]:
+            self._send(200, jobs.health())
+        elif parts == ["jobs"]:
+            self._send(200, {"jobs": [_public(r) for r in list(jobs.jobs.values())]})
+        elif len(parts) == 2 and parts[0] == "jobs":
+            self._send(200, _public(jobs.jobs[parts[1]]))
+        elif len(parts) == 3 and parts[0] == "jobs" and parts[2] == "events":
+            self._stream_events(jobs, parts[1])
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def _stream_events(self, jobs, job_id):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        sent = 0
+        try:
+            while True:
+                events, ended = jobs.events(job_id, start=sent, timeout=15.0)
+                for ev in events:
+                    self.wfile.write((json.dumps(ev) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                sent += len(events)
+                if ended and not events:
+                    return
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path.rstrip("/") != "/jobs":
+            self._send(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            input_path = os.path.abspath(body["input"])
+            output = body.get("output") or f"{os.path.splitext(input_path)[0]}.srt"
+            record = self.server.jobs.submit(input_path, output, int(body.get("priority", 0)), body.get("options"))
+        except (KeyError, ValueError, TypeError, OSError) as e:
+            self._send(400, {"error": str(e)})
+            return
+        except Exception as e:
+            # ffprobe failures (unreadable input) land here.
+            self._send(400, {"error": f"Cannot probe input: {e}"})
+            return
+        self._send(201, _public(record))
+
+    def do_DELETE(self):
+        parts, jobs = self._route()
+        if parts is None:
+            return
+        if len(parts) == 2 and parts[0] == "jobs":
+            self._send(200, _public(jobs.cancel(parts[1])))
+        else:
+            self._send(404, {"error": "Not found"})
+
+def serve(args):
+    """Runs the daemon until interrupted."""
+    host = getattr(args, "host", None) or DEFAULT_HOST
+    port = getattr(args, "port", None) or DEFAULT_PORT
+    token = getattr(args, "server_token", None)
+    if not token and not is_loopback(host):
+        # Jobs read and write files as this user; do not offer that to the network unauthenticated.
+        raise ValueError(f"Refusing to listen on {host} without --server-token")
+    jobs = JobServer(
+        args, workers=getattr(args, "server_workers", 2),
+        memory_budget_mb=getattr(args, "memory_budget_gb", 8.0) * 1024,
+    )
+    httpd = ThreadingHTTPServer((host, port), _Handler)
+    httpd.daemon_threads = True
+    httpd.jobs = jobs
+    httpd.token = token
+    logging.info(f"Serving on http://{host}:{port} (memory budget {jobs.memory_budget_mb:.0f} MB"
+                 f"{', token required' if token else ''})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        jobs.shutdown()
+
+# --- client ---------------------------------------------------------------
+
+def _request(url, method="GET", body=None, token=None):
+    import urllib.request
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": "application/json"}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    req = urllib.request.Request(url, data=data, method=method, headers=headers)
+    return urllib.request.urlopen(req)
+
+def submit_job(server_url, input_path, output_srt, args, priority=0):
+    """Posts a job with the per-job options taken from args; returns the job record."""
+    import urllib.error
+    options = {key: getattr(args, key) for key in JOB_OPTIONS if hasattr(args, key)}
+    body = {"input": os.path.abspath(input_path), "output": output_srt, "priority": priority, "options": options}
+    try:
+        with _request(f"{server_url.rstrip('/')}/jobs", "POST", body, token=getattr(args, "server_token", None)) as resp:
+            return json.load(resp)
+    except urllib.error.HTTPError as e:
+        raise RuntimeError(json.load(e).get("error", str(e))) from None
+
+def follow_job(server_url, job_id, token=None):
+    """Logs a job's progress until it ends; returns the final event. Ctrl+C cancels the job."""
+    url = f"{server_url.rstrip('/')}/jobs/{job_id}"
+    last = None
+    try:
+        with _request(f"{url}/events", token=token) as resp:
+            for line in resp:
+                ev = json.loads(line)
+                last = ev
+                if ev["event"] == "stage_end":
+                    stream = f"[{ev['stream']}]" if ev.get("stream") is not None else ""
+                    logging.info(f"[{job_id}] {ev['stage']}{stream} {ev['metrics']['wall_s']:.1f}s")
+                elif ev["event"] != "stage_start":
+                    logging.info(f"[{job_id}] {ev['event']}" + (f": {ev['error']}" if ev.get("error") else ""))
+    except KeyboardInterrupt:
+        logging.info(f"Cancelling job {job_id}...")
+        _request(url, "DELETE", token=token).close()
+        raise
+    return last
+
+def run_remote(server_url, inputs, outputs, args):
+    """Submits every input, then follows them in order. Returns the inputs that did not finish."""
+    priority = getattr(args, "priority", 0)
+    records = [submit_job(server_url, i, o, args, priority=priority) for i, o in zip(inputs, outputs)]
+    failures = []
+    for record in records:
+        final = follow_job(server_url, record["id"], token=getattr(args, "server_token", None))
+        if final is None or final["event"] != "done":
+            failures.append(record["input"])
+        else:
+            for path in final.get("outputs", []):
+                logging.info(f"Subtitle saved to: {path}")
+    return failures
@@ -0,0 +1,463 @@
+"""
+Time-sharded processing of one long input over a shared-directory work queue.
+
+The coordinator (run_sharded) cuts the input into shards of about
+--shard-s seconds. Boundaries sit at the quietest point near each nominal
+cut, and each shard's audio reaches --shard-overlap-s past its boundaries so
+separation and ASR have context at the edges. Every shard becomes a JSON job
+in <queue>/pending. Workers (main.py --shard-worker QUEUE, on any node that
+sees the directory under the same path as the input) claim a job by renaming
+it into claimed/, run extract, separation and ASR on its window and write the
+word list, plus the 16kHz audio when Gemini needs it, to done/.
+
+Workers return every word they decoded. Neighbouring shards both decode
+the overlap, so the coordinator cuts each boundary once, in a pause that
+neither decode puts a word in (boundary_cut): words before the cut come from
+the earlier shard and the rest from the later one. Every word therefore
+comes from exactly one decode and the merge does not depend on which worker
+ran what or when it finished. The merged words go through
+segment_smart_stream and stage_finish as usual.
+
+Workers touch their claim file while they run; the coordinator puts claims
+older than CLAIM_TIMEOUT_S back into pending/, so a dead node only delays
+its shard. A failed shard is queued again up to SHARD_RETRIES times. The
+coordinator touches its queued files while it waits and removes them when it
+returns or fails; workers delete pending jobs left untouched for
+CLAIM_TIMEOUT_S (their coordinator is gone) and other files left for
+ORPHAN_S.
+"""
+import os
+import sys
+import json
+import math
+import time
+import uuid
+import shutil
+import signal
+import socket
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import contextlib
+
+QUEUE_DIRS = ("pending", "claimed", "done", "failed")
+POLL_S = 1.0
+HEARTBEAT_S = 15.0
+CLAIM_TIMEOUT_S = 300.0
+ORPHAN_S = 4 * CLAIM_TIMEOUT_S
+SHARD_RETRIES = 2
+SEARCH_S = 30.0         # a boundary may move this far to reach a quiet point
+CUT_PAUSE_S = 0.3       # pauses at least this long are preferred for cutting a boundary
+
+# Options the coordinator hands to workers with each job; model settings
+# (compute type, threads, batch sizes) stay with each worker's own host.
+SHARD_OPTIONS = ("in_memory", "speech_gate", "gate_margin_db", "separate_chunk_s", "separate_overlap_s", "beam_size")
+
+def _queue_path(queue_dir, state, name):
+    return os.path.join(queue_dir, state, name)
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+def open_queue(queue_dir):
+    for state in QUEUE_DIRS:
+        os.makedirs(os.path.join(queue_dir, state), exist_ok=True)
+    return queue_dir
+
+# --- coordinator --------------------------------------------------------------
+
+def quiet_point(input_path, stream_idx, nominal_s, search_s):
+    """Time of the quietest 0.3s stretch within search_s of nominal_s."""
+    import numpy as np
+    from src.audio import extract_audio_array
+    from src.vad import frame_features, FRAME_S
+
+    start = max(0.0, nominal_s - search_s)
+    audio = extract_audio_array(input_path, stream_idx, sample_rate=16000, channels=1,
+                                start_s=start, duration_s=2 * search_s)
+    energy_db, _ = frame_features(audio, 16000)
+    if not len(energy_db):
+        return nominal_s
+    k = max(1, int(0.3 / FRAME_S))
+    smooth = np.convolve(energy_db, np.ones(k, dtype=np.float32) / k, mode="same")
+    return start + (int(np.argmin(smooth)) + 0.5) * FRAME_S
+
+def plan_shards(input_path, stream_idx, duration_s, shard_s, overlap_s):
+    """
+    [{"start", "end", "keep"}]: the window a worker decodes (end None = to
+    the end of the file) and its [lo, hi) range between the planned
+    boundaries, which sets its audio for Gemini and where merge_words looks
+    first for a cut.
+    """
+    n = max(1, math.ceil(duration_s / shard_s))
+    search_s = min(SEARCH_S, shard_s / 4)
+    cuts = [0.0] + [quiet_point(input_path, stream_idx, k * duration_s / n, search_s) for k in range(1, n)]
+    shards = []
+    for k, lo in enumerate(cuts):
+        last = k == len(cuts) - 1
+        hi = None if last else cuts[k + 1]
+        shards.append({"start": max(0.0, lo - overlap_s), "end": None if last else hi + overlap_s,
+                       "keep": [lo, hi]})
+    return shards
+
+def _pauses(words, t0, t1):
+    """[(start, end)] stretches of t0..t1 that no word covers."""
+    pauses, t = [], t0
+    for w in sorted(words, key=lambda w: w["start"]):
+        if w["start"] > t:
+            pauses.append((t, min(w["start"], t1)))
+        t = max(t, w["end"])
+        if t >= t1:
+            break
+    if t < t1:
+        pauses.append((t, t1))
+    return [(a, b) for a, b in pauses if b > a]
+
+def boundary_cut(before, after, t0, t1, nominal):
+    """
+    Where the words of two shards that both decoded t0..t1 meet: the middle
+    of the pause nearest nominal in which neither decode has a word,
+    preferring pauses of CUT_PAUSE_S or more. When speech runs through the
+    whole overlap, the end of the earlier shard's word nearest nominal.
+    """
+    pauses = _pauses([w for w in before + after if w["end"] > t0 and w["start"] < t1], t0, t1)
+    if pauses:
+        long = [p for p in pauses if p[1] - p[0] >= CUT_PAUSE_S] or [max(pauses, key=lambda p: p[1] - p[0])]
+        a, b = min(long, key=lambda p: abs((p[0] + p[1]) / 2 - nominal))
+        return (a + b) / 2
+    logging.warning(f"Shard boundary {nominal:.1f}s: no pause in {t0:.1f}-{t1:.1f}s, cutting at a word end.")
+    ends = [w["end"] for w in before if t0 < w["end"] < t1]
+    return min(ends, key=lambda t: abs(t - nominal)) if ends else t0
+
+def merge_words(shards, shard_words):
+    """
+    Words of all shards in timeline order. shard_words[k] holds every word
+    shard k decoded; each boundary takes words before its cut from the
+    earlier shard and from the later one after it.
+    """
+    cuts = [boundary_cut(shard_words[k - 1], shard_words[k], shards[k]["start"], shards[k - 1]["end"],
+                         shards[k]["keep"][0]) for k in range(1, len(shards))]
+    bounds = [-math.inf] + cuts + [math.inf]
+    words = [w for k, ws in enumerate(shard_words) for w in ws if bounds[k] <= w["start"] < bounds[k + 1]]
+    words.sort(key=lambda w: (w["start"], w["end"]))
+    return words
+
+def _remove_run(queue_dir, ids):
+    for job_id in ids:
+        for state, name in (("pending", f"{job_id}.json"), ("claimed", f"{job_id}.json"), ("failed", f"{job_id}.json"),
+                            ("done", f"{job_id}.words.json"), ("done", f"{job_id}.wav")):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(_queue_path(queue_dir, state, name))
+
+def _touch_run(queue_dir, ids):
+    """Shows workers that this run's queued and finished shards are still wanted."""
+    for job_id in ids:
+        for state, name in (("pending", f"{job_id}.json"), ("done", f"{job_id}.words.json"), ("done", f"{job_id}.wav")):
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(_queue_path(queue_dir, state, name))
+
+def _requeue_stale(queue_dir, ids):
+    now = time.time()
+    for job_id in ids:
+        claimed = _queue_path(queue_dir, "claimed", f"{job_id}.json")
+        try:
+            if now - os.path.getmtime(claimed) > CLAIM_TIMEOUT_S:
+                os.rename(claimed, _queue_path(queue_dir, "pending", f"{job_id}.json"))
+                os.utime(_queue_path(queue_dir, "pending", f"{job_id}.json"))
+                logging.warning(f"Shard {job_id}: no heartbeat for {CLAIM_TIMEOUT_S:.0f}s, requeued.")
+        except FileNotFoundError:
+            pass
+
+def _wait_for_shards(queue_dir, specs, local_workers):
+    ids = list(specs)
+    remaining = set(ids)
+    while remaining:
+        for job_id in sorted(remaining):
+            failed = _queue_path(queue_dir, "failed", f"{job_id}.json")
+            if os.path.exists(failed):
+                with open(failed, "r", encoding="utf-8") as f:
+                    error = json.load(f).get("error")
+                spec = specs[job_id]
+                if spec.get("attempt", 0) >= SHARD_RETRIES:
+                    raise RuntimeError(f"Shard {job_id} failed: {error}")
+                spec["attempt"] = spec.get("attempt", 0) + 1
+                logging.warning(f"Shard {job_id} failed ({error}), retry {spec['attempt']}/{SHARD_RETRIES}.")
+                _write_json(_queue_path(queue_dir, "pending", f"{job_id}.json"), spec)
+                os.remove(failed)
+                continue
+            if os.path.exists(_queue_path(queue_dir, "done", f"{job_id}.words.json")):
+                remaining.discard(job_id)
+                logging.info(f"Shards: {len(ids) - len(remaining)}/{len(ids)} done.")
+        if not remaining:
+            return
+        if local_workers and all(p.poll() is not None for p in local_workers):
+            raise RuntimeError("All local shard workers exited.")
+        _requeue_stale(queue_dir, remaining)
+        _touch_run(queue_dir, ids)
+        time.sleep(POLL_S)
+
+def _worker_command(queue_dir, args, threads):
+    if getattr(sys, "frozen", False):
+        cmd = [sys.executable]
+    else:
+        cmd = [sys.executable, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")]
+    cmd += ["--shard-worker", queue_dir, "--asr-procs", "1", "--asr-threads", str(threads)]
+    # Per-host model settings of this process carry over to its local workers.
+    for flag, key in (("--asr-compute-type", "asr_compute_type"), ("--separator-batch-size", "separator_batch_size"),
+                      ("--separator-segment-size", "separator_segment_size"), ("--draft-model", "draft_model"),
+                      ("--cascade-logprob", "cascade_logprob")):
+        value = getattr(args, key, None)
+        if value is not None:
+            cmd += [flag, str(value)]
+    if getattr(args, "cascade", False):
+        cmd.append("--cascade")
+    if getattr(args, "no_warmup", False):
+        cmd.append("--no-warmup")
+    return cmd
+
+def _start_local_workers(queue_dir, args, count):
+    threads = max(1, (os.cpu_count() or 1) // count)
+    cmd = _worker_command(queue_dir, args, threads)
+    logging.info(f"Starting {count} local shard worker(s), {threads} ASR threads each.")
+    return [subprocess.Popen(cmd) for _ in range(count)]
+
+def _stop_local_workers(workers):
+    for p in workers:
+        if p.poll() is None:
+            p.terminate()
+    for p in workers:
+        try:
+            p.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+def _concat_audio(queue_dir, ids, out_path):
+    """Joins the shards' 16kHz keep ranges into one file for Gemini."""
+    import soundfile as sf
+    with sf.SoundFile(out_path, "w", samplerate=16000, channels=1, subtype="FLOAT") as out:
+        for job_id in ids:
+            audio, _ = sf.read(_queue_path(queue_dir, "done", f"{job_id}.wav"), dtype="float32")
+            out.write(audio)
+    return out_path
+
+def run_sharded(input_path, output_srt, work_dir, args):
+    """
+    Coordinator: plans and queues the shards, waits for workers (starting
+    args.shard_workers local ones), merges the words and finishes the job
+    like run_pipeline. Returns the finished job.
+    """
+    from src.audio import probe_file, select_audio_streams
+    from src.asr import segment_smart_stream
+    from src.pipeline import new_job, stage_finish
+    from src.metrics import write_reports
+
+    job = new_job(input_path, output_srt, work_dir)
+    metrics = job["metrics"]
+    with metrics.stage("probe"):
+        probe_data = probe_file(input_path)
+        streams = select_audio_streams(probe_data, getattr(args, "streams", None) or "best")
+    metrics.set_duration(probe_data)
+    if metrics.duration_s is None:
+        raise ValueError(f"Shard mode needs the media duration, which ffprobe did not report: {input_path}")
+    if len(streams) > 1:
+        logging.warning(f"Shard mode subtitles one audio stream; using stream {streams[0]}.")
+    job["stream_idx"] = streams[0]
+
+    queue_dir = open_queue(getattr(args, "shard_queue", None) or os.path.join(work_dir, "queue"))
+    shard_s = getattr(args, "shard_s", 1800.0)
+    with metrics.stage("plan"):
+        shards = plan_shards(input_path, job["stream_idx"], metrics.duration_s, shard_s,
+                             getattr(args, "shard_overlap_s", 30.0))
+    run_id = uuid.uuid4().hex[:8]
+    options = {key: getattr(args, key, None) for key in SHARD_OPTIONS if getattr(args, key, None) is not None}
+    specs = {}
+    try:
+        for k, shard in enumerate(shards):
+            job_id = f"{run_id}-{k:03d}"
+            specs[job_id] = dict(shard, id=job_id, input=os.path.abspath(input_path), stream=job["stream_idx"],
+                                 audio=not getattr(args, "no_gemini", False), options=options)
+            _write_json(_queue_path(queue_dir, "pending", f"{job_id}.json"), specs[job_id])
+        ids = list(specs)
+        boundaries = ", ".join(f"{s['keep'][0]:.1f}s" for s in shards[1:]) or "none"
+        logging.info(f"Shard mode: {metrics.duration_s:.0f}s in {len(ids)} shards (boundaries {boundaries}), queued in {queue_dir}")
+
+        local = getattr(args, "shard_workers", 0) or (0 if getattr(args, "shard_queue", None) else 1)
+        workers = _start_local_workers(queue_dir, args, local) if local else []
+        try:
+            with metrics.stage("shards"):
+                _wait_for_shards(queue_dir, specs, workers)
+        finally:
+            _stop_local_workers(workers)
+
+        with metrics.stage("merge"):
+            shard_words = []
+            for job_id in ids:
+                with open(_queue_path(queue_dir, "done", f"{job_id}.words.json"), "r", encoding="utf-8") as f:
+                    shard_words.append(json.load(f))
+            job["words"] = merge_words(shards, shard_words)
+            if getattr(args, "save_words", False):
+                from src.asr import save_words, words_path_for
+                save_words(job["words"], words_path_for(output_srt))
+            if not getattr(args, "no_gemini", False):
+                job["final"] = _concat_audio(queue_dir, ids, os.path.join(work_dir, "preprocessed_16k.wav"))
+    finally:
+        _remove_run(queue_dir, specs)
+    job["events"] = segment_smart_stream(job["words"], pause_ms=400, max_chars=84, max_dur_s=7.0)
+    logging.info(f"Merged {len(job['words'])} words from {len(ids)} shards, {len(job['events'])} events.")
+
+    try:
+        return stage_finish(job, args)
+    finally:
+        metrics.log_summary()
+        write_reports([metrics], args)
+
+# --- worker ------------------------------------------------------------------
+
+def _reap(queue_dir):
+    """Deletes pending jobs whose coordinator is gone and other files nobody came back for."""
+    now = time.time()
+    for state in QUEUE_DIRS:
+        limit = CLAIM_TIMEOUT_S if state == "pending" else ORPHAN_S
+        for name in os.listdir(os.path.join(queue_dir, state)):
+            path = _queue_path(queue_dir, state, name)
+            with contextlib.suppress(FileNotFoundError):
+                if now - os.path.getmtime(path) > limit:
+                    os.remove(path)
+                    logging.warning(f"Removed stale shard queue file {state}/{name}.")
+
+def _claim(queue_dir):
+    """Moves the oldest pending job to claimed/ and returns its spec, or None."""
+    _reap(queue_dir)
+    pending = os.path.join(queue_dir, "pending")
+    for name in sorted(n for n in os.listdir(pending) if n.endswith(".json")):
+        claimed = _queue_path(queue_dir, "claimed", name)
+        try:
+            # rename is atomic: of several workers racing for a job, one wins.
+            os.rename(os.path.join(pending, name), claimed)
+        except FileNotFoundError:
+            continue
+        os.utime(claimed)
+        with open(claimed, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return None
+
+@contextlib.contextmanager
+def _heartbeat(path):
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(HEARTBEAT_S):
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(path)
+    thread = threading.Thread(target=beat, name="shard-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def _run_shard(spec, args, warmup, work_root):
+    from src.audio import extract_audio, extract_audio_array, write_wav
+    from src.pipeline import new_job, stage_separate, stage_transcribe, _needs_separation
+
+    job_args = argparse.Namespace(**vars(args))
+    for key, value in spec.get("options", {}).items():
+        if key in SHARD_OPTIONS:
+            setattr(job_args, key, value)
+    job_args.fingerprint = False
+    job_args.save_words = False  # the coordinator saves the merged words
+
+    start, end = spec["start"], spec["end"]
+    lo, hi = spec["keep"]
+    duration = end - start if end is not None else None
+    work_dir = tempfile.mkdtemp(prefix=f"{spec['id']}-", dir=work_root)
+    try:
+        job = new_job(spec["input"], None, work_dir)
+        job["stream_idx"] = spec["stream"]
+        job["stream_label"] = spec["id"]
+        if getattr(job_args, "in_memory", False):
+            from src.separator import SAMPLE_RATE
+            job["extracted"] = extract_audio_array(spec["input"], spec["stream"], sample_rate=SAMPLE_RATE,
+                                                   start_s=start, duration_s=duration)
+        else:
+            job["extracted"] = os.path.join(work_dir, "extracted_48k.wav")
+            extract_audio(spec["input"], spec["stream"], job["extracted"], duration_s=duration, start_s=start)
+        separator = warmup.separator() if warmup is not None and _needs_separation(job, job_args) else None
+        job = stage_separate(job, job_args, separator=separator)
+        job = stage_transcribe(job, job_args, model=warmup.model() if warmup is not None else None)
+
+        # All words: the coordinator decides where this shard's words give way to a neighbour's.
+        words = [dict(w, start=w["start"] + start, end=w["end"] + start) for w in job["words"]]
+        if spec.get("audio"):
+            import soundfile as sf
+            final = job["final"]
+            if isinstance(final, str):
+                final, _ = sf.read(final, dtype="float32")
+            a = int(round((lo - start) * 16000))
+            b = len(final) if hi is None else int(round((hi - start) * 16000))
+            write_wav(_queue_path(spec["queue"], "done", f"{spec['id']}.wav.tmp"), final[a:b], 16000)
+            os.replace(_queue_path(spec["queue"], "done", f"{spec['id']}.wav.tmp"),
+                       _queue_path(spec["queue"], "done", f"{spec['id']}.wav"))
+        # The word list goes last: the coordinator treats it as "shard done".
+        _write_json(_queue_path(spec["queue"], "done", f"{spec['id']}.words.json"), words)
+        job["metrics"].log_summary()
+        return len(words)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def run_shard_worker(queue_dir, args):
+    """
+    Claims and runs shard jobs from queue_dir until interrupted (SIGINT or
+    SIGTERM). Models are loaded once and stay resident across jobs.
+    """
+    from src.warmup import ModelWarmup
+
+    queue_dir = open_queue(os.path.abspath(queue_dir))
+    with contextlib.suppress(ValueError):
+        # Coordinators stop their local workers with SIGTERM; clean up as for Ctrl-C.
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+    work_root = tempfile.mkdtemp(prefix="livesubs-shard-")
+    pooled = getattr(args, "separate_chunk_s", 0) and getattr(args, "separate_procs", 1) > 1
+    warmup = None if getattr(args, "no_warmup", False) else ModelWarmup(args, work_root, separator=not pooled)
+    logging.info(f"Shard worker {socket.gethostname()}:{os.getpid()} polling {queue_dir}")
+    try:
+        while True:
+            spec = _claim(queue_dir)
+            if spec is None:
+                time.sleep(POLL_S)
+                continue
+            spec["queue"] = queue_dir
+            claimed = _queue_path(queue_dir, "claimed", f"{spec['id']}.json")
+            logging.info(f"Shard {spec['id']}: {spec['start']:.1f}s-"
+                         f"{'end' if spec['end'] is None else format(spec['end'], '.1f') + 's'} of {spec['input']}")
+            finished = False
+            try:
+                with _heartbeat(claimed):
+                    n = _run_shard(spec, args, warmup, work_root)
+                logging.info(f"Shard {spec['id']} done: {n} words.")
+                finished = True
+            except Exception as e:
+                logging.error(f"Shard {spec['id']} failed: {e}")
+                _write_json(_queue_path(queue_dir, "failed", f"{spec['id']}.json"), {"id": spec["id"], "error": str(e)})
+                finished = True
+            finally:
+                if finished:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(claimed)
+                else:
+                    # Interrupted: hand the job back instead of waiting for the timeout.
+                    with contextlib.suppress(FileNotFoundError):
+                        os.rename(claimed, _queue_path(queue_dir, "pending", f"{spec['id']}.json"))
+                        os.utime(_queue_path(queue_dir, "pending", f"{spec['id']}.json"))
+    except KeyboardInterrupt:
+        logging.info("Shard worker stopped.")
+    finally:
+        if warmup is not None:
+            warmup.close()
+        shutil.rmtree(work_root, ignore_errors=True)
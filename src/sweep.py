@@ -0,0 +1,136 @@
+"""
+Post-processing parameter sweep over a saved word list.
+
+`main.py --sweep NAME.words.npz --grid pause_ms=300,400,500 --grid
+target_cps=17:22:1 ...` runs segment_smart_stream and run_post_processing
+for every combination of the grid (parameters not in the grid keep the
+pipeline's values) and scores each result against a style guide:
+
+- CPS violations: events above --style-cps characters per second
+- gap violations: consecutive events closer than --style-min-gap
+- line overflows: lines longer than --style-line-chars
+- event count
+
+Configs are ranked by the sum of the three violation counts, then by event
+count. Word lists come from `--save-words` or asr.transcribe_audio(words_path=).
+Each pool process loads the words once; a task segments once and runs the
+post-processing passes for its share of the post-processing grid.
+"""
+import os
+import math
+import logging
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+SEGMENT_PARAMS = {"pause_ms": 400, "max_chars": 84, "max_dur_s": 7.0}
+POST_PARAMS = {"target_cps": 22.0, "linger_ms": 600, "min_gap": 0.084}
+STYLE_CPS = 20.0
+STYLE_LINE_CHARS = 42
+STYLE_MIN_GAP_S = 0.084
+TASKS_PER_PROC = 4
+
+def parse_grid(specs):
+    """
+    {name: [values]} from "name=v1,v2" or "name=start:stop:step" (stop
+    included) specs; names not given keep their pipeline value.
+    """
+    grid = {name: [value] for name, value in dict(SEGMENT_PARAMS, **POST_PARAMS).items()}
+    for spec in specs or []:
+        name, _, values = spec.partition("=")
+        name = name.strip().replace("-", "_")
+        if name not in grid or not values:
+            raise ValueError(f"Bad --grid {spec!r}; parameters: {', '.join(grid)}")
+        if ":" in values:
+            start, stop, step = (float(v) for v in values.split(":"))
+            n = int(math.floor((stop - start) / step + 1e-9)) + 1
+            values = [round(start + k * step, 6) for k in range(n)]
+        else:
+            values = [float(v) for v in values.split(",")]
+        if isinstance(grid[name][0], int):
+            # Truncating would sweep, and report, values nobody asked for.
+            bad = [v for v in values if v != int(v)]
+            if bad:
+                raise ValueError(f"Bad --grid {spec!r}: {name} takes whole numbers, got {bad[0]:g}")
+            values = [int(v) for v in values]
+        grid[name] = values
+    return grid
+
+def _combinations(grid, names):
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+_WORDS = None
+
+def _pool_init(words_path):
+    global _WORDS
+    from src.asr import load_words
+    _WORDS = load_words(words_path)
+
+def score(table, limits):
+    """Violation counts of a post-processed EventTable."""
+    import numpy as np
+
+    start, end = table.ev_start, table.ev_end
+    cps = table.event_text_len() / np.maximum(end - start, 1e-3)
+    gaps = start[1:] - end[:-1]
+    lines = [len(line) for text in table.ev_text for line in text.split("\n")]
+    return {
+        "cps": int(np.count_nonzero(cps > limits["cps"])),
+        "gap": int(np.count_nonzero(gaps < limits["min_gap"] - 1e-9)),
+        "overflow": sum(1 for n in lines if n > limits["line_chars"]),
+        "events": len(table),
+    }
+
+def _run_task(seg, posts, limits):
+    from src.asr import segment_smart_stream
+    from src import columnar
+
+    events = segment_smart_stream(_WORDS, **seg)
+    base = columnar.EventTable.from_events(events, keep_words=False) if events else None
+    results = []
+    for post in posts:
+        if base is None:
+            result = {"cps": 0, "gap": 0, "overflow": 0, "events": 0}
+        else:
+            table = columnar.run_post_processing(base.copy(), max_chars_total=seg["max_chars"], **post)
+            result = score(table, limits)
+        result["violations"] = result["cps"] + result["gap"] + result["overflow"]
+        results.append(dict(seg, **post, **result))
+    return results
+
+def run_sweep(words_path, specs, procs=None, limits=None):
+    """Evaluates the grid and returns the results, best first."""
+    limits = dict({"cps": STYLE_CPS, "line_chars": STYLE_LINE_CHARS, "min_gap": STYLE_MIN_GAP_S}, **(limits or {}))
+    grid = parse_grid(specs)
+    segs = _combinations(grid, list(SEGMENT_PARAMS))
+    posts = _combinations(grid, list(POST_PARAMS))
+    procs = max(1, procs or os.cpu_count() or 1)
+    # Enough tasks to keep every process busy, each reusing one segmentation.
+    splits = max(1, min(len(posts), math.ceil(procs * TASKS_PER_PROC / len(segs))))
+    size = math.ceil(len(posts) / splits)
+    tasks = [(seg, posts[k:k + size]) for seg in segs for k in range(0, len(posts), size)]
+    logging.info(f"Sweep: {len(segs) * len(posts)} configs ({len(segs)} segmentations x {len(posts)} "
+                 f"post-processing settings) in {len(tasks)} tasks on {procs} processes.")
+
+    with ProcessPoolExecutor(max_workers=procs, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=_pool_init, initargs=(words_path,)) as pool:
+        futures = [pool.submit(_run_task, seg, chunk, limits) for seg, chunk in tasks]
+        results = [r for f in futures for r in f.result()]
+    results.sort(key=lambda r: (r["violations"], r["events"]))
+    return results
+
+COLUMNS = list(SEGMENT_PARAMS) + list(POST_PARAMS) + ["violations", "cps", "gap", "overflow", "events"]
+
+def format_table(results, top=20):
+    rows = [[str(i)] + [f"{r[c]:g}" if isinstance(r[c], float) else str(r[c]) for c in COLUMNS]
+            for i, r in enumerate(results[:top], 1)]
+    header = ["rank"] + COLUMNS
+    widths = [max(len(h), *(len(row[k]) for row in rows)) if rows else len(h) for k, h in enumerate(header)]
+    return "\n".join("  ".join(cell.rjust(w) for cell, w in zip(line, widths)) for line in [header] + rows)
+
+def write_csv(results, path):
+    import csv
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows({c: r[c] for c in COLUMNS} for r in results)
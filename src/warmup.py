@@ -0,0 +1,104 @@
+"""
+Background model loading.
+
+Importing torch and loading BS-Roformer and Whisper takes seconds that would
+otherwise sit between extraction and separation. ModelWarmup starts both
+loads in threads as soon as the input is known, so they overlap with
+ffprobe/ffmpeg; a stage only blocks if its model is not ready yet. The time
+each load hid behind other work is logged when the model is first used.
+
+With start=False nothing loads until start() says which models are still
+needed (stage_extract calls it once the cache has been checked), so a
+resumed run does not load models it will never use. close() does not wait
+for loads nobody used; they finish in the background and release
+themselves.
+"""
+import time
+import logging
+import threading
+
+class _Load:
+    def __init__(self, name, fn):
+        self.name = name
+        self.load_s = None
+        self._fn = fn
+        self._value = None
+        self._error = None
+        self._reported = False
+        self._release = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        threading.Thread(target=self._run, name=f"warmup-{name}", daemon=True).start()
+
+    def _run(self):
+        start = time.perf_counter()
+        try:
+            self._value = self._fn()
+        except BaseException as e:
+            self._error = e
+        finally:
+            self.load_s = time.perf_counter() - start
+            with self._lock:
+                self._done.set()
+                release = self._release
+            if release is not None and self._value is not None:
+                release(self._value)
+
+    def get(self):
+        start = time.perf_counter()
+        self._done.wait()
+        waited = time.perf_counter() - start
+        if self._error is not None:
+            raise self._error
+        if not self._reported:
+            self._reported = True
+            logging.info(f"Warmup: {self.name} loaded in {self.load_s:.1f}s, waited {waited:.1f}s "
+                         f"({max(0.0, self.load_s - waited):.1f}s saved).")
+        return self._value
+
+    def abandon(self, release):
+        """release(value) now if the load has finished, otherwise when it does."""
+        with self._lock:
+            if not self._done.is_set():
+                self._release = release
+                return
+        if self._value is not None:
+            release(self._value)
+
+class ModelWarmup:
+    """Loads the separator and the ASR backend in the background."""
+
+    def __init__(self, args, work_dir, separator=True, asr=True, start=True):
+        from src.pipeline import load_asr_backend
+
+        def load_sep():
+            from src.separator import load_separator, separator_options
+            return load_separator(work_dir, **separator_options(args))
+
+        self._load_sep = load_sep if separator else None
+        self._load_asr = (lambda: load_asr_backend(args)) if asr else None
+        self._separator = None
+        self._model = None
+        if start:
+            self.start()
+
+    def start(self, separator=True, asr=True):
+        """Starts the loads asked for that are not running yet."""
+        if separator and self._load_sep is not None and self._separator is None:
+            self._separator = _Load("separator", self._load_sep)
+        if asr and self._load_asr is not None and self._model is None:
+            self._model = _Load("asr", self._load_asr)
+
+    def separator(self):
+        self.start(asr=False)
+        return self._separator.get() if self._separator is not None else None
+
+    def model(self):
+        self.start(separator=False)
+        return self._model.get() if self._model is not None else None
+
+    def close(self):
+        """Releases the ASR backend, now or, if it is still loading, once it has loaded."""
+        from src.pipeline import close_asr_backend
+        if self._model is not None:
+            self._model.abandon(close_asr_backend)
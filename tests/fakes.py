@@ -0,0 +1,63 @@
+"""
+Deterministic stand-ins for the models, shared by the tests.
+
+FakeWhisper hears every tone burst in its input as one word, named after the
+burst's pitch, with sample-exact start/end times. Cutting the audio anywhere
+in a pause therefore must not change the words or, after the chunk offset,
+their times.
+"""
+from types import SimpleNamespace
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+
+def tone_bursts(plan, sample_rate=SAMPLE_RATE, seed=0):
+    """
+    Audio with one sine burst per (start_s, duration_s, freq_hz) in plan over
+    faint noise. Returns a float32 array.
+    """
+    rng = np.random.default_rng(seed)
+    total = max(s + d for s, d, _ in plan) + 1.0
+    audio = rng.normal(0, 1e-4, int(total * sample_rate)).astype(np.float32)
+    for start_s, dur_s, freq in plan:
+        a = int(start_s * sample_rate)
+        t = np.arange(int(dur_s * sample_rate)) / sample_rate
+        audio[a:a + len(t)] += (0.5 * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+    return audio
+
+def speech_plan(n_words=120, seed=1):
+    """(start_s, duration_s, freq_hz) for words in phrases separated by pauses."""
+    rng = np.random.default_rng(seed)
+    plan, t = [], 0.5
+    for i in range(n_words):
+        dur = float(rng.uniform(0.2, 0.5))
+        plan.append((round(t, 3), round(dur, 3), 200 + 20 * int(rng.integers(0, 40))))
+        t += dur + (float(rng.uniform(1.0, 3.0)) if i % 5 == 4 else 0.12)
+    return plan
+
+class FakeWhisper:
+    def __init__(self, threshold=0.05, min_gap=0.05):
+        self.threshold = threshold
+        self.min_gap = min_gap
+
+    def transcribe(self, audio, **options):
+        audio = np.asarray(audio, dtype=np.float32)
+        loud = np.flatnonzero(np.abs(audio) > self.threshold)
+        segments = []
+        if len(loud):
+            # Bursts: loud samples closer together than min_gap.
+            breaks = np.flatnonzero(np.diff(loud) > self.min_gap * SAMPLE_RATE)
+            for a, b in zip(np.concatenate(([0], breaks + 1)), np.concatenate((breaks, [len(loud) - 1]))):
+                lo, hi = int(loud[a]), int(loud[b]) + 1
+                spectrum = np.abs(np.fft.rfft(audio[lo:hi]))
+                freq = np.fft.rfftfreq(hi - lo, 1 / SAMPLE_RATE)[int(np.argmax(spectrum))]
+                word = SimpleNamespace(word=f" f{int(round(freq / 20) * 20)}", start=lo / SAMPLE_RATE,
+                                       end=hi / SAMPLE_RATE, probability=0.9)
+                segments.append(SimpleNamespace(words=[word], avg_logprob=-0.2, no_speech_prob=0.01))
+        return iter(segments), SimpleNamespace(duration=len(audio) / SAMPLE_RATE)
+
+def init_fake_pool_model():
+    """ASR pool initializer: a FakeWhisper instead of loading faster-whisper."""
+    import src.asr
+    src.asr._pool_model = FakeWhisper()
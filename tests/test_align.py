@@ -0,0 +1,101 @@
+"""
+Forced alignment against a fake model. Every word of the script is a tone
+burst with its own pitch; the fake find_alignment finds each token's burst
+in the window by pitch, in order, the way DTW follows the audio.
+"""
+import numpy as np
+import pytest
+
+from src import align
+from src.postprocess import write_srt
+from tests.fakes import SAMPLE_RATE, FakeWhisper, speech_plan, tone_bursts
+
+def make_plan(n_words=120):
+    # speech_plan's timing, a distinct pitch per word.
+    return [(start, dur, 300 + 20 * k) for k, (start, dur, _) in enumerate(speech_plan(n_words))]
+
+PLAN = make_plan()
+AUDIO = tone_bursts(PLAN)
+
+def phrases(plan, size=5):
+    """Reference lines of size words: (start, end, text)."""
+    return [(plan[k][0], plan[min(k + size, len(plan)) - 1][0] + plan[min(k + size, len(plan)) - 1][1],
+             " ".join(f"f{freq}" for _, _, freq in plan[k:k + size])) for k in range(0, len(plan), size)]
+
+class FakeTokenizer:
+    """One token per word: the word's pitch."""
+    eot = -1
+
+    def encode(self, text):
+        return [int(w[1:]) for w in text.split()]
+
+    def split_to_word_tokens(self, tokens):
+        return [f" f{t}" if t != self.eot else "<|endoftext|>" for t in tokens], [[t] for t in tokens]
+
+class FakeAligner:
+    def __init__(self):
+        self.windows = []
+
+    def find_alignment(self, tokenizer, text_tokens, encoder_output, num_frames):
+        (tokens,) = text_tokens
+        audio = encoder_output
+        assert len(tokens) <= align.MAX_TOKENS
+        assert len(audio) <= align.WINDOW_S * SAMPLE_RATE + 1
+        self.windows.append(len(tokens))
+        segments, _ = FakeWhisper().transcribe(audio)
+        # A burst cut by the window edge has no clean pitch; it is not heard.
+        bursts = [(int(w.word[2:]), w.start, w.end) for s in segments for w in s.words
+                  if w.start > 0.01 and w.end < len(audio) / SAMPLE_RATE - 0.01]
+        words, k, t = [], 0, 0.0
+        for token in tokens:
+            found = next((i for i in range(k, len(bursts)) if bursts[i][0] == token), None)
+            if found is None:
+                words.append({"word": f" f{token}", "start": t, "end": t, "probability": 0.1})
+                continue
+            _, start, t = bursts[found]
+            k = found + 1
+            words.append({"word": f" f{token}", "start": start, "end": t, "probability": 0.9})
+        return [words]
+
+@pytest.fixture
+def model(monkeypatch):
+    monkeypatch.setattr(align, "_tokenizer", lambda model: FakeTokenizer())
+    monkeypatch.setattr(align, "_encode", lambda model, audio: (audio, None))
+    return FakeAligner()
+
+def check(words, plan=PLAN):
+    assert [w["word"] for w in words] == [f"f{freq}" for _, _, freq in plan]
+    for w, (start, dur, _) in zip(words, plan):
+        assert w["start"] == pytest.approx(start, abs=0.01)
+        assert w["end"] == pytest.approx(start + dur, abs=0.01)
+
+def test_srt_reference_reanchors_across_windows(model, tmp_path):
+    # The cues drift late by 6% of the time: 6s by the end, well past PAD_S.
+    path = str(tmp_path / "ref.srt")
+    write_srt([{"start": a * 1.06, "end": b * 1.06, "text": text} for a, b, text in phrases(PLAN)], path)
+    words = align.align_words(AUDIO, model, align.read_reference(path))
+    check(words)
+    assert len(model.windows) > 3
+
+def test_plain_text_reference(model, tmp_path):
+    path = tmp_path / "ref.txt"
+    path.write_text("\n".join(text for _, _, text in phrases(PLAN)) + "\n", encoding="utf-8")
+    lines = align.read_reference(str(path))
+    assert lines[0]["start"] is None
+    check(align.align_words(AUDIO, model, lines))
+
+def test_long_line_is_split(model, monkeypatch):
+    # One cue over all the speech: longer than a window in time and in tokens.
+    monkeypatch.setattr(align, "MAX_TOKENS", 16)
+    start, end, _ = phrases(PLAN, size=len(PLAN))[0]
+    text = " ".join(f"f{freq}" for _, _, freq in PLAN)
+    check(align.align_words(AUDIO, model, [{"start": start, "end": end, "text": text}]))
+    assert len(model.windows) >= len(PLAN) / 16
+
+def test_split_long_lines_shares_time_by_characters():
+    line = {"start": 0.0, "end": 80.0, "text": " ".join(f"f{300 + 20 * k}" for k in range(40))}
+    pieces = align._split_long_lines([line], FakeTokenizer())
+    assert " ".join(p["text"] for p in pieces) == line["text"]
+    assert pieces[0]["start"] == 0.0 and pieces[-1]["end"] == pytest.approx(80.0)
+    assert all(p["end"] - p["start"] <= align.WINDOW_S - 2 * align.PAD_S for p in pieces)
+    assert np.all(np.diff([p["start"] for p in pieces]) > 0)
@@ -0,0 +1,44 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pytest
+
+from src.asr import find_silence_cuts, transcribe_words, transcribe_words_parallel
+from tests.fakes import FakeWhisper, init_fake_pool_model, speech_plan, tone_bursts, SAMPLE_RATE
+
+CHUNK_S = 20.0
+
+@pytest.fixture(scope="module")
+def fixture_audio():
+    # About 100s of phrases; short chunks give several boundaries.
+    return tone_bursts(speech_plan())
+
+def test_cuts_fall_in_pauses(fixture_audio):
+    cuts = find_silence_cuts(fixture_audio, chunk_s=CHUNK_S)
+    assert len(cuts) >= 3
+    assert cuts == sorted(cuts)
+    for cut in cuts:
+        window = fixture_audio[cut - 160:cut + 160]
+        assert np.max(np.abs(window)) < 0.01, f"cut at {cut / SAMPLE_RATE:.2f}s is inside a word"
+
+def test_pool_matches_single_process(fixture_audio):
+    single = transcribe_words(fixture_audio, model=FakeWhisper())
+    pool = ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=init_fake_pool_model)
+    try:
+        pooled = transcribe_words_parallel(fixture_audio, pool, chunk_s=CHUNK_S)
+    finally:
+        pool.shutdown()
+
+    assert len(single) == len(speech_plan())
+    assert [w["word"] for w in pooled] == [w["word"] for w in single]
+    for p, s in zip(pooled, single):
+        assert p["start"] == pytest.approx(s["start"], abs=1e-6)
+        assert p["end"] == pytest.approx(s["end"], abs=1e-6)
+        assert {k: p[k] for k in ("probability", "avg_logprob", "no_speech_prob")} == \
+               {k: s[k] for k in ("probability", "avg_logprob", "no_speech_prob")}
+
+def test_short_audio_is_one_chunk(fixture_audio):
+    short = fixture_audio[:int(5 * SAMPLE_RATE)]
+    assert find_silence_cuts(short, chunk_s=CHUNK_S) == []
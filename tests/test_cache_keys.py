@@ -0,0 +1,18 @@
+import argparse
+
+from src import pipeline
+from src.cache import StageCache
+
+def keys(tmp_path, **args):
+    media = tmp_path / "ep.wav"
+    media.write_bytes(b"audio")
+    job = pipeline.new_job(str(media), str(tmp_path / "ep.srt"), str(tmp_path), cache=StageCache(str(tmp_path / "cache")))
+    job["stream_idx"] = 1
+    return pipeline._cache_keys(job, argparse.Namespace(**args))
+
+def test_separator_settings_change_every_key(tmp_path):
+    base = keys(tmp_path)
+    assert keys(tmp_path, separator_segment_size=None, separator_batch_size=None) == base
+    for changed in (keys(tmp_path, separator_segment_size=256), keys(tmp_path, separator_batch_size=4)):
+        assert all(changed[stage] != base[stage] for stage in ("separate", "preprocess", "asr"))
+    assert keys(tmp_path, separator_segment_size=256) != keys(tmp_path, separator_segment_size=512)
@@ -0,0 +1,31 @@
+import copy
+import random
+
+import pytest
+
+from src import columnar
+from src.asr import segment_smart_stream
+from src.postprocess import run_post_processing, write_srt
+from tests.test_segmentation import random_words
+
+def _srt_both(tmp_path, events):
+    dict_path, table_path = tmp_path / "dict.srt", tmp_path / "table.srt"
+    write_srt(run_post_processing(copy.deepcopy(events)), dict_path)
+    table = columnar.run_post_processing(columnar.EventTable.from_events(copy.deepcopy(events)))
+    columnar.write_srt(table, table_path)
+    return dict_path.read_bytes(), table_path.read_bytes()
+
+@pytest.mark.parametrize("seed", range(50))
+def test_table_srt_matches_dict_srt(tmp_path, seed):
+    rng = random.Random(seed)
+    events = segment_smart_stream(random_words(seed), pause_ms=rng.choice([200, 400]), max_chars=rng.choice([42, 84]))
+    by_dicts, by_table = _srt_both(tmp_path, events)
+    assert by_dicts == by_table
+
+def test_empty_table(tmp_path):
+    assert _srt_both(tmp_path, []) == (b"", b"")
+
+def test_rows_match_events():
+    events = segment_smart_stream(random_words(3))
+    table = columnar.run_post_processing(columnar.EventTable.from_events(copy.deepcopy(events)))
+    assert table.rows() == [{"start": ev["start"], "end": ev["end"], "text": ev["text"].strip()} for ev in table.to_events()]
@@ -0,0 +1,180 @@
+"""
+Chunked Gemini correction against a fake genai.Client that answers the
+CORRECT lines of each payload with canned 'ID|TEXT' lines.
+"""
+import io
+import time
+import wave
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+pytest.importorskip("google.genai")
+
+from src import gemini
+
+SAMPLE_RATE = 16000
+
+def make_events(n, spacing_s=2.0):
+    return [{"start": k * spacing_s, "end": k * spacing_s + 1.5, "text": f"line {k + 1}",
+             "words": [{"word": "line", "start": k * spacing_s, "end": k * spacing_s + 1.5, "probability": 0.9}]}
+            for k in range(n)]
+
+def parse_payload(payload):
+    """(correct_ids, context_ids) of a payload."""
+    correct, context, section = [], [], None
+    for line in payload.splitlines():
+        if line in ("CORRECT:", "CONTEXT:"):
+            section = line
+        elif "|" in line:
+            (correct if section == "CORRECT:" else context).append(int(line.split("|", 1)[0]))
+    return correct, context
+
+class FakeClient:
+    """
+    Answers every request with "ID|LINE ID" for its CORRECT lines. reply(ids,
+    attempt) may return other text instead; delay(ids) sleeps before answering.
+    """
+
+    def __init__(self, reply=None, delay=None):
+        self.reply = reply
+        self.delay = delay
+        self.requests = []
+        self.uploads = {}
+        self.attempts = {}
+        self.lock = threading.Lock()
+        self.files = SimpleNamespace(upload=self._upload, get=self._get, delete=lambda name: None)
+        self.models = SimpleNamespace(generate_content=self._generate)
+
+    def _upload(self, file, config):
+        with wave.open(io.BytesIO(file.read())) as w:
+            seconds = w.getnframes() / w.getframerate()
+        with self.lock:
+            name = f"files/{len(self.uploads)}"
+            self.uploads[name] = seconds
+        return SimpleNamespace(name=name, expiration_time=None)
+
+    def _get(self, name):
+        raise KeyError(name)
+
+    def _generate(self, model, config, contents):
+        prompt, file_ref, payload = contents
+        correct, context = parse_payload(payload)
+        key = tuple(correct)
+        with self.lock:
+            attempt = self.attempts.get(key, 0)
+            self.attempts[key] = attempt + 1
+            self.requests.append({"correct": correct, "context": context, "audio_s": self.uploads[file_ref.name]})
+        if self.delay:
+            time.sleep(self.delay(correct))
+        text = self.reply(correct, attempt) if self.reply else None
+        if text is None:
+            text = "\n".join(f"{i}|LINE {i}" for i in correct)
+        return SimpleNamespace(text=text)
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(gemini, "BACKOFF_S", 0.0)
+
+def correct(events, client, chunk_lines=10, workers=4):
+    audio = np.zeros(int((events[-1]["end"] + 5) * SAMPLE_RATE), dtype=np.float32)
+    return gemini.correct_text_only_with_gemini(audio, events, chunk_lines=chunk_lines, workers=workers,
+                                                client=client, codec="wav")
+
+def texts(events):
+    return [ev["text"].replace("\n", " ") for ev in events]
+
+def test_chunk_windows():
+    events = make_events(25)
+    client = FakeClient()
+    correct(events, client)
+
+    windows = sorted(r["correct"] for r in client.requests)
+    assert windows == [list(range(1, 11)), list(range(11, 21)), list(range(21, 26))]
+    for r in client.requests:
+        first, last = r["correct"][0], r["correct"][-1]
+        # Up to CONTEXT_LINES read-only lines either side, clipped to the list.
+        assert r["context"] == (list(range(max(1, first - gemini.CONTEXT_LINES), first))
+                                + list(range(last + 1, min(25, last + gemini.CONTEXT_LINES) + 1)))
+        # Audio: the shown lines plus SLICE_PAD_S either side.
+        shown = sorted(r["correct"] + r["context"])
+        t0 = max(0.0, events[shown[0] - 1]["start"] - gemini.SLICE_PAD_S)
+        t1 = events[shown[-1] - 1]["end"] + gemini.SLICE_PAD_S
+        assert r["audio_s"] == pytest.approx(t1 - t0, abs=1.0 / SAMPLE_RATE)
+
+def test_concurrent_windows_reassemble_in_order():
+    events = make_events(40)
+    # Earlier windows answer last.
+    client = FakeClient(delay=lambda ids: 0.05 * (40 - ids[0]) / 10)
+    out = correct(events, client, chunk_lines=5, workers=8)
+    assert texts(out) == [f"LINE {k}" for k in range(1, 41)]
+    assert len(client.requests) == 8
+
+def test_malformed_response_is_retried_then_falls_back():
+    events = make_events(30)
+
+    def reply(ids, attempt):
+        if ids[0] == 1 and attempt == 0:
+            return "Sorry, I can't help with that."
+        if ids[0] == 21:
+            # Only an ID from outside the window: nothing usable.
+            return "Here you go:\n1|LINE 1"
+        return None
+
+    client = FakeClient(reply=reply)
+    out = texts(correct(events, client))
+
+    # Window 1-10 recovered on its second attempt.
+    assert client.attempts[tuple(range(1, 11))] == 2
+    assert out[:20] == [f"LINE {k}" for k in range(1, 21)]
+    # Window 21-30 never answered usefully: every attempt made, ASR text kept.
+    assert client.attempts[tuple(range(21, 31))] == gemini.RETRIES + 1
+    assert out[20:] == [f"line {k}" for k in range(21, 31)]
+
+class RecordingMemo:
+    def __init__(self, glossary=None):
+        self.pairs = []
+        self._glossary = glossary or {}
+
+    def lookup(self, series, texts):
+        return {}
+
+    def glossary(self, series):
+        return self._glossary
+
+    def apply_glossary(self, text, glossary):
+        for wrong, right in glossary.items():
+            text = text.replace(wrong, right)
+        return text
+
+    def record(self, series, pairs):
+        self.pairs += pairs
+
+def test_memo_records_only_changed_lines():
+    events = make_events(6)
+    events[4]["text"] = "line\n5"
+    events[5]["text"] = "line 6 kiyoma"
+    memo = RecordingMemo(glossary={"kiyoma": "Kyouma"})
+
+    def reply(ids, attempt):
+        # Lines 1-3 and 5 come back as sent (5 without its line break).
+        return "\n".join(f"{i}|{'LINE' if i == 4 else 'line'} {i}" + (" Kyouma" if i == 6 else "") for i in ids)
+
+    audio = np.zeros(20 * SAMPLE_RATE, dtype=np.float32)
+    gemini.correct_text_only_with_gemini(audio, events, chunk_lines=10, client=FakeClient(reply=reply),
+                                         codec="wav", memo=memo, series="show")
+    # The glossary fix Gemini kept is still a correction of the ASR text.
+    assert memo.pairs == [("line 4", "LINE 4"), ("line 6 kiyoma", "line 6 Kyouma")]
+
+def test_sparse_targets_split_on_gaps():
+    events = make_events(60)
+    for k in (2, 3, 50):
+        events[k]["words"][0]["probability"] = 0.2
+    client = FakeClient()
+    audio = np.zeros(130 * SAMPLE_RATE, dtype=np.float32)
+    gemini.correct_text_only_with_gemini(audio, events, chunk_lines=10, client=client, codec="wav", min_confidence=0.5)
+    # Lines 3-4 and 51 are 90s apart: two windows, neither slice spanning the gap.
+    assert sorted(r["correct"] for r in client.requests) == [[3, 4], [51]]
+    assert max(r["audio_s"] for r in client.requests) < 20.0
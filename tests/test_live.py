@@ -0,0 +1,53 @@
+from src.live import LatencyTracker, iter_live_words, write_live_events
+from tests.fakes import SAMPLE_RATE, FakeWhisper, speech_plan, tone_bursts
+
+class RecordingWhisper(FakeWhisper):
+    def __init__(self):
+        super().__init__()
+        self.lengths = []
+
+    def transcribe(self, audio, **options):
+        self.lengths.append(len(audio) / SAMPLE_RATE)
+        return super().transcribe(audio, **options)
+
+def _chunks(audio, chunk_s=0.5):
+    n = int(chunk_s * SAMPLE_RATE)
+    return (audio[k:k + n] for k in range(0, len(audio), n))
+
+def _run(audio, model, **kwargs):
+    items = list(iter_live_words(_chunks(audio), model, LatencyTracker(), options={}, **kwargs))
+    return [w for w in items if isinstance(w, dict)], [w for w in items if isinstance(w, float)]
+
+def test_words_match_the_stream_once_in_order():
+    plan = speech_plan(n_words=40)
+    words, marks = _run(tone_bursts(plan), FakeWhisper(), step_s=1.0, hold_s=1.0)
+    assert [w["word"] for w in words] == [f"f{freq}" for _, _, freq in plan]
+    for w, (start, dur, _) in zip(words, plan):
+        assert abs(w["start"] - start) < 0.01 and abs(w["end"] - (start + dur)) < 0.01
+    assert marks == sorted(marks)
+
+def test_buffer_is_bounded_without_pauses():
+    # One endless "word": no cut can fall in a pause.
+    audio = tone_bursts([(0.0, 120.0, 400)])
+    model = RecordingWhisper()
+    _, marks = _run(audio, model, step_s=1.0, hold_s=1.0, max_buffer_s=10.0)
+    assert max(model.lengths) <= 10.0 + 1.0 + 0.5
+    assert marks[-1] > 100.0
+
+class _Null:
+    def write(self, s):
+        pass
+
+    def flush(self):
+        pass
+
+def test_latency_is_measured_at_the_last_word(monkeypatch):
+    tracker = LatencyTracker()
+    tracker.stream_ends = [float(t) for t in range(1, 11)]
+    tracker.arrivals = [float(t) for t in range(1, 11)]
+    monkeypatch.setattr("src.live.time.monotonic", lambda: 20.0)
+    words = [{"word": "hi", "start": 1.0, "end": 2.5}]
+    events = [{"start": 1.0, "end": 6.0, "text": "hi", "words": words}]
+    write_live_events(events, _Null(), "srt", tracker)
+    # The audio up to 2.5s arrived at 3, not at 6 where the lingered event ends.
+    assert tracker.latencies == [17.0]
@@ -0,0 +1,65 @@
+from src.pipeline import MIN_GAP_S, _merge_reused
+
+def ev(start, end, text):
+    return {"start": start, "end": end, "text": text}
+
+def test_lines_end_a_gap_before_the_next():
+    out = _merge_reused([ev(0.0, 2.5, "fresh one"), ev(10.0, 12.0, "fresh two")], [ev(2.2, 4.0, "reused")])
+    assert [e["text"] for e in out] == ["fresh one", "reused", "fresh two"]
+    assert out[0]["end"] == 2.2 - MIN_GAP_S
+    for a, b in zip(out, out[1:]):
+        assert b["start"] - a["end"] >= MIN_GAP_S - 1e-9
+
+def test_repeated_sliver_is_dropped():
+    # The seam line was transcribed fresh and also comes back reused.
+    out = _merge_reused([ev(5.0, 6.8, "Where are you going?")], [ev(5.2, 6.9, "where are you going")])
+    assert [e["text"] for e in out] == ["where are you going"]
+    assert out[0]["start"] == 5.0
+
+def test_other_sliver_is_merged_into_the_next_line():
+    out = _merge_reused([ev(5.0, 6.0, "Wait,")], [ev(5.3, 7.0, "where are you going?")])
+    assert len(out) == 1
+    assert out[0]["text"].replace("\n", " ") == "Wait, where are you going?"
+    assert (out[0]["start"], out[0]["end"]) == (5.0, 7.0)
+
+def test_reused_events_are_not_modified():
+    reused = [ev(1.0, 3.0, "reused")]
+    _merge_reused([ev(0.0, 1.5, "fresh")], reused)
+    assert reused == [ev(1.0, 3.0, "reused")]
+
+def test_resumed_job_is_still_indexed(monkeypatch, tmp_path):
+    import argparse
+    import sqlite3
+
+    from src import pipeline
+    from src.cache import StageCache
+    from src.fingerprint import FP_RATE
+    from tests.fakes import speech_plan, tone_bursts
+
+    audio = tone_bursts(speech_plan(n_words=40), sample_rate=FP_RATE)
+    decodes = []
+
+    def extract(path, stream, sample_rate=48000, channels=2, start_s=None, duration_s=None):
+        decodes.append((sample_rate, channels))
+        return audio[:, None]
+
+    monkeypatch.setattr("src.audio.extract_audio_array", extract)
+    media = tmp_path / "show - 01.mkv"
+    media.write_bytes(b"media")
+    args = argparse.Namespace(fingerprint=True, cache_dir=str(tmp_path), no_gemini=True)
+    cache = StageCache(str(tmp_path / "stages"))
+
+    for run in range(2):
+        job = pipeline.new_job(str(media), str(tmp_path / f"out{run}.srt"), str(tmp_path), cache=cache)
+        job["stream_idx"] = 1
+        job["cache_keys"] = pipeline._cache_keys(job, args)
+        # Resumed from the cache: the words are known, nothing was extracted.
+        job["words"] = [{"word": "hi", "start": 1.0, "end": 1.5}]
+        job = pipeline.stage_separate(job, args)
+        assert "reuse" not in job
+        job["events"] = [{"start": 1.0, "end": 1.5, "text": "hi", "words": job["words"]}]
+        pipeline.stage_finish(job, args)
+    # The fingerprint was decoded once, at its own rate, and cached for the second run.
+    assert decodes == [(FP_RATE, 1)]
+    with sqlite3.connect(str(tmp_path / "fingerprints.sqlite")) as db:
+        assert db.execute("SELECT output FROM episodes").fetchall() == [(str(tmp_path / "out1.srt"),)]
@@ -0,0 +1,200 @@
+"""
+The incremental-length segmenter and line balancer against verbatim copies of
+the implementations they replaced (which re-joined the text for every word).
+"""
+import copy
+import random
+
+import pytest
+
+from src.asr import segment_smart_stream
+from src.postprocess import apply_extension_then_merge, get_balanced_split_index
+
+# --- Baseline (before lengths were tracked incrementally) --------------------
+
+HARD_PUNCT = (".", "!", "?", "…", ":", ";")
+SOFT_PUNCT = (",",)
+
+def _wtext(w):
+    return (w.get("word") or "").strip()
+
+def baseline_split_point(words):
+    if len(words) < 2: return 1
+    full_text = " ".join(_wtext(w) for w in words)
+    target_len = len(full_text) / 2
+    best_idx = -1
+    best_score = -float('inf')
+    current_len = 0
+    for i in range(len(words) - 1):
+        w = words[i]
+        nxt = words[i+1]
+        score = 0.0
+        current_len += len(_wtext(w)) + 1
+        dist = abs(current_len - target_len)
+        score -= dist * 1.5
+        gap = (nxt["start"] - w["end"])
+        if gap > 0: score += gap * 200.0
+        txt = _wtext(w)
+        if txt.endswith(HARD_PUNCT): score += 50.0
+        elif txt.endswith(SOFT_PUNCT): score += 25.0
+        if score > best_score:
+            best_score, best_idx = score, i + 1
+    return best_idx if best_idx != -1 else len(words) // 2
+
+def baseline_segment(items, pause_ms=400, max_chars=84, max_dur_s=7.0):
+    buf = []
+    buf_start = 0.0
+    def create_event(word_list):
+        if not word_list: return None
+        return {"start": float(word_list[0]["start"]), "end": float(word_list[-1]["end"]), "words": word_list, "text": ""}
+    def step(w, gap):
+        nonlocal buf, buf_start
+        if not buf: buf_start = w["start"]
+        buf.append(w)
+        if gap >= pause_ms:
+            ev = create_event(buf)
+            buf = []
+            return [ev]
+        current_text = " ".join(_wtext(x) for x in buf)
+        current_dur = w["end"] - buf_start
+        if len(current_text) > max_chars or current_dur > max_dur_s:
+            split_idx = baseline_split_point(buf)
+            ev = create_event(buf[:split_idx])
+            buf = buf[split_idx:]
+            if buf: buf_start = buf[0]["start"]
+            return [ev] if ev else []
+        return []
+
+    out = []
+    pending = None
+    for item in items:
+        if pending is not None:
+            out += step(pending, (item["start"] - pending["end"]) * 1000.0)
+        pending = item
+    if pending is not None:
+        out += step(pending, 0.0)
+    if buf: out.append(create_event(buf))
+    return out
+
+def baseline_balanced_split(words, max_chars):
+    if len(words) < 2: return len(words)
+    best_cut = -1
+    best_score = -float('inf')
+    for i in range(len(words) - 1):
+        l1 = " ".join(words[:i+1])
+        l2 = " ".join(words[i+1:])
+        len1, len2 = len(l1), len(l2)
+        score = 0
+        if len1 > max_chars: score -= 5000
+        if len2 > max_chars: score -= 5000
+        score -= abs(len1 - len2) * 5.0
+        if words[i].endswith(HARD_PUNCT): score += 5
+        elif words[i].endswith(SOFT_PUNCT): score += 3
+        if len2 >= len1: score += 1
+        if score > best_score:
+            best_score, best_cut = score, i + 1
+    return len(words) // 2 if best_cut == -1 else best_cut
+
+def baseline_merge(events, target_cps=22.0, max_silence_s=1.0, max_chars_total=84, min_gap=0.084):
+    if not events: return []
+    i = 0
+    while i < len(events):
+        ev = events[i]
+        txt_len = len(" ".join(_wtext(w) for w in ev["words"]))
+        dur = ev["end"] - ev["start"]
+        cps = txt_len / max(0.1, dur)
+        if cps <= target_cps and dur >= 1.0:
+            i += 1; continue
+        next_ev = events[i+1] if i < len(events)-1 else None
+        gap_next = (next_ev["start"] - ev["end"]) if next_ev else 999.0
+        needed = txt_len / target_cps
+        missing = max(0, needed - dur)
+        if dur + missing < 1.0: missing = 1.0 - dur
+        extended = False
+        if missing > 0:
+            rn = max(0, gap_next - min_gap)
+            if rn > 0:
+                take_next = min(missing, rn)
+                ev["end"] += take_next
+                if take_next >= missing or take_next > 0.3: extended = True
+        if extended: i += 1; continue
+        merged = False
+        prev_ev = events[i-1] if i > 0 else None
+        gap_prev = (ev["start"] - prev_ev["end"]) if prev_ev else 999.0
+        gap_next = (next_ev["start"] - ev["end"]) if next_ev else 999.0
+        min_g = min(gap_prev, gap_next)
+        if min_g <= max_silence_s:
+            side = 'prev' if gap_prev <= gap_next else 'next'
+            if side == 'prev':
+                new_w = prev_ev["words"] + ev["words"]
+                if len(" ".join(_wtext(w) for w in new_w)) <= max_chars_total:
+                    prev_ev["words"] = new_w; prev_ev["end"] = ev["end"]
+                    events.pop(i); i -= 1; merged = True
+            elif side == 'next':
+                new_w = ev["words"] + next_ev["words"]
+                if len(" ".join(_wtext(w) for w in new_w)) <= max_chars_total:
+                    ev["words"] = new_w; ev["end"] = next_ev["end"]
+                    events.pop(i+1); merged = True
+        if not merged: i += 1
+    return events
+
+# --- Word streams --------------------------------------------------------------
+
+VOCAB = ["", " ", "a", "I", "the", "okay,", "well", "no!", "really?", "because", "wait...", "extraordinary", "fine.", "so:"]
+
+def random_words(seed, n=None):
+    rng = random.Random(seed)
+    words, t = [], 0.0
+    for _ in range(n if n is not None else rng.randint(0, 300)):
+        # Zero and negative gaps happen with real word timestamps.
+        t += rng.choice([0.0, -0.05, 0.02, 0.1, 0.3, 0.5, 1.2])
+        dur = rng.choice([0.0, 0.1, 0.3, 0.6])
+        words.append({"word": rng.choice(VOCAB), "start": round(t, 3), "end": round(t + dur, 3)})
+        t += dur
+    return words
+
+def _same_segmentation(words, **params):
+    assert segment_smart_stream(copy.deepcopy(words), **params) == baseline_segment(copy.deepcopy(words), **params)
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_streams(seed):
+    words = random_words(seed)
+    rng = random.Random(seed)
+    params = {"pause_ms": rng.choice([0, 200, 400, 800]), "max_chars": rng.choice([10, 42, 84]),
+              "max_dur_s": rng.choice([1.0, 3.5, 7.0])}
+    _same_segmentation(words, **params)
+
+    events = baseline_segment(copy.deepcopy(words), **params)
+    assert apply_extension_then_merge(copy.deepcopy(events)) == baseline_merge(copy.deepcopy(events))
+    for ev in events:
+        toks = [_wtext(w) for w in ev["words"]]
+        assert get_balanced_split_index(toks, 42) == baseline_balanced_split(toks, 42)
+
+def test_empty_input():
+    _same_segmentation([])
+    assert segment_smart_stream([]) == []
+    assert apply_extension_then_merge([]) == baseline_merge([]) == []
+    assert get_balanced_split_index([], 42) == baseline_balanced_split([], 42)
+
+def test_single_word():
+    for word in ["hello", "", "x" * 100]:
+        words = [{"word": word, "start": 1.0, "end": 1.4}]
+        _same_segmentation(words)
+        assert len(segment_smart_stream(words)) == 1
+
+def test_words_longer_than_max_chars():
+    rng = random.Random(7)
+    words = [{"word": "y" * rng.randint(85, 120) if k % 3 == 0 else "short", "start": k * 0.3, "end": k * 0.3 + 0.25}
+             for k in range(40)]
+    _same_segmentation(words)
+    _same_segmentation(words, max_chars=10)
+    toks = [w["word"] for w in words[:6]]
+    assert get_balanced_split_index(toks, 42) == baseline_balanced_split(toks, 42)
+
+def test_equal_timestamps():
+    words = [{"word": w, "start": 2.0, "end": 2.0} for w in ["one", "two,", "three.", "four", "five"] * 12]
+    words += [{"word": "after", "start": 2.0 + 0.1 * k, "end": 2.0 + 0.1 * k} for k in range(20)]
+    _same_segmentation(words)
+    _same_segmentation(words, max_chars=20, max_dur_s=0.5)
+    events = baseline_segment(copy.deepcopy(words), max_chars=20)
+    assert apply_extension_then_merge(copy.deepcopy(events)) == baseline_merge(copy.deepcopy(events))
@@ -0,0 +1,68 @@
+"""
+Chunked separation with a fake demix: a moving average that starts from
+silence in every window, so each window has an edge transient like a real
+model's missing context. The crossfaded stitch must match a whole-track run.
+"""
+import numpy as np
+import pytest
+import soundfile as sf
+
+from benchmarks.run import seam_error_db, write_synthetic_media
+from benchmarks.stubs import StubSeparator
+from src import separator
+from src.separator import _SeamStitcher, chunk_windows, separate_vocals, separate_vocals_chunked
+
+TAPS = 64
+SEAM_ERROR_DB = -60.0
+
+def fake_demix(audio):
+    c = np.cumsum(np.concatenate([np.zeros((TAPS, audio.shape[1]), np.float32), audio]), axis=0)
+    return ((c[TAPS:] - c[:-TAPS]) / TAPS).astype(np.float32)
+
+def _seams(windows):
+    return [(start, prev_end) for (_, prev_end), (start, _) in zip(windows, windows[1:])]
+
+@pytest.mark.parametrize("overlap", [1, 7, 256, 4000])
+def test_crossfade_weights_sum_to_one(overlap):
+    out = []
+    stitcher = _SeamStitcher(out.append)
+    windows = chunk_windows(20000, 5000, overlap)
+    for k, (start, end) in enumerate(windows):
+        keep = end - windows[k + 1][0] if k + 1 < len(windows) else 0
+        stitcher.push(np.ones((end - start, 2), np.float32), keep)
+    stitcher.close()
+    out = np.concatenate(out)
+    # Ones in, ones out: the fade-out and fade-in weights add up to one everywhere.
+    assert len(out) == 20000
+    np.testing.assert_allclose(out, 1.0, atol=1e-6)
+
+@pytest.fixture
+def media(tmp_path):
+    path = str(tmp_path / "mix.wav")
+    write_synthetic_media(path, 30, sample_rate=16000)
+    return path
+
+def test_file_seams_match_whole_track(media, tmp_path):
+    ref_dir, work_dir = tmp_path / "ref", tmp_path / "work"
+    ref_dir.mkdir()
+    work_dir.mkdir()
+    reference, sr = sf.read(separate_vocals(media, str(ref_dir), separator=StubSeparator(str(ref_dir), taps=TAPS)),
+                            dtype="float32", always_2d=True)
+    stitched, _ = sf.read(separate_vocals_chunked(media, str(work_dir), separator=StubSeparator(str(work_dir), taps=TAPS),
+                                                  chunk_s=6.0, overlap_s=0.5), dtype="float32", always_2d=True)
+    assert stitched.shape == reference.shape
+    windows = chunk_windows(len(reference), 6 * sr, sr // 2)
+    assert seam_error_db(reference, stitched, _seams(windows), 2 * TAPS) < SEAM_ERROR_DB
+
+def test_array_seams_match_whole_track(media, monkeypatch):
+    monkeypatch.setattr(separator, "separate_vocals_array", lambda audio, sep: fake_demix(audio))
+    audio, sr = sf.read(media, dtype="float32", always_2d=True)
+    monkeypatch.setattr(separator, "SAMPLE_RATE", sr)
+    reference = fake_demix(audio)
+    stitched = separator.separate_vocals_array_chunked(audio, None, chunk_s=6.0, overlap_s=0.5)
+    windows = chunk_windows(len(audio), 6 * sr, sr // 2)
+    assert len(windows) > 4
+    assert seam_error_db(reference, stitched, _seams(windows), 2 * TAPS) < SEAM_ERROR_DB
+    # Without a crossfade the edge transients show up at every seam.
+    hard = separator.separate_vocals_array_chunked(audio, None, chunk_s=6.0, overlap_s=0.0)
+    assert seam_error_db(reference, hard, _seams(chunk_windows(len(audio), 6 * sr, 0)), 2 * TAPS) > 0.0
@@ -0,0 +1,104 @@
+"""
+The daemon's bookkeeping with the models, probing and the pipeline stubbed out.
+"""
+import json
+import time
+import argparse
+import threading
+import urllib.error
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from src import server
+
+@pytest.fixture
+def make_server(monkeypatch, tmp_path):
+    monkeypatch.setattr("src.separator.load_separator", lambda *a, **k: object())
+    monkeypatch.setattr("src.pipeline.load_asr_backend", lambda args: object())
+    monkeypatch.setattr("src.pipeline.close_asr_backend", lambda backend: None)
+    monkeypatch.setattr("src.audio.probe_file", lambda path: {"format": {"duration": "10"}})
+    monkeypatch.setattr("src.audio.select_audio_streams", lambda probe, spec: [0])
+    monkeypatch.setattr(server.JobServer, "_run", lambda self, record: None)
+    servers = []
+
+    def make(**kwargs):
+        args = argparse.Namespace(cache_dir=str(tmp_path / "cache"), no_cache=True, **kwargs.pop("args", {}))
+        s = server.JobServer(args, **kwargs)
+        servers.append(s)
+        return s
+
+    yield make
+    for s in servers:
+        s.shutdown()
+
+@pytest.fixture
+def media(tmp_path):
+    path = tmp_path / "ep.wav"
+    path.write_bytes(b"")
+    return str(path)
+
+def _wait_done(jobs, records):
+    deadline = time.time() + 5
+    while any(r["status"] not in server.FINAL_STATES for r in records):
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+def test_finished_jobs_are_evicted_by_count(make_server, media):
+    jobs = make_server(keep_finished=2)
+    records = [jobs.submit(media, media + f".{k}.srt") for k in range(5)]
+    _wait_done(jobs, records)
+    assert sorted(jobs.jobs) == [r["id"] for r in records[-2:]]
+    # Evicted jobs read as ended rather than failing a follower.
+    assert jobs.events(records[0]["id"], timeout=0) == ([], True)
+
+def test_finished_jobs_are_evicted_by_age(make_server, media):
+    jobs = make_server(finished_ttl_s=0.0)
+    records = [jobs.submit(media, media + ".srt")]
+    _wait_done(jobs, records)
+    time.sleep(0.01)
+    jobs.submit(media, media + ".2.srt")
+    assert records[0]["id"] not in jobs.jobs
+
+def test_options_must_fit_the_resident_backend(make_server, media, tmp_path):
+    ref = tmp_path / "ref.txt"
+    ref.write_text("hello\n")
+    pool = make_server(args={"asr_procs": 4})
+    with pytest.raises(ValueError, match="model ASR backend"):
+        pool.submit(media, media + ".srt", options={"align": str(ref)})
+    single = make_server(args={"asr_procs": 1})
+    single.submit(media, media + ".srt", options={"align": str(ref)})
+    with pytest.raises(FileNotFoundError):
+        single.submit(media, media + ".srt", options={"align": str(tmp_path / "missing.txt")})
+
+def test_splice_needs_the_output_srt(make_server, media, tmp_path):
+    jobs = make_server()
+    target = tmp_path / "ep.srt"
+    with pytest.raises(FileNotFoundError, match="Nothing to splice into"):
+        jobs.submit(media, str(target), options={"splice": True, "start": 60.0})
+    target.write_text("1\n00:00:01,000 --> 00:00:02,000\nhello\n\n")
+    record = jobs.submit(media, str(target), options={"splice": True, "start": 60.0})
+    assert record["status"] in ("queued", "running", "done")
+    with pytest.raises(ValueError, match="start and/or end"):
+        jobs.submit(media, str(target), options={"splice": True})
+
+def test_loopback():
+    assert server.is_loopback("127.0.0.1") and server.is_loopback("::1") and server.is_loopback("localhost")
+    assert not server.is_loopback("0.0.0.0") and not server.is_loopback("example.com")
+
+def test_token_is_required(make_server):
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), server._Handler)
+    httpd.jobs = make_server()
+    httpd.token = "s3cret"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{httpd.server_address[1]}/health"
+    try:
+        for token in (None, "wrong"):
+            with pytest.raises(urllib.error.HTTPError) as e:
+                server._request(url, token=token)
+            assert e.value.code == 401
+        with server._request(url, token="s3cret") as resp:
+            assert json.load(resp)["status"] == "ok"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
@@ -0,0 +1,153 @@
+"""
+Shard mode end to end with --shard-workers: the workers run as threads and
+extract, separation and ASR are stubbed. Each shard's "ASR" returns the
+script words inside its window, shifted by a per-shard offset as two decodes
+of the same speech would be.
+"""
+import os
+import json
+import time
+import argparse
+import threading
+
+import pytest
+
+from src import shard
+
+def make_script(duration_s=60.0):
+    """0.5s words 0.1s apart, with a 1s pause after every eighth."""
+    words, t = [], 0.3
+    while t + 0.5 < duration_s:
+        words.append({"word": f"w{len(words)}", "start": round(t, 3), "end": round(t + 0.5, 3), "probability": 0.9})
+        t += 1.6 if len(words) % 8 == 0 else 0.6
+    return words
+
+SCRIPT = make_script()
+
+def decode(start, end, jitter):
+    end = float("inf") if end is None else end
+    return [dict(w, start=w["start"] + jitter, end=w["end"] + jitter) for w in SCRIPT
+            if w["start"] >= start and w["end"] <= end]
+
+def test_word_split_by_its_midpoints_is_kept_once():
+    # Decoded at 99.6-100.1 by one shard and 99.8-100.3 by the other: the two
+    # midpoints fall either side of a boundary at 100.
+    shards = [{"start": 0.0, "end": 105.0, "keep": [0.0, 100.0]}, {"start": 95.0, "end": None, "keep": [100.0, None]}]
+    before = [{"word": "a", "start": 98.0, "end": 98.9}, {"word": "b", "start": 99.6, "end": 100.1}]
+    after = [{"word": "a", "start": 98.1, "end": 99.0}, {"word": "b", "start": 99.8, "end": 100.3},
+             {"word": "c", "start": 101.5, "end": 102.0}]
+    words = shard.merge_words(shards, [before, after])
+    assert [w["word"] for w in words] == ["a", "b", "c"]
+    # Cut in the pause nearest the planned boundary, between "a" and "b".
+    assert words[0] is before[0] and words[1] is after[1]
+
+def test_continuous_speech_cuts_at_a_word_end():
+    before = [{"word": f"w{k}", "start": k * 0.5, "end": k * 0.5 + 0.5} for k in range(20)]
+    after = [dict(w, start=w["start"] + 0.1, end=w["end"] + 0.1) for w in before]
+    shards = [{"start": 0.0, "end": 10.0, "keep": [0.0, 5.2]}, {"start": 0.0, "end": None, "keep": [5.2, None]}]
+    words = shard.merge_words(shards, [before, after])
+    assert [w["word"] for w in words] == [f"w{k}" for k in range(20)]
+
+class ThreadWorker:
+    """Stands in for a local worker process: run_shard_worker on a thread."""
+    stop = threading.Event()
+
+    def __init__(self, cmd, args):
+        queue_dir = cmd[cmd.index("--shard-worker") + 1]
+        self.thread = threading.Thread(target=shard.run_shard_worker, args=(queue_dir, args), daemon=True)
+        self.thread.start()
+
+    def poll(self):
+        return None if self.thread.is_alive() else 0
+
+    def terminate(self):
+        ThreadWorker.stop.set()
+
+    def wait(self, timeout=None):
+        self.thread.join(timeout)
+
+    def kill(self):
+        pass
+
+@pytest.fixture
+def sharded(monkeypatch, tmp_path):
+    """Stubs the media stages; returns the args and the window start of every ASR call."""
+    calls = []
+    ThreadWorker.stop.clear()
+    monkeypatch.setattr(shard, "POLL_S", 0.01)
+    monkeypatch.setattr("src.audio.probe_file", lambda path: {"format": {"duration": "60"}, "streams": []})
+    monkeypatch.setattr("src.audio.select_audio_streams", lambda probe, spec: [1])
+    monkeypatch.setattr(shard, "quiet_point", lambda path, stream, nominal, search: nominal)
+
+    def extract(path, stream, out, duration_s=None, start_s=0.0):
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"start": start_s, "end": None if duration_s is None else start_s + duration_s}, f)
+
+    def separate(job, args, separator=None):
+        job["final"] = job["extracted"]
+        return job
+
+    def transcribe(job, args, model=None):
+        with open(job["final"], "r", encoding="utf-8") as f:
+            window = json.load(f)
+        calls.append(window["start"])
+        if calls.count(window["start"]) == 1 and window["start"] > 0:
+            raise RuntimeError("worker ran out of memory")
+        # Another decode, other timestamps: shift each shard's words a little.
+        words = decode(window["start"], window["end"], jitter=0.04 if window["start"] % 2 else -0.04)
+        job["words"] = [dict(w, start=w["start"] - window["start"], end=w["end"] - window["start"]) for w in words]
+        return job
+
+    monkeypatch.setattr("src.audio.extract_audio", extract)
+    monkeypatch.setattr("src.pipeline.stage_separate", separate)
+    monkeypatch.setattr("src.pipeline.stage_transcribe", transcribe)
+    real_claim = shard._claim
+
+    def claim(queue_dir):
+        if ThreadWorker.stop.is_set():
+            raise KeyboardInterrupt
+        return real_claim(queue_dir)
+
+    monkeypatch.setattr(shard, "_claim", claim)
+    args = argparse.Namespace(shard_s=20.0, shard_overlap_s=5.0, shard_workers=2, no_gemini=True, no_warmup=True,
+                              shard_queue=str(tmp_path / "queue"))
+    monkeypatch.setattr(shard.subprocess, "Popen", lambda cmd: ThreadWorker(cmd, args))
+    return args, calls
+
+def test_shard_workers_merge_every_word_once(sharded, tmp_path):
+    from src.asr import load_words
+
+    args, calls = sharded
+    # Workers inherit --save-words like local worker processes do; only the coordinator saves.
+    args.save_words = True
+    job = shard.run_sharded(str(tmp_path / "ep.mkv"), str(tmp_path / "ep.srt"), str(tmp_path), args)
+    assert [w["word"] for w in job["words"]] == [w["word"] for w in SCRIPT]
+    assert [w["word"] for w in load_words(str(tmp_path / "ep.words.npz"))] == [w["word"] for w in SCRIPT]
+    assert os.path.getsize(tmp_path / "ep.srt") > 0
+    # Shards 2 and 3 failed once each and were retried.
+    assert sorted(calls) == [0.0, 15.0, 15.0, 35.0, 35.0]
+    for state in shard.QUEUE_DIRS:
+        assert os.listdir(tmp_path / "queue" / state) == []
+
+def test_failing_shard_gives_up_after_retries(sharded, tmp_path, monkeypatch):
+    args, calls = sharded
+    monkeypatch.setattr("src.pipeline.stage_transcribe", lambda job, args, model=None: 1 / 0)
+    with pytest.raises(RuntimeError, match="division by zero"):
+        shard.run_sharded(str(tmp_path / "ep.mkv"), str(tmp_path / "ep.srt"), str(tmp_path), args)
+    for state in shard.QUEUE_DIRS:
+        assert os.listdir(tmp_path / "queue" / state) == []
+
+def test_workers_reap_abandoned_jobs(tmp_path):
+    queue = shard.open_queue(str(tmp_path))
+    old = time.time() - shard.CLAIM_TIMEOUT_S - 1
+    for state, name in (("pending", "gone-000.json"), ("done", "gone-001.words.json"), ("done", "live-000.words.json")):
+        path = os.path.join(queue, state, name)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"id": name}, f)
+        if name.startswith("gone-000"):
+            os.utime(path, (old, old))
+        elif name.startswith("gone"):
+            os.utime(path, (time.time() - shard.ORPHAN_S - 1,) * 2)
+    assert shard._claim(queue) is None
+    assert os.listdir(os.path.join(queue, "pending")) == []
+    assert os.listdir(os.path.join(queue, "done")) == ["live-000.words.json"]
@@ -0,0 +1,19 @@
+import pytest
+
+from src.sweep import parse_grid
+
+def test_grid_values_and_ranges():
+    grid = parse_grid(["pause_ms=300,400", "target_cps=17:19:0.5", "linger-ms=300:900:300"])
+    assert grid["pause_ms"] == [300, 400] and all(type(v) is int for v in grid["pause_ms"])
+    assert grid["target_cps"] == [17.0, 17.5, 18.0, 18.5, 19.0]
+    assert grid["linger_ms"] == [300, 600, 900]
+    assert grid["max_chars"] == [84]
+
+@pytest.mark.parametrize("spec", ["pause_ms=300.5", "max_chars=40,42.5", "linger_ms=300:900:150.5"])
+def test_int_parameters_reject_fractions(spec):
+    with pytest.raises(ValueError, match="whole numbers"):
+        parse_grid([spec])
+
+def test_unknown_parameter():
+    with pytest.raises(ValueError, match="parameters:"):
+        parse_grid(["beam=5"])
@@ -0,0 +1,67 @@
+import time
+import argparse
+import threading
+
+import pytest
+
+from src import pipeline
+from src.warmup import ModelWarmup
+
+@pytest.fixture
+def backend(monkeypatch):
+    """load_asr_backend that waits for release.set(); closed models are recorded."""
+    state = {"release": threading.Event(), "loads": 0, "closed": []}
+
+    def load(args):
+        state["loads"] += 1
+        state["release"].wait(5)
+        return "model"
+
+    monkeypatch.setattr(pipeline, "load_asr_backend", load)
+    monkeypatch.setattr(pipeline, "close_asr_backend", state["closed"].append)
+    return state
+
+def test_close_does_not_wait_for_an_unused_load(backend):
+    warmup = ModelWarmup(argparse.Namespace(), ".", separator=False)
+    done = threading.Event()
+    threading.Thread(target=lambda: (warmup.close(), done.set()), daemon=True).start()
+    assert done.wait(1), "close() blocked on a load nobody used"
+    assert backend["closed"] == []
+    # The load finishes later and releases its own backend.
+    backend["release"].set()
+    deadline = time.time() + 5
+    while not backend["closed"] and time.time() < deadline:
+        time.sleep(0.01)
+    assert backend["closed"] == ["model"]
+
+def test_close_releases_a_used_model(backend):
+    backend["release"].set()
+    warmup = ModelWarmup(argparse.Namespace(), ".", separator=False)
+    assert warmup.model() == "model"
+    warmup.close()
+    assert backend["closed"] == ["model"]
+
+def test_unstarted_loads_start_on_demand(backend):
+    backend["release"].set()
+    warmup = ModelWarmup(argparse.Namespace(), ".", separator=False, start=False)
+    warmup.start(asr=False)
+    assert backend["loads"] == 0
+    assert warmup.model() == "model"
+    assert backend["loads"] == 1
+
+def test_cache_resume_starts_no_loads(backend, monkeypatch, tmp_path):
+    monkeypatch.setattr("src.audio.probe_file", lambda path: {"format": {"duration": "60"}, "streams": []})
+    monkeypatch.setattr("src.audio.select_audio_streams", lambda probe, spec: [1])
+
+    def resume(job, args):
+        job["words"] = [{"word": "hi", "start": 0.0, "end": 0.5}]
+        return True
+
+    monkeypatch.setattr(pipeline, "_resume_from_cache", resume)
+    args = argparse.Namespace(no_gemini=True)
+    job = pipeline.new_job(str(tmp_path / "ep.mkv"), str(tmp_path / "ep.srt"), str(tmp_path), cache=object())
+    warmup = ModelWarmup(args, str(tmp_path), start=False)
+    jobs = pipeline.stage_extract(job, args, warmup=warmup)
+    assert jobs[0]["words"]
+    assert warmup._separator is None and warmup._model is None
+    assert backend["loads"] == 0